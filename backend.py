@@ -0,0 +1,374 @@
+import queue
+import sqlite3
+import threading
+import time
+
+from query import *
+
+'''
+Storage backends the pipeline can run against. Each backend knows how to open a connection
+to its database engine and holds the statements that differ between SQL dialects, so the
+assets in entityresolution.py can run unchanged on SQL Server or on an embedded, in-process
+engine (SQLite or DuckDB) that needs no server and no network hop.
+'''
+
+'''
+Statements and expressions shared by all backends. Subclasses override the ones that differ
+for their SQL dialect and implement connect()
+'''
+class Backend:
+    name = None
+
+    check_table_query = check_table_query
+    check_view_query = check_view_query
+    rename_table_query = rename_table_query
+    create_table_as_query = select_into_query
+    update_statistics_query = update_statistics_query
+
+    begin_transaction = "BEGIN TRANSACTION"
+    commit_transaction = "COMMIT TRANSACTION"
+    rollback_transaction = "ROLLBACK TRANSACTION"
+
+    # column type names in the CREATE TABLE statements of query.py that must be replaced for this engine
+    type_substitutions = {}
+
+    # literal of the false value of a BIT (boolean) column
+    false_literal = "0"
+
+    # greatest number of processes that can use the database at the same time (None: no limit)
+    max_processes = None
+
+    # cheap statement run on an idle connection before it is handed out again, to detect dead connections
+    health_check_query = "SELECT 1"
+
+    '''
+    Open a new DB-API connection in autocommit mode
+    '''
+    def connect(self):
+        raise NotImplementedError
+
+    '''
+    Return the exception types of the engine that are worth retrying with a fresh connection
+    (lost connection, locked database, ...)
+    '''
+    def transient_errors(self):
+        return ()
+
+    '''
+    Return whether an error raised while using a connection is transient: one of transient_errors by default
+    '''
+    def is_transient(self, error):
+        return isinstance(error, self.transient_errors())
+
+    '''
+    Return the CREATE TABLE statement with the column types supported by this engine
+    '''
+    def ddl(self, create_string):
+        for type_name, replacement in self.type_substitutions.items():
+            create_string = create_string.replace(type_name, replacement)
+        return create_string
+
+'''
+Backend for a SQL Server database reached through ODBC (the original setup of the pipeline)
+'''
+class SqlServerBackend(Backend):
+    name = "sqlserver"
+
+    def __init__(self, server_name, database_name, driver_name = 'SQL SERVER'):
+        self.server_name = server_name
+        self.database_name = database_name
+        self.driver_name = driver_name
+
+    def connect(self):
+        # only import the ODBC module when SQL Server is actually used
+        import pypyodbc as odbc
+
+        # connection string used to connect to the SQL Server database using the server name defined in config.py
+        connection_string = f"""
+            DRIVER={{{self.driver_name}}};
+            SERVER={self.server_name};
+            DATABASE={self.database_name};
+            Trust_Connection=yes;
+        """
+
+        return odbc.connect(connection_string, autocommit = True)
+
+    def transient_errors(self):
+        import pypyodbc as odbc
+
+        return (odbc.OperationalError, odbc.InterfaceError)
+
+'''
+Backend for an embedded SQLite database file, run in-process through the sqlite3 standard library module
+'''
+class SqliteBackend(Backend):
+    name = "sqlite"
+
+    check_table_query = sqlite_check_table_query
+    check_view_query = sqlite_check_view_query
+    rename_table_query = alter_rename_table_query
+    create_table_as_query = create_table_as_query
+    update_statistics_query = analyze_query
+
+    begin_transaction = "BEGIN TRANSACTION"
+    commit_transaction = "COMMIT"
+    rollback_transaction = "ROLLBACK"
+
+    # seconds a connection waits for another connection to release its lock on the database before failing
+    busy_timeout = 30
+
+    def __init__(self, database_path):
+        self.database_path = database_path
+
+    def connect(self):
+        # isolation_level = None keeps the connection in autocommit mode like the SQL Server
+        # connection, so transactions are only opened by begin_transaction.
+        # check_same_thread = False lets a pooled connection be used by another thread than the one that
+        # opened it (the pool hands each connection to one user at a time)
+        connection = sqlite3.connect(self.database_path, isolation_level = None, timeout = self.busy_timeout,
+                                     check_same_thread = False)
+        # let a staging table be renamed while the views still reference the dropped original table
+        connection.execute("PRAGMA legacy_alter_table = ON")
+        return connection
+
+    def transient_errors(self):
+        # raised when the database is locked by another connection, but also for syntax errors, missing tables, ...
+        return (sqlite3.OperationalError,)
+
+    '''
+    Messages of the OperationalErrors raised while another connection holds a lock on the database. The other
+    OperationalErrors (syntax errors, "no such table", "no such column", ...) are bugs that a retry would not fix
+    '''
+    transient_messages = ("database is locked", "database is busy")
+
+    def is_transient(self, error):
+        return isinstance(error, self.transient_errors()) and any(message in str(error) for message in self.transient_messages)
+
+'''
+Backend for an embedded DuckDB database file, run in-process through the optional duckdb module
+'''
+class DuckDbBackend(Backend):
+    name = "duckdb"
+
+    check_table_query = duckdb_check_table_query
+    check_view_query = duckdb_check_view_query
+    rename_table_query = alter_rename_table_query
+    create_table_as_query = create_table_as_query
+    update_statistics_query = analyze_query
+
+    begin_transaction = "BEGIN TRANSACTION"
+    commit_transaction = "COMMIT"
+    rollback_transaction = "ROLLBACK"
+
+    # BIT is a bit string type in DuckDB
+    type_substitutions = {"BIT": "BOOLEAN"}
+    false_literal = "FALSE"
+
+    # a process opening the database file holds an exclusive lock on it until it closes its connections, so the
+    # connections of another process fail with an IOException ("Could not set lock on file")
+    max_processes = 1
+
+    def __init__(self, database_path):
+        self.database_path = database_path
+
+    def connect(self):
+        # only import duckdb when it is actually used since it is an optional dependency
+        import duckdb
+
+        return duckdb.connect(self.database_path)
+
+    def transient_errors(self):
+        import duckdb
+
+        # raised among others when the database file is locked by another process
+        return (duckdb.IOException, duckdb.ConnectionException)
+
+'''
+Create the backend named by backend_name ("sqlserver", "sqlite" or "duckdb")
+'''
+def get_backend(backend_name, server_name = None, database_name = None, database_path = None):
+    if backend_name == SqlServerBackend.name:
+        return SqlServerBackend(server_name, database_name)
+    elif backend_name == SqliteBackend.name:
+        return SqliteBackend(database_path)
+    elif backend_name == DuckDbBackend.name:
+        return DuckDbBackend(database_path)
+
+    raise ValueError("Unknown database backend: " + str(backend_name))
+
+'''
+Number of statements run and seconds spent waiting for the database by the connections of the pool
+(see InstrumentedCursor), kept per thread so that each asset can measure its own work
+'''
+class StatementStatistics:
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+statement_statistics_by_thread = threading.local()
+
+'''
+Return the StatementStatistics of the current thread
+'''
+def statement_statistics():
+    if not hasattr(statement_statistics_by_thread, "statistics"):
+        statement_statistics_by_thread.statistics = StatementStatistics()
+    return statement_statistics_by_thread.statistics
+
+'''
+Cursor that counts the statements it runs and the time spent executing and fetching them
+in the StatementStatistics of the current thread
+'''
+class InstrumentedCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def timed(self, method, *args, counted = False):
+        statistics = statement_statistics()
+        start_time = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            statistics.seconds += time.perf_counter() - start_time
+            if counted:
+                statistics.statements += 1
+
+    def execute(self, *args):
+        self.timed(self.cursor.execute, *args, counted = True)
+        return self
+
+    def executemany(self, *args):
+        self.timed(self.cursor.executemany, *args, counted = True)
+        return self
+
+    def fetchall(self):
+        return self.timed(self.cursor.fetchall)
+
+    def fetchone(self):
+        return self.timed(self.cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self.timed(self.cursor.fetchmany, *args)
+
+    # description, rowcount, close, ... of the wrapped cursor
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+'''
+Connection handed out by the pool, whose cursors are instrumented (see InstrumentedCursor)
+'''
+class InstrumentedConnection:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def cursor(self):
+        return InstrumentedCursor(self.connection.cursor())
+
+    # commit, rollback, close, ... of the wrapped connection
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+'''
+Thread-safe pool of connections to the database of a backend. Connections are only opened when they are
+first needed, and at most max_connections are open at the same time: a caller asking for a connection while
+they are all in use waits for one to be released. An idle connection is health checked before it is handed
+out again and replaced by a new one if it is dead
+'''
+class ConnectionPool:
+    def __init__(self, backend, max_connections = 4, max_retries = 3, retry_delay = 1.0):
+        self.backend = backend
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        # most recently released connection first, so that rarely used connections can be closed by the server
+        self.idle_connections = queue.LifoQueue()
+        self.free_slots = threading.BoundedSemaphore(max_connections)
+
+    '''
+    Return True if the connection still answers the health check query
+    '''
+    def is_healthy(self, connection):
+        try:
+            cursor = connection.cursor()
+            cursor.execute(self.backend.health_check_query)
+            cursor.fetchall()
+            return True
+        except Exception:
+            return False
+
+    '''
+    Close a connection, ignoring the errors of a connection that is already dead
+    '''
+    def discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    '''
+    Take a connection out of the pool: a healthy idle connection if there is one, otherwise a new connection
+    '''
+    def acquire(self):
+        self.free_slots.acquire()
+        try:
+            while True:
+                try:
+                    connection = self.idle_connections.get_nowait()
+                except queue.Empty:
+                    return self.backend.connect()
+                if self.is_healthy(connection):
+                    return connection
+                self.discard(connection)
+        except Exception:
+            self.free_slots.release()
+            raise
+
+    '''
+    Give a connection back to the pool, or close it if it is broken
+    '''
+    def release(self, connection, broken = False):
+        if broken:
+            self.discard(connection)
+        else:
+            self.idle_connections.put(connection)
+        self.free_slots.release()
+
+    '''
+    Call function(connection, *args, **kwargs) with a connection of the pool (see InstrumentedConnection)
+    and return its result.
+    If the call fails with a transient error of the engine (see Backend.is_transient), the connection is
+    closed and the call is retried with a fresh connection up to max_retries times, waiting retry_delay
+    seconds before the first retry and twice as long before each next one. The function must therefore be
+    safe to run again after a failure, e.g. by running its changes in a single transaction
+    '''
+    def run(self, function, *args, **kwargs):
+        attempt = 0
+        while True:
+            connection = None
+            try:
+                connection = self.acquire()
+                result = function(InstrumentedConnection(connection), *args, **kwargs)
+            except Exception as error:
+                if not self.backend.is_transient(error):
+                    if connection is not None:
+                        self.release(connection)
+                    raise
+                if connection is not None:
+                    self.release(connection, broken = True)
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self.retry_delay * 2 ** attempt)
+                attempt += 1
+                continue
+            self.release(connection)
+            return result
+
+    '''
+    Close all the idle connections of the pool
+    '''
+    def close(self):
+        while True:
+            try:
+                self.discard(self.idle_connections.get_nowait())
+            except queue.Empty:
+                return
@@ -0,0 +1,219 @@
+'''
+Generator of synthetic crm__contacts.csv, acme__contacts.csv and rapid_data__contacts.csv files with the columns
+of CRM_SCHEMA, ACME_SCHEMA and RAPID_DATA_SCHEMA, at any scale (10k to 10M contacts), to benchmark the pipeline.
+
+Each contact is a person working for a company. A contact appears in one source, or with probability
+--overlap-rate in a second source as well (and with the same probability again in the third one), with the same
+name, email address and company so that the sources can be matched, but with its phone number formatted differently.
+Within RapidData, a share --duplicate-rate of the rows is repeated with the same name and ip_address and a later
+updated_at. A share --missing-name-rate of the rows of every source has no name, and companies have
+--contacts-per-company contacts on average, all sharing the attributes of the company.
+
+The contacts are generated and written in chunks of --chunk-size contacts, so the memory used does not depend on
+the number of contacts.
+
+Usage: python benchmarks/generate_contacts.py --contacts 1000000 --output-dir /tmp/contacts
+'''
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pds
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from schema import *
+
+CRM = "crm"
+ACME = "acme"
+RAPID_DATA = "rapid_data"
+
+SOURCES = [CRM, ACME, RAPID_DATA]
+
+'''
+Schema of each source, the columns of its CSV file are written in the order of the schema
+'''
+SOURCE_SCHEMAS = {
+    CRM: CRM_SCHEMA,
+    ACME: ACME_SCHEMA,
+    RAPID_DATA: RAPID_DATA_SCHEMA,
+}
+
+FIRST_NAMES = ["Michael", "Douglas", "David", "Katherine", "Brittany", "Anthony", "Jennifer", "Robert", "Maria",
+               "James", "Linda", "William", "Elizabeth", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah",
+               "Christopher", "Karen", "Daniel", "Nancy", "Matthew", "Lisa", "Mark", "Betty", "Steven", "Sandra",
+               "Andrew", "Ashley", "Joshua", "Emily", "Kevin", "Donna", "Brian", "Michelle", "George", "Carol"]
+LAST_NAMES = ["Walker", "Kennedy", "Craig", "Martinez", "Butler", "Wallace", "Smith", "Johnson", "Williams", "Brown",
+              "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Wilson", "Anderson", "Taylor", "Thomas", "Moore",
+              "Jackson", "Martin", "Lee", "Thompson", "White", "Harris", "Clark", "Lewis", "Robinson", "Young",
+              "Allen", "King", "Wright", "Scott", "Torres", "Nguyen", "Hill", "Flores", "Green", "Adams"]
+TITLES = ["IC", "Team Lead", "Manager", "Director", "VP", "C-Level"]
+COLORS = ["gray", "olive", "red", "blue", "green", "purple", "teal", "navy", "maroon", "silver"]
+COUNTRIES = ["Chile", "Spain", "United States", "Canada", "Germany", "France", "Japan", "Brazil", "India", "Kenya"]
+INDUSTRIES = ["Education", "Healthcare", "Finance", "Retail", "Technology", "Manufacturing", "Energy", "Media"]
+TOP_LEVEL_DOMAINS = [".com", ".org", ".io", ".biz", ".net", ".info"]
+INTENT_SIGNALS = ["Whitepaper", "Product Page", "Product Documentation", "Pricing Page", "Webinar", "Case Study"]
+
+'''
+Formats of the phone numbers, the same number is written in a different format in each source
+'''
+PHONE_FORMATS = ["dashes", "country_code", "parentheses", "international_extension"]
+
+START_DATE = np.datetime64("2023-01-01")
+
+'''
+Pick values out of choices at the given positions, as a Series of strings
+'''
+def pick(choices, positions):
+    return pds.Series(np.asarray(choices, dtype=object)[positions])
+
+'''
+Format the 10 digit phone numbers (integers) in the given formats (positions in PHONE_FORMATS), e.g. 5213386604 as
+"521-338-6604", "+1-521-338-6604", "(521)338-6604" or "001-521-338-6604x377"
+'''
+def format_phones(numbers, formats, extensions):
+    digits = pds.Series(numbers).astype(str).str.zfill(10)
+    area, exchange, line = digits.str[0:3], digits.str[3:6], digits.str[6:10]
+    dashes = area + "-" + exchange + "-" + line
+    phones = dashes.copy()
+    phones[formats == 1] = ("+1-" + dashes)[formats == 1]
+    phones[formats == 2] = ("(" + area + ")" + exchange + "-" + line)[formats == 2]
+    phones[formats == 3] = ("001-" + dashes + "x" + pds.Series(extensions).astype(str))[formats == 3]
+    return phones
+
+'''
+Attributes of the companies: name, domain, industry, employees and revenue, indexed by company number
+'''
+def company_attributes(company_ids):
+    ids = pds.Series(company_ids).astype(str)
+    last_names = pick(LAST_NAMES, company_ids % len(LAST_NAMES))
+    other_names = pick(LAST_NAMES, (company_ids // len(LAST_NAMES)) % len(LAST_NAMES))
+    # some company names contain a comma, like "Ryan, Soto and Thompson" in the original files
+    with_comma = company_ids % 3 == 0
+    names = (last_names + "-" + other_names + " " + ids).where(~with_comma, last_names + ", " + other_names + " and " + ids)
+    domains = (last_names.str.lower() + "-" + other_names.str.lower() + "-" + ids +
+               pick(TOP_LEVEL_DOMAINS, company_ids % len(TOP_LEVEL_DOMAINS)))
+    # the attributes of a company only depend on its number, so they are the same in every chunk
+    return {
+        "company_name": names,
+        "company_domain": domains,
+        "company_industry": pick(INDUSTRIES, company_ids % len(INDUSTRIES)),
+        "company_employees": pds.Series(company_ids * 7919 % 20000 + 1),
+        "company_revenue": pds.Series(company_ids * 104729 % 500000000 + 10000),
+    }
+
+'''
+Generate the people of one chunk of contacts (numbered first_id to first_id + num_contacts - 1) and the sources
+each of them appears in (a (contacts x 3) boolean array, in the order of SOURCES)
+'''
+def generate_people(first_id, num_contacts, num_companies, overlap_rate, generator):
+    ids = np.arange(first_id, first_id + num_contacts)
+    first_names = pick(FIRST_NAMES, generator.integers(0, len(FIRST_NAMES), num_contacts))
+    last_names = pick(LAST_NAMES, generator.integers(0, len(LAST_NAMES), num_contacts))
+    company_ids = generator.integers(0, num_companies, num_contacts)
+    company = company_attributes(company_ids)
+
+    created_days = generator.integers(0, 300, num_contacts)
+    people = pds.DataFrame({
+        "name": first_names + " " + last_names,
+        "email_address": (first_names.str.lower() + "." + last_names.str.lower() + pds.Series(ids).astype(str) +
+                          "@" + company["company_domain"]),
+        "phone_number": generator.integers(2000000000, 9999999999, num_contacts),
+        "title": pick(TITLES, generator.integers(0, len(TITLES), num_contacts)),
+        **company,
+        "created_days": created_days,
+        "updated_days": created_days + generator.integers(0, 65, num_contacts),
+        "ip_address": (pds.Series(generator.integers(1, 255, num_contacts)).astype(str) + "." +
+                       pds.Series(ids % 256).astype(str) + "." +
+                       pds.Series((ids // 256) % 256).astype(str) + "." +
+                       pds.Series((ids // 65536) % 256).astype(str)),
+    })
+
+    # every contact is in one source, and with probability overlap_rate in a second (then a third) one
+    in_sources = np.zeros((num_contacts, len(SOURCES)), dtype=bool)
+    first_source = generator.integers(0, len(SOURCES), num_contacts)
+    in_sources[np.arange(num_contacts), first_source] = True
+    in_second = generator.random(num_contacts) < overlap_rate
+    second_source = (first_source + generator.integers(1, len(SOURCES), num_contacts)) % len(SOURCES)
+    in_sources[np.arange(num_contacts)[in_second], second_source[in_second]] = True
+    in_third = in_second & (generator.random(num_contacts) < overlap_rate)
+    in_sources[in_third] = True
+
+    return people, in_sources
+
+'''
+Build the rows of one source out of the people that appear in it, with the columns of the schema of the source
+'''
+def source_rows(source, people, missing_name_rate, duplicate_rate, generator):
+    rows = people.reset_index(drop=True)
+    num_rows = len(rows)
+
+    rows["phone_number"] = format_phones(rows["phone_number"].to_numpy(),
+                                         generator.integers(0, len(PHONE_FORMATS), num_rows),
+                                         generator.integers(100, 9999, num_rows))
+    rows["name"] = rows["name"].where(generator.random(num_rows) >= missing_name_rate)
+    rows["created_at"] = (START_DATE + rows["created_days"].to_numpy()).astype(str)
+    rows["updated_at"] = (START_DATE + rows["updated_days"].to_numpy()).astype(str)
+
+    if source == CRM:
+        rows["favorite_color"] = pick(COLORS, generator.integers(0, len(COLORS), num_rows))
+    elif source == ACME:
+        rows["country"] = pick(COUNTRIES, generator.integers(0, len(COUNTRIES), num_rows))
+    elif source == RAPID_DATA:
+        first_signal = pick(INTENT_SIGNALS, generator.integers(0, len(INTENT_SIGNALS), num_rows))
+        second_signal = pick(INTENT_SIGNALS, generator.integers(0, len(INTENT_SIGNALS), num_rows))
+        rows["intent_signals"] = "[\"" + first_signal + "\", \"" + second_signal + "\"]"
+        rows["do_not_call"] = generator.random(num_rows) < 0.1
+
+        # repeat a share of the rows with the same name and ip_address and a later updated_at
+        duplicates = rows[generator.random(num_rows) < duplicate_rate].copy()
+        duplicates["updated_at"] = (START_DATE + duplicates["updated_days"].to_numpy() +
+                                    generator.integers(1, 30, len(duplicates))).astype(str)
+        rows = pds.concat([rows, duplicates], ignore_index=True)
+
+    return rows[list(SOURCE_SCHEMAS[source].keys())]
+
+'''
+Write the three source CSV files for num_contacts contacts into output_dir and return the number of rows
+written to each of them
+'''
+def generate_sources(output_dir, num_contacts, overlap_rate = 0.3, duplicate_rate = 0.05, missing_name_rate = 0.02,
+                     contacts_per_company = 5, chunk_size = 500000, seed = 0):
+    os.makedirs(output_dir, exist_ok=True)
+    num_companies = max(1, num_contacts // contacts_per_company)
+    paths = {source: os.path.join(output_dir, source + "__contacts.csv") for source in SOURCES}
+    rows_written = {source: 0 for source in SOURCES}
+
+    for chunk_number, first_id in enumerate(range(0, num_contacts, chunk_size)):
+        # one generator per chunk so that a chunk does not depend on the chunk size of the previous ones
+        generator = np.random.default_rng([seed, chunk_number])
+        people, in_sources = generate_people(first_id, min(chunk_size, num_contacts - first_id), num_companies,
+                                             overlap_rate, generator)
+        for position, source in enumerate(SOURCES):
+            rows = source_rows(source, people[in_sources[:, position]], missing_name_rate, duplicate_rate, generator)
+            rows.to_csv(paths[source], mode="w" if first_id == 0 else "a", header=first_id == 0, index=False)
+            rows_written[source] += len(rows)
+
+    return rows_written
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic source CSV files")
+    parser.add_argument("--contacts", type=int, default=10000, help="number of distinct contacts")
+    parser.add_argument("--output-dir", default=".", help="directory the CSV files are written to")
+    parser.add_argument("--overlap-rate", type=float, default=0.3, help="share of contacts in more than one source")
+    parser.add_argument("--duplicate-rate", type=float, default=0.05,
+                        help="share of RapidData rows repeated with the same name and ip_address")
+    parser.add_argument("--missing-name-rate", type=float, default=0.02, help="share of rows without a name")
+    parser.add_argument("--contacts-per-company", type=int, default=5, help="average number of contacts per company")
+    parser.add_argument("--chunk-size", type=int, default=500000, help="contacts generated and written at a time")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random generator")
+    args = parser.parse_args()
+
+    rows_written = generate_sources(args.output_dir, args.contacts, args.overlap_rate, args.duplicate_rate,
+                                    args.missing_name_rate, args.contacts_per_company, args.chunk_size, args.seed)
+    for source, num_rows in rows_written.items():
+        print("%-10s %12d rows" % (source, num_rows))
+
+if __name__ == "__main__":
+    main()
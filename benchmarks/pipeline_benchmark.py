@@ -0,0 +1,122 @@
+'''
+Scale benchmark of the whole pipeline: generates synthetic source CSV files (see generate_contacts.py), then runs
+every asset in dependency order, from reading the CSV files and load_*_into_db to create_csv and the matching assets,
+and records for each asset its wall time, the peak memory it allocated (traced with tracemalloc, which slows the
+Python-heavy assets down) and the number of rows it returned.
+
+The results are written as JSON with the commit, the settings and the contacts generated, so that the runs of two
+commits can be compared with --compare:
+
+Usage: python benchmarks/pipeline_benchmark.py --contacts 100000 --backend sqlite
+       python benchmarks/pipeline_benchmark.py --contacts 100000 --compare benchmarks/results/<baseline>.json
+'''
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, ".."))
+
+from generate_contacts import generate_sources
+from runner import pipeline, run_stages
+
+'''
+Return the hash of the current commit, or None outside of a git repository
+'''
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+'''
+Run the assets of the pipeline in order (see pipeline in runner.py) with the database resource of the pipeline
+module and return the measurements of each asset
+'''
+def run_pipeline(er, trace_memory):
+    return run_stages(er, pipeline(er), trace_memory = trace_memory)
+
+'''
+Print the ratio of the time and peak memory of each asset to a previous result
+'''
+def compare(result, baseline):
+    baseline_assets = {measurement["asset"]: measurement for measurement in baseline["assets"]}
+    print("\ncompared with commit %s (%d contacts):" % (baseline["commit"], baseline["settings"]["contacts"]))
+    for measurement in result["assets"]:
+        previous = baseline_assets.get(measurement["asset"])
+        if previous is None:
+            continue
+        time_ratio = measurement["seconds"] / previous["seconds"] if previous["seconds"] > 0 else float("inf")
+        memory_ratio = (measurement["peak_memory_mb"] / previous["peak_memory_mb"]
+                        if measurement["peak_memory_mb"] and previous["peak_memory_mb"] else None)
+        print("%-32s time %6.2fx   memory %s" % (measurement["asset"], time_ratio,
+                                                 "-" if memory_ratio is None else "%6.2fx" % memory_ratio))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic contacts")
+    parser.add_argument("--contacts", type=int, default=10000, help="number of distinct contacts")
+    parser.add_argument("--overlap-rate", type=float, default=0.3, help="share of contacts in more than one source")
+    parser.add_argument("--duplicate-rate", type=float, default=0.05,
+                        help="share of RapidData rows repeated with the same name and ip_address")
+    parser.add_argument("--missing-name-rate", type=float, default=0.02, help="share of rows without a name")
+    parser.add_argument("--contacts-per-company", type=int, default=5, help="average number of contacts per company")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random generator")
+    parser.add_argument("--backend", default="sqlite", help="database backend (sqlite or duckdb)")
+    parser.add_argument("--work-dir", default=None, help="directory of the CSV files and database (default: temporary)")
+    parser.add_argument("--no-memory", action="store_true", help="do not trace the peak memory of each asset")
+    parser.add_argument("--output", default=None, help="JSON result file (default: benchmarks/results/<commit>_<contacts>.json)")
+    parser.add_argument("--compare", default=None, help="JSON result file of a previous run to compare with")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="entityresolution_benchmark_")
+    rows_written = generate_sources(work_dir, args.contacts, args.overlap_rate, args.duplicate_rate,
+                                    args.missing_name_rate, args.contacts_per_company, seed = args.seed)
+    print("generated %s in %s" % (rows_written, work_dir))
+
+    import config
+
+    # run the pipeline module against an embedded database in the work directory, the assets read the CSV files
+    # from the current directory
+    config.backend_name = args.backend
+    config.database_path = os.path.join(work_dir, "entityresolution.db")
+    if os.path.exists(config.database_path):
+        os.remove(config.database_path)
+    os.chdir(work_dir)
+
+    import entityresolution as er
+
+    start_time = time.perf_counter()
+    measurements = run_pipeline(er, trace_memory = not args.no_memory)
+    total_seconds = time.perf_counter() - start_time
+
+    result = {
+        "commit": current_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {key: value for key, value in vars(args).items() if key not in ["output", "compare", "work_dir"]},
+        "rows_written": rows_written,
+        "total_seconds": total_seconds,
+        # peak resident memory of the whole process (kilobytes on Linux)
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "assets": measurements,
+    }
+    print("%-32s %10.3f s, max resident memory %.1f MB" % ("total", total_seconds, result["max_rss_mb"]))
+
+    output = args.output or os.path.join(BENCHMARK_DIR, "results", "%s_%d.json" % (result["commit"], args.contacts))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(result, file, indent=2)
+    print("results written to " + output)
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(result, json.load(file))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+'''
+Smoke run of the pipeline: runs runner.py against an embedded SQLite database on the bundled source CSV files, once
+in the default mode and once per alternative mode of config.py (resolution and post merge stages in the database,
+materialized stages, chunked CSV reads, staging tables, a second delta load, ...), each in its own copy of the
+repository, and checks that every mode writes the same contacts as the default mode (compared without their contact_id, in any
+order). The benchmarks, which call the asset functions directly, are run on a few rows too.
+
+A stage whose signature no longer matches its caller, a mode that fails or a mode whose output drifts from the
+default mode makes the run exit with status 1.
+
+Usage: python benchmarks/smoke_run.py
+       python benchmarks/smoke_run.py --modes default,post_merge_in_database --keep
+'''
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import pandas as pds
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.dirname(BENCHMARK_DIR)
+
+sys.path.insert(0, REPOSITORY_DIR)
+
+from sources import SOURCES
+
+'''
+Settings of config.py overridden by each mode. A mode with delta_load runs the pipeline twice in the same directory,
+so the second run applies an empty delta to the tables of the first one
+'''
+MODES = {
+    "default": {},
+    "post_merge_in_database": {"post_merge_in_database": True},
+    "materialize_stages": {"materialize_stages": True},
+    "csv_chunk_size": {"csv_chunk_size": 200},
+    "use_staging_table": {"use_staging_table": True},
+    "delta_load": {"delta_load": True},
+    "post_merge_in_database_materialized": {"post_merge_in_database": True, "materialize_stages": True},
+    "golden_records_in_database": {"golden_records_in_database": True, "post_merge_in_database": True},
+}
+
+'''
+Benchmarks run on a few rows, with their command line arguments
+'''
+BENCHMARKS = [
+    ["clean_data_benchmark.py", "--rows", "2000", "--legacy-rows", "200"],
+    ["pipeline_benchmark.py", "--contacts", "300", "--no-memory", "--work-dir", os.path.join("{work_dir}", "pipeline_benchmark"),
+     "--output", os.path.join("{work_dir}", "pipeline_benchmark.json")],
+]
+
+'''
+Output file of the pipeline (current_state_final.csv with the default output settings)
+'''
+SNAPSHOT_PATH = "current_state_final.csv"
+CONTACT_ID = "contact_id"
+
+'''
+Copy the modules of the pipeline and the bundled source CSV files into run_dir, and append the settings of the mode
+to the copy of config.py
+'''
+def prepare_run_dir(run_dir, settings):
+    os.makedirs(run_dir)
+    for file_name in os.listdir(REPOSITORY_DIR):
+        if file_name.endswith(".py"):
+            shutil.copy(os.path.join(REPOSITORY_DIR, file_name), run_dir)
+    for source in SOURCES:
+        shutil.copy(os.path.join(REPOSITORY_DIR, source.path), run_dir)
+
+    with open(os.path.join(run_dir, "config.py"), "a") as file:
+        file.write("\n# smoke run settings\nbackend_name = 'sqlite'\n")
+        for name, value in settings.items():
+            file.write("%s = %r\n" % (name, value))
+
+'''
+Run a command in a directory, and raise a RuntimeError with the end of its output if it fails
+'''
+def run_command(command, run_dir):
+    completed = subprocess.run(command, cwd=run_dir, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError("%s failed:\n%s" % (" ".join(command), (completed.stdout + completed.stderr)[-3000:]))
+
+'''
+Run runner.py in the mode in its own directory under work_dir and return the contacts it wrote, without their
+contact_id
+'''
+def run_mode(work_dir, mode):
+    run_dir = os.path.join(work_dir, mode)
+    settings = MODES[mode]
+    prepare_run_dir(run_dir, settings)
+
+    runs = 2 if settings.get("delta_load") else 1
+    for _ in range(runs):
+        run_command([sys.executable, "runner.py", "--backend", "sqlite"], run_dir)
+    contacts = pds.read_csv(os.path.join(run_dir, SNAPSHOT_PATH), dtype=str, keep_default_na=False)
+    return contacts.drop(columns=[CONTACT_ID])
+
+'''
+Return the number of contacts of actual that are not in expected, or in expected and not in actual, whatever the
+order of the contacts
+'''
+def differing_contacts(expected, actual):
+    if list(expected.columns) != list(actual.columns):
+        return max(len(expected), len(actual))
+    counts = pds.concat([expected.assign(side=1), actual.assign(side=-1)]).groupby(list(expected.columns)).side.sum()
+    return int(counts.abs().sum())
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the pipeline in every mode on the bundled CSV files")
+    parser.add_argument("--modes", default=None, help="comma separated modes to run (default: all of them)")
+    parser.add_argument("--no-benchmarks", action="store_true", help="do not run the benchmarks")
+    parser.add_argument("--keep", action="store_true", help="keep the directories of the runs")
+    args = parser.parse_args()
+
+    modes = args.modes.split(",") if args.modes else list(MODES)
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        parser.error("Unknown mode: %s" % ", ".join(unknown))
+    # the other modes are compared with the default mode, run first
+    modes = ["default"] + [mode for mode in modes if mode != "default"]
+
+    work_dir = tempfile.mkdtemp(prefix="entityresolution_smoke_")
+    failures = []
+    try:
+        expected = None
+        for mode in modes:
+            try:
+                contacts = run_mode(work_dir, mode)
+            except RuntimeError as error:
+                failures.append(mode)
+                print("%-40s FAILED\n%s" % (mode, error))
+                continue
+            if mode == "default":
+                expected = contacts
+                print("%-40s ok (%d contacts)" % (mode, len(contacts)))
+                continue
+            differing = differing_contacts(expected, contacts) if expected is not None else 0
+            if differing:
+                failures.append(mode)
+                print("%-40s FAILED: %d contacts differ from the default mode" % (mode, differing))
+            else:
+                print("%-40s ok" % mode)
+
+        if not args.no_benchmarks:
+            for benchmark in BENCHMARKS:
+                command = [sys.executable, os.path.join(BENCHMARK_DIR, benchmark[0])] + \
+                          [argument.format(work_dir = work_dir) for argument in benchmark[1:]]
+                try:
+                    run_command(command, work_dir)
+                    print("%-40s ok" % benchmark[0])
+                except RuntimeError as error:
+                    failures.append(benchmark[0])
+                    print("%-40s FAILED\n%s" % (benchmark[0], error))
+    finally:
+        if args.keep:
+            print("runs kept in " + work_dir)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if failures:
+        print("failed: " + ", ".join(failures))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import numpy as np
+import pandas as pds
+
+from canonical import COMPANY_DOMAIN_KEY, EMAIL_KEY, PHONE_KEY
+from sharding import hash_shards
+
+'''
+Blocking for cross-source matching: instead of comparing every pair of contacts (which is what the OR-heavy
+join predicates of the FULL OUTER JOIN views that used to combine the sources degraded to), each contact is put in
+the blocks of a few inverted indexes (same normalized email, same normalized phone, ...) and only the pairs of
+contacts that share at least one block are emitted as candidate pairs for the matching steps.
+
+Every function works on a "records" DataFrame holding the contacts of all the sources, with a source column
+and one row per contact (its index label is its record id). When the records have the canonical keys
+computed at load time (see canonical.py), the keys are used as they are instead of normalizing the raw fields again.
+
+In the partitioned mode (see partition_count in config.py), the blocks are split into shards by the hash of their
+block key, so the pairs of each shard only need the records of its blocks and the shards can be paired in parallel
+'''
+
+SOURCE = "source"
+LEFT = "left"
+RIGHT = "right"
+BLOCK_KEY = "block_key"
+RECORD = "record"
+
+'''
+Return the lower-cased, trimmed email addresses (missing values stay missing), or the email keys of the records
+'''
+def normalized_email(records):
+    if EMAIL_KEY in records.columns:
+        return records[EMAIL_KEY].astype("string")
+    return records["email_address"].astype("string").str.strip().str.lower()
+
+'''
+Return the local part of each email address followed by the company domain, e.g. "jdoe@acme.com" for
+email "JDoe@mail.acme.com" and company domain "acme.com", to find the same person under another email domain
+'''
+def email_local_part_domain(records):
+    local_part = normalized_email(records).str.split("@", n=1).str[0]
+    return local_part + "@" + normalized_company_domain(records)
+
+'''
+Return the phone numbers reduced to their last 10 digits without the extension and country code, e.g.
+"+1-521-338-6604", "001-521-338-6604x377" and "(521)338-6604" all become "5213386604".
+Numbers with fewer than 10 digits are treated as missing.
+If the records have phone keys, the E.164 phone keys are returned instead, e.g. "+15213386604" for all three
+'''
+def normalized_phone(records):
+    if PHONE_KEY in records.columns:
+        return records[PHONE_KEY].astype("string")
+    digits = records["phone_number"].astype("string").str.split("x", n=1).str[0].str.replace(r"\D", "", regex=True)
+    return digits.str[-10:].where(digits.str.len() >= 10)
+
+'''
+Return the lower-cased, trimmed company domains, or the company domain keys of the records
+'''
+def normalized_company_domain(records):
+    if COMPANY_DOMAIN_KEY in records.columns:
+        return records[COMPANY_DOMAIN_KEY].astype("string")
+    return records["company_domain"].astype("string").str.strip().str.lower()
+
+'''
+Blocking keys available to candidate_pairs: name of the inverted index -> function computing the block key
+of each record
+'''
+BLOCKING_KEYS = {
+    "email": normalized_email,
+    "email_local_part_domain": email_local_part_domain,
+    "phone": normalized_phone,
+    "company_domain": normalized_company_domain,
+}
+
+'''
+Return whether each block key is known. Values that mean "unknown" in the sources ('N/A') never form a block
+'''
+def known_block_keys(keys):
+    return (keys.notna() & (keys != "") & (keys.str.lower() != "n/a")).to_numpy(dtype=bool, na_value=False)
+
+'''
+Return whether each (known) block key falls in the given shard of shard_count shards, by the stable hash of the key
+'''
+def block_in_shard(keys, shard, shard_count):
+    return hash_shards(np.asarray(keys, dtype=object), shard_count) == shard
+
+'''
+Build the inverted index of one blocking key: a DataFrame with one (block_key, record) row per record that
+has a key, where record is the record id of the record (its index label in records)
+'''
+def build_block_index(records, key_name):
+    keys = BLOCKING_KEYS[key_name](records)
+    has_key = known_block_keys(keys)
+    return pds.DataFrame({BLOCK_KEY: keys[has_key].to_numpy(), RECORD: records.index[has_key].to_numpy()})
+
+'''
+Return whether each record has a block of one of the inverted indexes of key_names in the given shard, i.e. whether
+candidate_pairs needs the record to pair that shard
+'''
+def records_in_shard(records, key_names, shard, shard_count):
+    in_shard = np.zeros(len(records), dtype=bool)
+    for key_name in key_names:
+        keys = BLOCKING_KEYS[key_name](records)
+        has_key = known_block_keys(keys)
+        in_shard[has_key] |= block_in_shard(keys[has_key], shard, shard_count)
+    return in_shard
+
+'''
+Statistics of the block sizes of an inverted index (no block is oversized if max_block_size is None)
+'''
+def block_statistics(block_sizes, max_block_size):
+    oversized = block_sizes > max_block_size if max_block_size is not None else block_sizes < 0
+    return {
+        "blocks": int(len(block_sizes)),
+        "records": int(block_sizes.sum()),
+        "mean_block_size": float(block_sizes.mean()) if len(block_sizes) > 0 else 0.0,
+        "max_block_size": int(block_sizes.max()) if len(block_sizes) > 0 else 0,
+        "oversized_blocks": int(oversized.sum()),
+        "oversized_records": int(block_sizes[oversized].sum()),
+    }
+
+'''
+Emit the candidate pairs of one inverted index: every pair of records that share a block.
+Blocks larger than max_block_size are skipped (a company domain shared by thousands of contacts would
+otherwise emit millions of pairs), and are reported in the statistics. If max_block_size is None, every block is kept
+'''
+def block_pairs(index, max_block_size):
+    block_sizes = index.groupby(BLOCK_KEY, sort=False).size()
+    statistics = block_statistics(block_sizes, max_block_size)
+
+    # keep the blocks with at least two and at most max_block_size records
+    kept_sizes = block_sizes >= 2
+    if max_block_size is not None:
+        kept_sizes &= block_sizes <= max_block_size
+    kept_keys = block_sizes.index[kept_sizes]
+    kept = index[index[BLOCK_KEY].isin(kept_keys)]
+
+    # pair the records of each block with each other, each pair once
+    pairs = kept.merge(kept, on=BLOCK_KEY, suffixes=("_" + LEFT, "_" + RIGHT))
+    pairs = pairs[pairs[RECORD + "_" + LEFT] < pairs[RECORD + "_" + RIGHT]]
+    pairs = pairs.rename(columns={RECORD + "_" + LEFT: LEFT, RECORD + "_" + RIGHT: RIGHT})[[LEFT, RIGHT]]
+
+    return pairs, statistics
+
+'''
+Return the block keys of the blocks of the inverted index of key_name larger than max_block_size
+'''
+def oversized_blocks(records, key_name, max_block_size):
+    block_sizes = build_block_index(records, key_name).groupby(BLOCK_KEY, sort=False).size()
+    return block_sizes.index[block_sizes > max_block_size]
+
+'''
+Return a DataFrame of candidate pairs without any pair, with the columns returned by candidate_pairs
+'''
+def empty_pairs():
+    return pds.DataFrame({LEFT: pds.Series([], dtype="int64"), RIGHT: pds.Series([], dtype="int64")})
+
+'''
+Return the candidate pairs of records (a DataFrame of left and right record ids, left < right, each
+pair once) that share a block in at least one of the inverted indexes of key_names, and the statistics of each
+index. If cross_source_only is set, pairs of records from the same source are left out.
+If shard is set, only the blocks in that shard of shard_count shards are paired (see block_in_shard): a pair sharing
+blocks of several shards is returned by each of them. skipped_blocks holds block keys skipped whatever their size
+among the records, by index name, e.g. the blocks oversized among more contacts than the records (see oversized_blocks)
+'''
+def candidate_pairs(records, key_names, max_block_size, cross_source_only = True, shard = None, shard_count = None,
+                    skipped_blocks = None):
+    all_pairs = []
+    statistics = {}
+    for key_name in key_names:
+        index = build_block_index(records, key_name)
+        if skipped_blocks and key_name in skipped_blocks:
+            index = index[~index[BLOCK_KEY].isin(skipped_blocks[key_name])]
+        if shard is not None:
+            index = index[block_in_shard(index[BLOCK_KEY], shard, shard_count)]
+        pairs, statistics[key_name] = block_pairs(index, max_block_size)
+        statistics[key_name]["pairs"] = int(len(pairs))
+        all_pairs.append(pairs)
+
+    pairs = pds.concat(all_pairs, ignore_index=True).drop_duplicates()
+
+    if cross_source_only:
+        sources = records[SOURCE]
+        pairs = pairs[sources.loc[pairs[LEFT]].to_numpy() != sources.loc[pairs[RIGHT]].to_numpy()]
+
+    return pairs.reset_index(drop=True), statistics
@@ -0,0 +1,209 @@
+import numpy as np
+import pandas as pds
+
+'''
+Canonical keys of the contacts, computed once when a source file is loaded and stored as extra indexed columns of
+its table (see SOURCE_TABLE_EXTRA_COLUMNS in schema.py and load_table_in_db in entityresolution.py), so that the
+matching steps compare the keys with plain equality instead of normalizing the raw fields again at every run:
+1) phone_key: the phone number in E.164 form ("+", country code and number), e.g. "+15213386604" for
+   "+1-521-338-6604", "001-521-338-6604x377" and "(521)338-6604"
+2) phone_extension: the digits of the extension of the phone number, e.g. "377" for "001-521-338-6604x377"
+3) email_key: the lower-cased, trimmed email address
+4) name_key: the lower-cased, trimmed name, with its runs of whitespace collapsed into one space
+5) company_domain_key: the lower-cased, trimmed company domain
+A key is null when its field is missing, unknown ('N/A') or can't be normalized.
+
+The keys stand in for their fields wherever contacts are compared: the dedupe views of the sources, the exact
+matches and the blocking of the candidate pairs, and the post merge (see COLUMN_KEYS). The contact key of each record
+identifies its contact across loads (see contact_keys)
+
+The normalizers are vectorized over the distinct values of a column, and keep the key of every value they already
+normalized (see CachedNormalizer), so the values repeated across the rows and the chunks of a file (company domains,
+names, ...) are only normalized once
+'''
+
+PHONE_KEY = "phone_key"
+PHONE_EXTENSION = "phone_extension"
+EMAIL_KEY = "email_key"
+NAME_KEY = "name_key"
+COMPANY_DOMAIN_KEY = "company_domain_key"
+
+'''
+Canonical key columns of the source tables: key column -> column of the source it is computed from
+'''
+KEY_SOURCE_COLUMNS = {
+    PHONE_KEY: "phone_number",
+    PHONE_EXTENSION: "phone_number",
+    EMAIL_KEY: "email_address",
+    NAME_KEY: "name",
+    COMPANY_DOMAIN_KEY: "company_domain",
+}
+CANONICAL_KEY_COLUMNS = list(KEY_SOURCE_COLUMNS)
+
+'''
+Key columns indexed in the source tables: the ones the contacts are matched or grouped on
+'''
+INDEXED_KEY_COLUMNS = [PHONE_KEY, EMAIL_KEY, NAME_KEY, COMPANY_DOMAIN_KEY]
+
+'''
+Canonical key compared in place of each column of the sources when two contacts are compared, so that e.g.
+"(521)338-6604" and "+1-521-338-6604" are the same phone number and "JDoe@Mail.com" and "jdoe@mail.com" the same email
+'''
+COLUMN_KEYS = {
+    "phone_number": PHONE_KEY,
+    "email_address": EMAIL_KEY,
+    "name": NAME_KEY,
+    "company_domain": COMPANY_DOMAIN_KEY,
+}
+
+'''
+Return the columns compared in place of the given columns of the sources: the canonical key of each column that has
+one (see COLUMN_KEYS), else the column itself. For instance ["name", "ip_address"] -> ["name_key", "ip_address"]
+'''
+def canonical_columns(columns):
+    return [COLUMN_KEYS.get(column, column) for column in columns]
+
+'''
+SQL type of the key columns
+'''
+KEY_SQL_TYPE = "VARCHAR(255)"
+
+'''
+Contact key of the records of a source, stored next to their canonical keys, and its SQL type
+'''
+CONTACT_KEY = "contact_key"
+CONTACT_KEY_SQL_TYPE = "VARCHAR(1024)"
+
+'''
+Return the contact key of each record of a source (with its canonical keys and row fingerprint): the name of the table
+of the source followed by the values of its key columns compared through their canonical keys (see
+canonical_columns), e.g. "crm_contacts:john doe|jdoe@mail.com". The key stays the same across loads as long as the key
+columns of the contact don't change, so a delta load can tell which contacts it touched (see load_summary in
+entityresolution.py). A record missing one of its key columns is only identified by its whole row, so its row
+fingerprint is appended, like in the dedupe views of the sources
+'''
+def contact_keys(records, table_name, key_columns, fingerprint_column = "row_fingerprint"):
+    keys = pds.Series(table_name + ":", index=records.index, dtype="string")
+    missing = np.zeros(len(records), dtype=bool)
+    for position, column in enumerate(canonical_columns(key_columns)):
+        values = records[column].astype("string")
+        missing |= values.isna().to_numpy()
+        keys = keys + ("|" if position else "") + values.fillna("")
+    keys = keys.where(~missing, keys + "#" + records[fingerprint_column].astype("string"))
+    return keys.astype(object)
+
+'''
+Lower-cased, trimmed values that mean "unknown" in the sources and never make a key
+'''
+UNKNOWN_KEYS = ["", "n/a", "nan"]
+
+'''
+Number of digits of a national phone number (North American numbers, like the numbers of the sources)
+'''
+NATIONAL_NUMBER_DIGITS = 10
+
+'''
+Least and greatest number of digits of a phone number with its country code (E.164 numbers have at most 15 digits)
+'''
+MIN_PHONE_DIGITS = 8
+MAX_PHONE_DIGITS = 15
+
+'''
+Return the lower-cased, trimmed values, missing if they are unknown
+'''
+def lowered_key(values):
+    keys = values.astype("string").str.strip().str.lower()
+    return keys.mask(keys.isin(UNKNOWN_KEYS))
+
+'''
+Return the name keys: the lower-cased, trimmed names with their runs of whitespace collapsed
+'''
+def name_key(values):
+    return lowered_key(values).str.replace(r"\s+", " ", regex=True)
+
+'''
+Return the phone numbers in E.164 form, without their extension (everything after an "x"). A number starting with
+"+" or with the international call prefix "00" already has its country code, a national number (10 digits, or 11
+digits starting with the country code) gets country_code. Other numbers, and numbers whose length doesn't fit
+E.164 (see MIN_PHONE_DIGITS and MAX_PHONE_DIGITS), are missing
+'''
+def e164_phone(values, country_code):
+    number = values.astype("string").str.strip().str.lower().str.split("x", n=1).str[0]
+    digits = number.str.replace(r"\D", "", regex=True)
+
+    # "+" or the "00" international call prefix: the country code is part of the number
+    international = number.str.startswith("+") | digits.str.startswith("00")
+    digits = digits.where(~digits.str.startswith("00"), digits.str[2:])
+    national = ~international & digits.str.len().eq(NATIONAL_NUMBER_DIGITS)
+    trunk = ~international & digits.str.len().eq(len(country_code) + NATIONAL_NUMBER_DIGITS) & digits.str.startswith(country_code)
+
+    keys = ("+" + country_code + digits).where(national)
+    keys = keys.where(~(international | trunk), "+" + digits)
+    # the key is "+" followed by the digits
+    return keys.where(keys.str.len().between(MIN_PHONE_DIGITS + 1, MAX_PHONE_DIGITS + 1))
+
+'''
+Return the digits of the extension of the phone numbers (everything after an "x", e.g. "x377" or "ext. 377"),
+missing if they have none
+'''
+def phone_extension(values):
+    extensions = values.astype("string").str.lower().str.extract(r"x(.*)", expand=False).str.replace(r"\D", "", regex=True)
+    return extensions.mask(extensions.eq(""))
+
+'''
+Normalizer of a column applying a vectorized normalize function (Series of values -> Series of keys) to the distinct
+values of each column it is called on, and keeping the key of every value it normalized in a cache, so a value
+repeated in the column or in the later chunks of a file is normalized once. The cache is cleared when it would grow
+past max_size values
+'''
+class CachedNormalizer:
+    def __init__(self, normalize, max_size):
+        self.normalize = normalize
+        self.max_size = max_size
+        self.cache = {}
+
+    '''
+    Return the keys of values (missing values have a missing key), as an object Series aligned with values
+    '''
+    def __call__(self, values):
+        codes, distinct = pds.factorize(values.astype(object))
+
+        new_values = [value for value in distinct if value not in self.cache]
+        if len(self.cache) + len(new_values) > self.max_size:
+            # start over with the values of this column only
+            self.cache.clear()
+            new_values = list(distinct)
+        if new_values:
+            keys = self.normalize(pds.Series(new_values, dtype=object))
+            self.cache.update(zip(new_values, keys.astype(object).where(keys.notna(), None)))
+
+        # the key of each distinct value, followed by the missing key of the missing values (code -1)
+        keys = np.array([self.cache[value] for value in distinct] + [None], dtype=object)
+        return pds.Series(keys[codes], index=values.index, dtype=object)
+
+'''
+Normalization stage of the source loads: computes the canonical keys of the records of any source, with a cached
+normalizer per key column. country_code is the country code of the national phone numbers (see e164_phone)
+'''
+class CanonicalKeys:
+    def __init__(self, country_code, cache_size):
+        self.normalizers = {
+            PHONE_KEY: CachedNormalizer(lambda values: e164_phone(values, country_code), cache_size),
+            PHONE_EXTENSION: CachedNormalizer(phone_extension, cache_size),
+            EMAIL_KEY: CachedNormalizer(lowered_key, cache_size),
+            NAME_KEY: CachedNormalizer(name_key, cache_size),
+            COMPANY_DOMAIN_KEY: CachedNormalizer(lowered_key, cache_size),
+        }
+
+    '''
+    Return the canonical key columns of the records as a DataFrame aligned with them. The keys of a column the
+    records don't have are missing
+    '''
+    def compute(self, records):
+        keys = pds.DataFrame(index=records.index)
+        for key_column, column in KEY_SOURCE_COLUMNS.items():
+            if column in records.columns:
+                keys[key_column] = self.normalizers[key_column](records[column])
+            else:
+                keys[key_column] = pds.Series(None, index=records.index, dtype=object)
+        return keys
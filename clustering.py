@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pds
+
+from blocking import BLOCKING_KEYS, LEFT, RIGHT, SOURCE, known_block_keys
+
+'''
+Transitive clustering of the contacts of all sources. The match edges between contacts (pairs of record positions,
+from any pair of sources, see exact_matches and fuzzy_matches in entityresolution.py) are merged with a union-find,
+so that A~B and B~C put A, B and C in the same cluster whatever the sources and the order of the edges, and each
+cluster is resolved into one golden record with the survivorship rules the sources were combined with:
+1) each field takes the first known value of the records of the cluster, in the priority order of the sources
+   (SOURCE_PRIORITY in sources.py: Acme, then RapidData, then CRM, the order of the COALESCE of the FULL OUTER JOIN
+   views that used to combine the sources)
+2) created_at is the smallest created_at of the records
+3) updated_at is the greatest updated_at of the records
+The union-find and the golden records both take linear time in the number of records and edges, so another
+source only adds its records and edges instead of another join
+'''
+
+CLUSTER = "cluster"
+RECORD_COUNT = "record_count"
+
+'''
+Values that mean "unknown" and never survive over a known value of another record
+'''
+UNKNOWN_VALUES = ["N/A", "nan"]
+
+'''
+Return the root of the cluster of each of num_records records linked by the edges (two arrays of record positions).
+The edges are merged with a union-find with path compression (every record visited on the way to the root is
+attached to the root directly) and union by size, so merging E edges takes nearly linear time. The root of a
+cluster is its smallest record position, so the clusters don't depend on the order of the edges
+'''
+def connected_components(num_records, left, right):
+    parent = list(range(num_records))
+    size = [1] * num_records
+    smallest = list(range(num_records))
+
+    def find(record):
+        root = record
+        while parent[root] != root:
+            root = parent[root]
+        # path compression
+        while parent[record] != root:
+            parent[record], record = root, parent[record]
+        return root
+
+    for left_record, right_record in zip(left.tolist(), right.tolist()):
+        left_root, right_root = find(left_record), find(right_record)
+        if left_root == right_root:
+            continue
+        # attach the smaller tree to the larger one
+        if size[left_root] < size[right_root]:
+            left_root, right_root = right_root, left_root
+        parent[right_root] = left_root
+        size[left_root] += size[right_root]
+        smallest[left_root] = min(smallest[left_root], smallest[right_root])
+
+    return np.array([smallest[find(record)] for record in range(num_records)], dtype=np.int64)
+
+'''
+Return the match edges of the matched pairs of one or more pair DataFrames (with the left and right record positions)
+'''
+def match_edges(*pair_frames):
+    left = np.concatenate([pairs[LEFT].to_numpy(dtype=np.int64) for pairs in pair_frames])
+    right = np.concatenate([pairs[RIGHT].to_numpy(dtype=np.int64) for pairs in pair_frames])
+    return left, right
+
+'''
+Resolve the records (the contacts of all sources, indexed by record position, with a source column) into one golden
+record per cluster (the cluster of each record, see connected_components) with the survivorship rules at the top of
+this module, with the columns of the records except source, the cluster (smallest record position of the cluster)
+and the number of records of the cluster. source_priority lists the sources in the order in which the known value of
+a field is taken (the first source has the highest priority, a source that is not listed comes last)
+'''
+def golden_records(records, clusters, source_priority, created_column = "created_at", updated_column = "updated_at"):
+    # order the records of each cluster by source priority so that the first known value wins
+    priority = records[SOURCE].map({source: rank for rank, source in enumerate(source_priority)})
+    order = np.lexsort((np.arange(len(records)), priority.fillna(len(source_priority)).to_numpy(), clusters))
+    ordered = records.iloc[order].drop(columns=[SOURCE]).reset_index(drop=True)
+    ordered_clusters = clusters[order]
+
+    # the unknown values are missing, so groupby first skips them
+    value_columns = [column for column in ordered.columns if column not in [created_column, updated_column]]
+    values = ordered[value_columns]
+    values = values.mask(values.isin(UNKNOWN_VALUES))
+    grouped = values.groupby(ordered_clusters, sort=True)
+    golden = grouped.first()
+    # a field without any known value keeps the unknown value of its first record
+    golden = golden.fillna(ordered[value_columns].groupby(ordered_clusters, sort=True).first())
+
+    dates = ordered[[created_column, updated_column]].groupby(ordered_clusters, sort=True)
+    golden[created_column] = dates[created_column].min()
+    golden[updated_column] = dates[updated_column].max()
+    golden[RECORD_COUNT] = grouped.size()
+
+    golden.index.name = CLUSTER
+    return golden.reset_index()
+
+'''
+Return the records to resolve again after a delta load, and the previous clusters whose golden records they replace.
+records holds the current contacts (with their contact key and the columns of the blocking keys of key_names),
+members the contact key and cluster of each contact of the previous golden records, and affected_keys the contact
+keys of the contacts inserted, updated or deleted by the load.
+
+The contacts whose key was affected or that have no previous cluster may match any contact sharing one of their
+blocks, so these contacts are resolved again too, whatever the size of the blocks (a block growing over the maximum
+block size loses its pairs). Then every previous cluster holding a contact resolved again, affected or gone is
+resolved again whole, and so are the contacts of these clusters, until no cluster is added: the matches between
+the other contacts did not change, so their clusters and golden records stay as they are. A block that shrinks below
+the maximum block size because contacts were deleted only pairs its contacts again on a full resolution.
+Returns whether each record is resolved again, and the set of the previous clusters to replace
+'''
+def resolution_scope(records, members, affected_keys, key_names, contact_key_column = "contact_key"):
+    keys = records[contact_key_column]
+    previous_keys = members[contact_key_column]
+
+    changed = keys.isin(affected_keys).to_numpy() | ~keys.isin(previous_keys).to_numpy()
+    resolved = changed.copy()
+    for key_name in key_names:
+        block_keys = BLOCKING_KEYS[key_name](records)
+        has_key = known_block_keys(block_keys)
+        resolved |= has_key & block_keys.isin(block_keys[changed & has_key]).to_numpy(dtype=bool, na_value=False)
+
+    gone = previous_keys.isin(affected_keys).to_numpy() | ~previous_keys.isin(keys).to_numpy()
+    clusters = set(members[CLUSTER][gone])
+    while True:
+        clusters |= set(members[CLUSTER][previous_keys.isin(keys[resolved]).to_numpy()])
+        in_clusters = keys.isin(previous_keys[members[CLUSTER].isin(clusters).to_numpy()]).to_numpy()
+        if not (in_clusters & ~resolved).any():
+            return resolved, clusters
+        resolved |= in_clusters
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pds
+
+from canonical import lowered_key, name_key
+from clustering import UNKNOWN_VALUES
+from schema import DATE, STRING, apply_schema, create_table_query
+
+'''
+Company dimension: the enrichment columns of each company (the country, company_revenue, company_employees and
+company_industry of Acme, see sources.py), kept in the database across runs and used by extrapolate_data instead
+of regrouping the records of the current run.
+
+A company is keyed by its normalized company_domain, and by its normalized company_name so that the records
+without a company domain can still be enriched: each record of an enrichment source updates the entry of its
+domain and the entry of its name, and a record to enrich looks up the entry of its domain first, then the entry
+of its name. Each attribute of an entry keeps the source and the updated_at of the record its value came from,
+and only gives way to a known value of a record at least as recent, so the dimension is updated incrementally
+with the new records of each load (see latest_attributes and merge_attributes) and a company left out of a later
+drop keeps the facts learned in the earlier runs.
+
+At enrichment time the dimension is loaded into one lookup table per key kind (see CompanyLookup), indexed by
+company key, so enriching a record costs one hash lookup
+'''
+
+COMPANY_DIMENSION = "company_dimension"
+
+'''
+Columns identifying an entry of the dimension: the kind of its key (domain or name) and the normalized key
+'''
+KEY_KIND = "key_kind"
+COMPANY_KEY = "company_key"
+DOMAIN_KEY = "domain"
+NAME_KEY = "name"
+KEY_COLUMNS = [KEY_KIND, COMPANY_KEY]
+
+'''
+Suffixes of the columns holding the source and the updated_at of the value of each attribute
+'''
+SOURCE_SUFFIX = "_source"
+UPDATED_SUFFIX = "_updated_at"
+
+'''
+Return the columns of the dimension and their logical types for the enrichment columns of the sources: the key,
+the company name and domain last seen for the key, then the value, source and updated_at of each attribute
+'''
+def dimension_schema(sources):
+    schema = {KEY_KIND: STRING, COMPANY_KEY: STRING, "company_name": STRING, "company_domain": STRING}
+    for source in sources:
+        for column in source.enrichment_columns:
+            schema[column] = source.schema[column]
+            schema[column + SOURCE_SUFFIX] = STRING
+            schema[column + UPDATED_SUFFIX] = DATE
+    return schema
+
+'''
+Create table statement of the dimension, generated from its schema like the source tables (without a row fingerprint)
+'''
+def create_dimension_query(schema):
+    return create_table_query(COMPANY_DIMENSION, schema, extra_columns = {})
+
+'''
+Return the missing values of a column as a boolean Series: nulls and the values meaning "unknown" in the sources
+'''
+def unknown_values(values):
+    return values.isna() | values.astype(object).isin(UNKNOWN_VALUES)
+
+'''
+Return the domain key and the name key of each record, normalized like the canonical keys of the contacts (see
+lowered_key and name_key in canonical.py), missing when the record has no known domain or name
+'''
+def company_keys(records):
+    return lowered_key(records["company_domain"]), name_key(records["company_name"])
+
+'''
+Return the latest known value of each attribute (columns) for each company key of the records of a source, with
+the source and updated_at of the record it comes from, as a DataFrame indexed by KEY_COLUMNS with the columns of
+the dimension. Each record counts for its domain key and for its name key. The latest value is the one of the
+record with the greatest updated_at (a missing updated_at is the oldest), the record seen first on a tie
+'''
+def latest_attributes(records, source, columns):
+    domains, names = company_keys(records)
+    keyed = pds.concat([records.assign(**{KEY_KIND: DOMAIN_KEY, COMPANY_KEY: domains}),
+                        records.assign(**{KEY_KIND: NAME_KEY, COMPANY_KEY: names})], ignore_index=True)
+    keyed = keyed[keyed[COMPANY_KEY].notna()]
+    keyed = keyed.sort_values("updated_at", ascending=False, kind="stable", na_position="last")
+
+    latest = keyed.drop_duplicates(KEY_COLUMNS).set_index(KEY_COLUMNS)[["company_name", "company_domain"]]
+    for column in columns:
+        known = keyed[~unknown_values(keyed[column])].drop_duplicates(KEY_COLUMNS).set_index(KEY_COLUMNS)
+        latest[column] = known[column]
+        latest[column + SOURCE_SUFFIX] = pds.Series(source, index=known.index, dtype=object)
+        latest[column + UPDATED_SUFFIX] = known["updated_at"]
+    return latest
+
+'''
+Merge the latest attributes of new records (see latest_attributes) into the stored entries of the dimension (both
+indexed by KEY_COLUMNS) and return the entries that changed, with the columns of schema. A known value of the new
+records replaces the stored value if the stored value is unknown, or not more recent than it (a missing updated_at
+being the oldest); otherwise the stored value, source and updated_at are kept
+'''
+def merge_attributes(stored, updates, schema, columns):
+    merged = stored.reindex(updates.index)
+    for column in ["company_name", "company_domain"]:
+        merged[column] = updates[column]
+
+    for column in columns:
+        stored_updated = merged[column + UPDATED_SUFFIX]
+        new_updated = updates[column + UPDATED_SUFFIX]
+        replace = updates[column].notna() & (merged[column].isna() | stored_updated.isna() |
+                                             (new_updated.notna() & (new_updated >= stored_updated)))
+        for suffix in ["", SOURCE_SUFFIX, UPDATED_SUFFIX]:
+            merged[column + suffix] = merged[column + suffix].astype(object).where(~replace, updates[column + suffix].astype(object))
+
+    merged = apply_schema(merged.reset_index()[list(schema)], schema)
+
+    # only the entries that are new or whose values changed are written back
+    before = stored.reindex(updates.index).reset_index()[list(schema)].astype(str).to_numpy()
+    changed = (merged.astype(str).to_numpy() != before).any(axis=1)
+    return merged[changed]
+
+'''
+Lookup structure of the dimension loaded for the enrichment: the entries of each key kind indexed by company key
+'''
+class CompanyLookup:
+    def __init__(self, dimension):
+        self.entries = {kind: dimension[dimension[KEY_KIND] == kind].set_index(COMPANY_KEY)
+                        for kind in [DOMAIN_KEY, NAME_KEY]}
+
+    '''
+    Return the position of the entry of the domain and of the entry of the name of each record in the lookup
+    table of its key kind (-1 if there is no entry), computed once for all the columns
+    '''
+    def locate(self, records):
+        domains, names = company_keys(records)
+        return [(self.entries[kind], self.entries[kind].index.get_indexer(keys.astype(object).where(keys.notna(), None)))
+                for kind, keys in [(DOMAIN_KEY, domains), (NAME_KEY, names)]]
+
+    '''
+    Return, for a column of the dimension, the value of the entry of the domain of each located record, or else
+    of the entry of its name, as an array aligned with the records, and whether a known value was found
+    '''
+    def values(self, located, column):
+        result = np.full(len(located[0][1]), None, dtype=object)
+        found = np.zeros(len(result), dtype=bool)
+        for entries, positions in located:
+            values = entries[column].astype(object).to_numpy()
+            use = ~found & (positions >= 0)
+            use[use] = pds.notna(values[positions[use]])
+            result[use] = values[positions[use]]
+            found |= use
+        return result, found
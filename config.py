@@ -1,4 +1,181 @@
 '''
 This value should be modified based on the name of your server
 '''
-server_name = 'WOLFSON179\SQLEXPRESS01'
\ No newline at end of file
+server_name = 'WOLFSON179\SQLEXPRESS01'
+
+'''
+Number of rows sent to the database in each batch of parameterized inserts
+'''
+load_batch_size = 1000
+
+'''
+If True, each source table is loaded into an empty staging table first and swapped
+in place of the original table once all the rows are loaded
+'''
+use_staging_table = False
+
+'''
+Database engine the pipeline runs against: "sqlserver" (the server defined by server_name),
+or the embedded, in-process "sqlite" or "duckdb" engines (duckdb must be installed separately)
+'''
+backend_name = 'sqlserver'
+
+'''
+Path of the database file used by the embedded "sqlite" and "duckdb" backends
+'''
+database_path = 'entityresolution.db'
+
+'''
+If True, a source file that changed is loaded as a delta: only the rows that were inserted, updated or
+deleted since the previous load are applied to its table, instead of clearing and reloading the table.
+The resolution is incremental too: only the contacts of the golden records the delta touched are matched and
+clustered again, and their golden records replace the previous ones (see resolution_scope in clustering.py). The post
+merge stages still run over every golden record, except that combine_exact_contacts leaves total_combined as it is
+when the delta loads changed no row. A change of the matching settings (blocking keys, block size, thresholds,
+cluster_fuzzy_matches) needs a full load with delta_load off to resolve the previous contacts with it
+'''
+delta_load = False
+
+'''
+Rule used to choose the country, company_revenue, company_employees and company_industry values extrapolated
+to the records of a company: "first" (first complete record seen), "latest" (complete record with the most
+recent updated_at) or "most_frequent" (most common complete combination)
+'''
+extrapolation_rule = 'first'
+
+'''
+If True, extrapolate_data takes the company columns from the company dimension kept in the database across runs
+(keyed by company domain, then company name, see companies.py) instead of choosing them with extrapolation_rule
+among the records of the current run
+'''
+use_company_dimension = False
+
+'''
+Columns whose values must all be equal for combine_post_merge to merge two contacts into one. A column with a
+canonical key (name, email_address, phone_number, company_domain, see canonical.py) is compared through its key, so
+"(521)338-6604" and "+1-521-338-6604" are the same phone number
+'''
+post_merge_key_columns = ['name', 'phone_number']
+
+'''
+Inverted indexes used to generate the candidate pairs of contacts for fuzzy matching (see blocking.py):
+"email", "email_local_part_domain", "phone" and "company_domain"
+'''
+blocking_keys = ['email', 'email_local_part_domain', 'phone', 'company_domain']
+
+'''
+Blocks with more contacts than this are skipped when generating the candidate pairs of the fuzzy matching (the
+exact matches keep every email block, see exact_matches in entityresolution.py)
+'''
+max_block_size = 1000
+
+'''
+Minimum score of each field for a candidate pair to be a fuzzy match (see scoring.py): the Dice similarity
+of the names, and 1.0 (equal) for the normalized phone numbers and the email domains. The name threshold lets
+short variants of a name through, e.g. "Jon"/"John" (0.67) or "Steve"/"Steven" (0.77)
+'''
+fuzzy_thresholds = {'name': 0.65, 'phone': 1.0, 'email_domain': 1.0}
+
+'''
+Number of candidate pairs scored in each batch of array operations
+'''
+scoring_batch_size = 100000
+
+'''
+If True, the views resolving the duplicates of each source (rd_duplicates_removed, crm_duplicates_removed and
+acme_duplicates_removed) are persisted into indexed tables, so reading them doesn't evaluate the views again
+'''
+materialize_stages = False
+
+'''
+If set, the source CSV files are streamed to the database in chunks of this many rows instead of being read
+whole into memory, so the memory used depends on the chunk size and not on the file size
+'''
+csv_chunk_size = None
+
+'''
+CSV parser used to read the source files: "c" (pandas) or "pyarrow" (faster, must be installed separately)
+'''
+csv_engine = 'c'
+
+'''
+Maximum number of database connections open at the same time in each process running assets
+(the three source tables are loaded concurrently, each on its own connection, except with the duckdb backend
+whose assets run one process at a time)
+'''
+pool_max_connections = 4
+
+'''
+Number of times a database operation failing with a transient error (lost connection, locked database) is retried
+with a fresh connection, and the number of seconds waited before the first retry (doubled before each next one)
+'''
+pool_max_retries = 3
+pool_retry_delay = 1.0
+
+'''
+Storage of the DataFrames passed between the assets: "parquet" (compressed Parquet files) or "arrow"
+(Arrow IPC files), written under the intermediate_storage_dir directory and read back memory-mapped.
+intermediate_compression is the codec of the files ("zstd", "lz4", ... or None)
+'''
+intermediate_format = 'parquet'
+intermediate_storage_dir = 'storage'
+intermediate_compression = 'zstd'
+
+'''
+If set, the matching stages (candidate_pairs, exact_matches and fuzzy_matches) run in this many Dagster partitions, one
+per shard of the blocks (hash-sharded by block key, see blocking.py), whose matches golden_records combines, and the
+stages from combine_exact_contacts to combine_post_merge run in this many partitions, one per shard of the golden
+records (hash-sharded by company domain, see sharding.py). The partitions can be materialized in parallel in separate
+processes (e.g. with a backfill of all the partitions). create_csv then assembles the shards
+'''
+partition_count = None
+
+'''
+Change detection of the source CSV files (see watcher.py): the source_files_sensor looks for changed files every
+source_watch_interval_seconds, a file is only hashed and reported once it has not been written to for
+source_debounce_seconds, and the hashes of the files are cached by size and modification time in source_version_cache
+'''
+source_watch_interval_seconds = 5
+source_debounce_seconds = 2.0
+source_version_cache = 'source_versions.json'
+
+'''
+If True, clean_data, extrapolate_data and combine_post_merge run as views in the database instead of in pandas, and
+create_csv streams the merged contacts from the database into the csv file, database_fetch_size rows at a time, so the
+combined contacts are never read whole into memory by the post merge stages (see golden_records_in_database for the
+resolution stages before them)
+'''
+post_merge_in_database = False
+database_fetch_size = 10000
+
+'''
+If False, source_contacts reads every column of the contacts of all the sources into one DataFrame and golden_records
+resolves them in pandas: about 1 KB of memory per contact, and two to three times that at the peak of golden_records,
+which suits a few million contacts at most. If True, the contacts are gathered into the source_contacts table and the
+golden records are built from it by the database (see golden_records in entityresolution.py): the matching stages only
+read their key columns, database_fetch_size rows at a time, and the clustering holds a few integers per contact
+'''
+golden_records_in_database = False
+
+'''
+Format of the output files written by create_csv, the snapshot of the contacts (current_state_final) and the
+changeset of the run (current_state_changes): "csv" or "parquet". output_compression is the compression of the
+files: None, "gzip", "bz2" or "xz" for csv files, any Parquet codec ("zstd", "snappy", ...) for Parquet files
+'''
+output_format = 'csv'
+output_compression = None
+
+'''
+If True, the golden_records asset also clusters the contacts linked by the fuzzy matches (see fuzzy_thresholds),
+not only by the exact matches. If False, candidate_pairs and fuzzy_matches are skipped: they generate and score no
+pair, since nothing would use them
+'''
+cluster_fuzzy_matches = False
+
+'''
+Canonical keys computed when the source files are loaded (see canonical.py): phone_country_code is the country code
+given to the national phone numbers in their E.164 phone key, and normalizer_cache_size the number of distinct values
+whose key each normalizer keeps in its cache
+'''
+phone_country_code = '1'
+normalizer_cache_size = 1000000
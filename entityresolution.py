@@ -1,17 +1,65 @@
 import pandas as pds
 
-import pypyodbc as odbc
-
 import os
 
-#import time
+import collections
 
-from dagster import MetadataValue, asset, repository, AutoMaterializePolicy, observable_source_asset, DataVersion, AutoMaterializeRule
+import json
 
+#import time
+
+from dagster import MetadataValue, asset, get_dagster_logger, repository, AutoMaterializePolicy, observable_source_asset, DataVersion, AutoMaterializeRule, Definitions, load_assets_from_current_module, multiprocess_executor, AssetIn, StaticPartitionsDefinition, sensor, SensorResult, AssetObservation, AssetSelection, RunRequest, DefaultSensorStatus
+from dagster._core.definitions.data_version import DATA_VERSION_TAG
+
+import blocking
+import canonical
+import clustering
+import companies
+import scoring
+import output
+import sharding
+from sources import SOURCES, SOURCES_BY_NAME, SOURCE_PRIORITY
+import watcher
+from blocking import LEFT, RIGHT, SOURCE
 from query import *
+from schema import *
+from resources import DatabaseResource, ColumnarIOManager
+from metrics import asset_metrics, add_asset_metadata
 from config import server_name as SERVER_NAME
+from config import backend_name as BACKEND_NAME
+from config import database_path as DATABASE_PATH
+from config import load_batch_size as LOAD_BATCH_SIZE
+from config import use_staging_table as USE_STAGING_TABLE
+from config import delta_load as DELTA_LOAD
+from config import materialize_stages as MATERIALIZE_STAGES
+from config import csv_chunk_size as CSV_CHUNK_SIZE
+from config import csv_engine as CSV_ENGINE
+from config import pool_max_connections as POOL_MAX_CONNECTIONS
+from config import pool_max_retries as POOL_MAX_RETRIES
+from config import pool_retry_delay as POOL_RETRY_DELAY
+from config import intermediate_format as INTERMEDIATE_FORMAT
+from config import intermediate_storage_dir as INTERMEDIATE_STORAGE_DIR
+from config import intermediate_compression as INTERMEDIATE_COMPRESSION
+from config import partition_count as PARTITION_COUNT
+from config import post_merge_in_database as POST_MERGE_IN_DATABASE
+from config import golden_records_in_database as GOLDEN_RECORDS_IN_DATABASE
+from config import database_fetch_size as DATABASE_FETCH_SIZE
+from config import output_format as OUTPUT_FORMAT
+from config import output_compression as OUTPUT_COMPRESSION
+from config import source_watch_interval_seconds as SOURCE_WATCH_INTERVAL_SECONDS
+from config import source_debounce_seconds as SOURCE_DEBOUNCE_SECONDS
+from config import source_version_cache as SOURCE_VERSION_CACHE
+from config import extrapolation_rule as EXTRAPOLATION_RULE
+from config import use_company_dimension as USE_COMPANY_DIMENSION
+from config import post_merge_key_columns as POST_MERGE_KEY_COLUMNS
+from config import blocking_keys as BLOCKING_KEYS
+from config import max_block_size as MAX_BLOCK_SIZE
+from config import fuzzy_thresholds as FUZZY_THRESHOLDS
+from config import scoring_batch_size as SCORING_BATCH_SIZE
+from config import cluster_fuzzy_matches as CLUSTER_FUZZY_MATCHES
+from config import phone_country_code as PHONE_COUNTRY_CODE
+from config import normalizer_cache_size as NORMALIZER_CACHE_SIZE
 
-DRIVER_NAME = 'SQL SERVER'
 DATABASE_NAME = 'entityresolution'
 
 NAN_STR = "nan"
@@ -22,9 +70,13 @@ NA_STR_QUOTES = "\'" + NA_STR + "\'"
 sql_time = 0
 
 NAME = "name"
+EMAIL_ADDRESS = "email_address"
+IP_ADDRESS = "ip_address"
+ROW_FINGERPRINT = "row_fingerprint"
 CONTACT_ID = "contact_id"
 COUNTRY = "country"
 COMPANY_NAME = "company_name"
+COMPANY_DOMAIN = "company_domain"
 COMPANY_EMPLOYEES = "company_employees"
 COMPANY_REVENUE = "company_revenue"
 COMPANY_INDUSTRY = "company_industry"
@@ -34,28 +86,109 @@ DO_NOT_CALL = "do_not_call"
 CREATED_AT = "created_at"
 UPDATED_AT = "updated_at"
 
-ACME_COLUMNS = [COUNTRY, COMPANY_REVENUE, COMPANY_EMPLOYEES, COMPANY_INDUSTRY]
+'''
+Company columns provided by only some of the sources, filled in for the other contacts of the same company
+by extrapolate_data (the enrichment columns of the sources in sources.py, e.g. the Acme company columns)
+'''
+ENRICHMENT_COLUMNS = [column for source in SOURCES for column in source.enrichment_columns]
+
+'''
+Sources providing enrichment columns, and the columns of the company dimension built from them (see companies.py)
+'''
+ENRICHMENT_SOURCES = [source for source in SOURCES if source.enrichment_columns]
+COMPANY_DIMENSION_SCHEMA = companies.dimension_schema(ENRICHMENT_SOURCES)
+
+STAGING_SUFFIX = "_staging"
+SHARD_SUFFIX = "_p"
+MATERIALIZED_QUERY_SUFFIX = "_query"
+
+STAGE_INDEX_COLUMNS = [NAME, EMAIL_ADDRESS, IP_ADDRESS, COMPANY_DOMAIN]
+
+# columns of source_contacts loaded by each matching asset (see ColumnarIOManager in resources.py)
+CANDIDATE_PAIR_COLUMNS = [SOURCE, canonical.EMAIL_KEY, canonical.PHONE_KEY, canonical.COMPANY_DOMAIN_KEY]
+EXACT_MATCH_COLUMNS = [SOURCE, canonical.EMAIL_KEY, canonical.NAME_KEY, canonical.COMPANY_DOMAIN_KEY, COMPANY_NAME]
+FUZZY_MATCH_COLUMNS = [NAME, canonical.EMAIL_KEY, canonical.PHONE_KEY]
+
+'''
+Normalization stage of the source loads, computing the canonical keys stored in the source tables (see canonical.py).
+Its normalizers keep their caches across the chunks and the loads of the process
+'''
+CANONICAL_KEYS = canonical.CanonicalKeys(PHONE_COUNTRY_CODE, NORMALIZER_CACHE_SIZE)
+MATCH_EDGE_COLUMNS = [LEFT, RIGHT]
+
+'''
+Columns compared by the post merge: the canonical keys of the post merge key columns set in config.py (see
+canonical_columns in canonical.py), e.g. name_key and phone_key for name and phone_number
+'''
+POST_MERGE_KEYS = canonical.canonical_columns(POST_MERGE_KEY_COLUMNS)
+
+'''
+Canonical keys stored next to the fields of the combined contacts for the post merge stages (and left out of the output)
+'''
+COMBINED_KEY_COLUMNS = [column for column in POST_MERGE_KEYS if column in canonical.CANONICAL_KEY_COLUMNS]
+
+'''
+Columns of the combined contacts after the columns of TOTAL_COMBINED_SCHEMA, passed on by the post merge stages: the
+canonical keys of the post merge, then the cluster of the golden record of each contact, which identifies the merged
+contact in the output (see ContactIdentities in output.py) and is not written
+'''
+COMBINED_EXTRA_COLUMNS = COMBINED_KEY_COLUMNS + [clustering.CLUSTER]
 
 '''
-Connection string used to connect to SQL Server database 'entityresolution'
-using server name in string defined in config.py
+Resource giving the assets access to the database through a pool of connections (see resources.py), for the
+storage backend selected in config.py: the SQL Server database 'entityresolution' using the server name defined
+in config.py, or an embedded SQLite/DuckDB database file at the path defined in config.py.
+No connection is opened when this module is imported: connections are only opened when an asset first needs one
 '''
-connection_string = f"""
-    DRIVER={{{DRIVER_NAME}}};
-    SERVER={SERVER_NAME};
-    DATABASE={DATABASE_NAME};
-    Trust_Connection=yes;
-"""
+database = DatabaseResource(backend_name = BACKEND_NAME, server_name = SERVER_NAME, database_name = DATABASE_NAME,
+                            database_path = DATABASE_PATH, max_connections = POOL_MAX_CONNECTIONS,
+                            max_retries = POOL_MAX_RETRIES, retry_delay = POOL_RETRY_DELAY)
 
 '''
-Object used for connecting to SQL Server database
+Storage backend of the database resource, holding the statements of its SQL dialect
 '''
-conn = odbc.connect(connection_string, autocommit = True)
+backend = database.backend
 
 '''
-Object used for managing the context of query operations
+IO manager storing the outputs of the assets between stages: DataFrames as the columnar files set in config.py,
+read back memory-mapped and only with the columns the downstream asset uses (see resources.py)
 '''
-cursor = conn.cursor()
+io_manager = ColumnarIOManager(base_dir = INTERMEDIATE_STORAGE_DIR, file_format = INTERMEDIATE_FORMAT,
+                               compression = INTERMEDIATE_COMPRESSION)
+
+'''
+Partitions of the resolution stages in the partitioned mode, one per shard of the contacts (see sharding.py),
+or None if the pipeline is not partitioned (partition_count in config.py)
+'''
+shard_partitions = StaticPartitionsDefinition([str(shard) for shard in range(PARTITION_COUNT)]) if PARTITION_COUNT else None
+
+'''
+Paths of the output files (the extension of the output format is added, see output.py)
+'''
+OUTPUT_SNAPSHOT_PATH = "current_state_final"
+OUTPUT_CHANGESET_PATH = "current_state_changes"
+
+'''
+Name of the stage views of the post merge stages run in the database (see post_merge_in_database in config.py)
+'''
+CLEAN_RELATION = "total_combined_clean"
+EXTRAPOLATED_RELATION = "total_combined_extrapolated"
+MERGED_RELATION = "total_combined_merged"
+
+'''
+Name of the tables of the resolution: the contacts of all the sources when the golden records are resolved in the
+database (see golden_records_in_database in config.py), the cluster of each of them, the golden records, the
+cluster of the golden record of each contact, the shard of each golden record in the partitioned mode, and the scope
+of the resolution of a delta load (see resolve_scope)
+'''
+SOURCE_CONTACTS_RELATION = "source_contacts"
+CONTACT_CLUSTERS_RELATION = "contact_clusters"
+GOLDEN_RECORDS_RELATION = "golden_records"
+GOLDEN_MEMBERS_RELATION = "golden_record_members"
+GOLDEN_SHARDS_RELATION = "golden_record_shards"
+RESOLVED_CONTACTS_RELATION = "resolved_contacts"
+RESOLVED_CLUSTERS_RELATION = "resolved_clusters"
+OVERSIZED_BLOCKS_RELATION = "oversized_blocks"
 
 '''
 Rule for updating or executing an asset if the previous asset has been automatically executed
@@ -65,36 +198,152 @@ wait_for_updated = AutoMaterializePolicy.eager().with_rules(
 )
 
 '''
-Convert date string of format YYYY-MM-DD to MM/DD/YYYY
+Convert the fields of a DataFrame read from a CSV file into the values bound to the insert statement,
+applying the same conversions as the original per row insert strings:
+1) blank fields (NaN) become null, except for "name" which becomes 'N/A'
+2) do_not_call becomes a BIT value (1 if true, otherwise 0)
+3) invalid (negative) phone numbers become 'N/A'
+4) dates become YYYY-MM-DD strings
+
+A row_fingerprint column holding a hash of the converted fields of each row is added last,
+so that a later delta load can tell which rows changed since this load
+
+For instance, the row:
+{name: NaN, email_address: "ericwolfson@mail.com", phone_number: "-555", ..., do_not_call: True}
+
+becomes:
+{name: 'N/A', email_address: 'ericwolfson@mail.com', phone_number: 'N/A', ..., do_not_call: 1,
+ row_fingerprint: '6d1c3e0b2a9f4c7e'}
 '''
-def to_date_time(date_str):
-    return date_str[5:7] + '/' + date_str[-2:] + '/' + date_str[2:4]
+def prepare_for_insert(data):
+    # dates are bound as YYYY-MM-DD strings
+    data = data.copy()
+    for column in data.select_dtypes(include="datetime").columns:
+        data[column] = data[column].dt.strftime("%Y-%m-%d")
+
+    # work on object columns so that None can be stored in place of NaN
+    prepared = data.astype(object).where(data.notna(), None)
+
+    for column in prepared.columns:
+        values = prepared[column]
+        present = values.notna()
+        # convert do_not_call field to BIT type in SQL
+        if column == DO_NOT_CALL:
+            prepared[column] = values.where(~present, values.map(lambda value: 1 if value is True or str(value) == "TRUE" else 0))
+        # add 'N/A' if phone number is invalid (a negative number)
+        elif column == PHONE_NUMBER:
+            prepared[column] = values.where(~(present & values.astype(str).str.startswith('-')), NA_STR)
+        # insert value as N/A if the field is missing and the column is "name"
+        elif column == NAME:
+            prepared[column] = values.where(present, NA_STR)
+
+    # hash the string form of every converted field of each row
+    hashes = pds.util.hash_pandas_object(prepared.astype(str), index=False)
+    prepared[ROW_FINGERPRINT] = [format(value, "016x") for value in hashes]
+
+    return prepared
 
 '''
-Find the maximum date for the "updated_at" attribute for a list of rows
+Add the canonical keys and the contact key of the rows of a source table prepared by prepare_for_insert (see
+canonical.py) before their row fingerprint, in the order of the columns of the source tables. The fingerprint is
+left as it is, so it only depends on the fields of the file
 '''
-def max_udate_in_row(rows):
-    max_value = ''
-    # If rows is [{"name": "name1", "updated_at": "2023-12-31", "created_at": "2023-12-30"},
-    #             {"name": "name1", "updated_at": "2023-12-21", "created_at": "2023-12-20"}],
-    # return "2023-12-31"
-    for value in rows:
-        if to_date_time(max_value) == '' or to_date_time(value[UPDATED_AT]) > max_value:
-            max_value = to_date_time(value[UPDATED_AT])
-    return max_value
+def add_canonical_keys(prepared, table_name, key_columns):
+    keyed = pds.concat([prepared.drop(columns=[ROW_FINGERPRINT]), CANONICAL_KEYS.compute(prepared), prepared[[ROW_FINGERPRINT]]], axis=1)
+    keyed.insert(loc=len(keyed.columns) - 1, column=canonical.CONTACT_KEY,
+                 value=canonical.contact_keys(keyed, table_name, key_columns, ROW_FINGERPRINT))
+    return keyed
 
 '''
-Find the minimum date for the "created_at" attribute for a list of rows
+Create the indexes of a source table: on its row fingerprints, and on each of its indexed canonical key columns
+(the columns its dedupe view partitions on, and the exact matches and candidate pairs are blocked on)
 '''
-def min_cdate_in_row(row):
-    min_value = ''
-    # If rows is [{"name": "name1", "updated_at": "2023-12-31", "created_at": "2023-12-30"},
-    #             {"name": "name1", "updated_at": "2023-12-21", "created_at": "2023-12-20"}],
-    # return "2023-12-20"
-    for value in row:
-        if to_date_time(min_value) == '' or to_date_time(value[CREATED_AT]) < min_value:
-            min_value = to_date_time(value[CREATED_AT])
-    return min_value     
+def create_source_indexes(cursor, table_name):
+    cursor.execute(create_fingerprint_index_query % (table_name, table_name))
+    for column in canonical.INDEXED_KEY_COLUMNS:
+        cursor.execute(create_stage_index_query % (table_name, column, table_name, column))
+
+'''
+Convert the DataFrame returned by prepare_for_insert into the parameter tuples bound to the insert statement
+'''
+def rows_for_insert(prepared):
+    return list(prepared.itertuples(index=False, name=None))
+
+'''
+Build the parameterized insert statement from an insert prefix, e.g. for a table with 3 columns:
+
+INSERT INTO crm_contacts VALUES(?,?,?)
+'''
+def parameterized_insert(insert_prefix, num_columns):
+    return insert_prefix + ",".join(["?"] * num_columns) + ")"
+
+'''
+Send the rows to the database in batches of batch_size parameter tuples
+'''
+def insert_in_batches(cursor, insert_string, rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        cursor.executemany(insert_string, rows[start:start + batch_size])
+
+'''
+Read the rows returned by a query into a DataFrame, with the column names of the query. The rows are fetched
+through a cursor of the connection, so that the statement is counted in the statistics of the asset
+'''
+def read_query(conn, query):
+    cursor = conn.cursor()
+    cursor.execute(query)
+    columns = [description[0] for description in cursor.description]
+    return pds.DataFrame.from_records(cursor.fetchall(), columns=columns)
+
+'''
+Compare the fingerprints of the rows of the file (given as chunks of rows, see load_table_in_db) with the fingerprints
+stored in the table by the previous load, and return the rows to delete from the table and the prepared rows to
+insert into it, with their canonical keys and contact key. A fingerprint whose number of rows is the same in the table and in the file is left untouched,
+otherwise all the table rows with that fingerprint are deleted and all the file rows with that fingerprint are inserted.
+
+The chunks are read twice: once to count the fingerprints of the file, and once to keep the rows to insert,
+so only the fingerprints and the changed rows are held in memory
+'''
+def table_delta(conn, chunks, table_name, key_columns):
+    stored_columns = key_columns + [canonical.CONTACT_KEY, ROW_FINGERPRINT]
+    stored = read_query(conn, "SELECT " + ", ".join(stored_columns) + " FROM " + table_name)
+
+    file_fingerprints = pds.concat([prepare_for_insert(chunk)[ROW_FINGERPRINT] for chunk in chunks], ignore_index=True)
+
+    # number of rows per fingerprint before and after
+    counts = pds.concat([stored[ROW_FINGERPRINT].value_counts().rename("before"),
+                         file_fingerprints.value_counts().rename("after")], axis=1).fillna(0)
+    changed = counts.index[counts["before"] != counts["after"]]
+
+    removed = stored[stored[ROW_FINGERPRINT].isin(changed)]
+
+    added = []
+    for chunk in chunks:
+        prepared = prepare_for_insert(chunk)
+        added.append(prepared[prepared[ROW_FINGERPRINT].isin(changed)])
+
+    return removed, add_canonical_keys(pds.concat(added, ignore_index=True), table_name, key_columns)
+
+'''
+Summarize a delta load for the downstream assets: the number of contacts inserted, updated and deleted
+(a contact is identified by the key columns of its source) and the set of the contact keys of the contacts
+touched by the load (see contact_keys in canonical.py)
+'''
+def load_summary(removed, added, key_columns):
+    removed_keys = set(removed[key_columns].itertuples(index=False, name=None))
+    added_keys = set(added[key_columns].itertuples(index=False, name=None))
+    updated_keys = removed_keys & added_keys
+
+    return {"inserted": len(added_keys - updated_keys),
+            "updated": len(updated_keys),
+            "deleted": len(removed_keys - updated_keys),
+            "affected_contact_keys": set(removed[canonical.CONTACT_KEY]) | set(added[canonical.CONTACT_KEY])}
+
+'''
+Summarize a full reload for the downstream assets: the number of rows inserted, and None as the affected
+contact keys, meaning every contact may have changed
+'''
+def full_load_summary(rows_inserted):
+    return {"inserted": rows_inserted, "updated": 0, "deleted": 0, "affected_contact_keys": None}
 
 '''
 Insert all rows of DataFrame from CSV file into an SQL table
@@ -106,346 +355,1372 @@ For instance, if the row is:
  
 The insert statement is:
 
-INSERT INTO crm_contacts VALUES('Eric Wolfson', 'ericwolfson@mail.com', '555-555-5555','Software Engineer', 
-company_name: 'CompanyName1', company_domain: 'domain1.com', 'red', '2023-12-29', '2023-12-30')
+INSERT INTO crm_contacts VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+
+with the parameters ('Eric Wolfson', 'ericwolfson@mail.com', '555-555-5555', 'Software Engineer',
+'CompanyName1', 'domain1.com', 'red', '2023-12-29', '2023-12-30', '+15555555555', None, 'ericwolfson@mail.com',
+'eric wolfson', 'domain1.com', 'crm_contacts:eric wolfson|ericwolfson@mail.com', '<row fingerprint>'): the canonical
+keys and the contact key of the row (see add_canonical_keys) come before its fingerprint. The keys are computed once here, and indexed, so the matching steps can use them as they are.
 
-If the table doesn't exist, it is created and if it is already full from a different run, it is
-cleared first
+merge_dataframes is either the whole DataFrame, or a CsvChunks (see schema.py) that reads the CSV file in
+chunks of rows, in which case each chunk is sent to the database as soon as it is read, so the memory used
+depends on the chunk size and not on the file size.
+
+Rows are sent in batches of batch_size parameter tuples, and the whole table is loaded in a single
+transaction. If the table doesn't exist (or was created before the canonical key or contact key columns), it is created with its
+indexes (see create_source_indexes) and if it is already full from a different run, it is cleared first. If use_staging is set, the rows are loaded into an empty <table_name>_staging table that
+replaces the original table at the end, so readers never see a partially loaded table.
+
+If delta is set and the table already exists, the table is not cleared: only the rows whose fingerprint
+changed since the previous load are deleted and inserted (see table_delta).
+
+conn is a connection of the database resource (see DatabaseResource.run in resources.py), used by this load only,
+so the three source tables can be loaded concurrently (except with the duckdb backend, see asset_executor).
+
+Returns the load summary described in load_summary (delta load) or full_load_summary (full reload)
 '''
-def load_table_in_db(merge_dataframes, create_string, insert_prefix, table_name):
-    data = merge_dataframes
+def load_table_in_db(conn, merge_dataframes, create_string, insert_prefix, table_name, key_columns,
+                     batch_size = LOAD_BATCH_SIZE, use_staging = USE_STAGING_TABLE, delta = DELTA_LOAD):
+    # a DataFrame is loaded as a single chunk
+    chunks = [merge_dataframes] if isinstance(merge_dataframes, pds.DataFrame) else merge_dataframes
+
+    cursor = conn.cursor()
 
     # check if table already exists in the database
-    cursor.execute(check_table_query + "\'" + table_name + "\'")
+    cursor.execute(backend.check_table_query + "\'" + table_name + "\'")
     
     dbs = cursor.fetchall()
 
+    # a table created before the canonical key or contact key columns is created again with them
+    if dbs and not set(canonical.CANONICAL_KEY_COLUMNS + [canonical.CONTACT_KEY]) <= set(table_columns(conn, table_name)):
+        cursor.execute("DROP TABLE " + table_name)
+        conn.commit()
+        dbs = []
+
     # if the table does not exists, create it
     if not dbs:        
-        cursor.execute(create_string)
+        cursor.execute(backend.ddl(create_string))
+        create_source_indexes(cursor, table_name)
         conn.commit()
 
-    # delete all contents of the table if it was already filled from the last run
-    if table_name == 'crm_contacts':   
-        cursor.execute("DELETE FROM crm_contacts")
-    elif table_name == 'acme_contacts':    
-        cursor.execute("DELETE FROM acme_contacts")
-    elif table_name == 'rapid_data_contacts':    
-        cursor.execute("DELETE FROM rapid_data_contacts")
-        
+    # only apply the changes since the last load if the table was already filled
+    delta = delta and bool(dbs)
+    # a delta load never needs a staging table since it does not clear the table
+    use_staging = use_staging and not delta
+
+    if delta:
+        removed, added = table_delta(conn, chunks, table_name, key_columns)
+        # only the changed rows are inserted
+        prepared_chunks = [added]
+    else:
+        prepared_chunks = (add_canonical_keys(prepare_for_insert(chunk), table_name, key_columns) for chunk in chunks)
+
+    # the table the rows are inserted into
+    target_name = table_name + STAGING_SUFFIX if use_staging else table_name
+
+    rows_inserted = 0
+
+    cursor.execute(backend.begin_transaction)
+
+    try:
+        if delta:
+            # delete the rows that changed or disappeared since the last load
+            if len(removed) > 0:
+                cursor.executemany(delete_by_fingerprint_query % table_name,
+                                   [(fingerprint,) for fingerprint in removed[ROW_FINGERPRINT].unique()])
+        elif use_staging:
+            # create an empty staging table with the same definition as the original table
+            cursor.execute("DROP TABLE IF EXISTS " + target_name)
+            cursor.execute(backend.ddl(create_string.replace(table_name, target_name, 1)))
+        else:
+            # delete all contents of the table if it was already filled from the last run
+            cursor.execute("DELETE FROM " + table_name)
+
+        # send the rows of each chunk to the database in batches
+        for prepared in prepared_chunks:
+            insert_string = parameterized_insert(insert_prefix.replace(table_name, target_name, 1), len(prepared.columns))
+            insert_in_batches(cursor, insert_string, rows_for_insert(prepared), batch_size)
+            rows_inserted += len(prepared)
+
+        # swap the staging table in place of the original table
+        if use_staging:
+            cursor.execute("DROP TABLE " + table_name)
+            cursor.execute(backend.rename_table_query % (target_name, table_name))
+            create_source_indexes(cursor, table_name)
+
+        cursor.execute(backend.commit_transaction)
+    except Exception:
+        cursor.execute(backend.rollback_transaction)
+        raise
+
     conn.commit()
 
-    columns = data.columns
-
-    # for each row in the dataframe create and execute an insert operation
-    for data_index in range(0, len(data)):
-        insert_string = insert_prefix
-
-        # for each column name for that row, add the value of that field to the insert statement
-        for column_index in range(0, len(columns)):
-
-            # get the column name based on index
-            column = columns[column_index]
-
-            # get the field value based on column name and row number
-            value = data[column][data_index]            
-
-            # add field to insert string unless it is blank
-            if str(value) != NAN_STR:
-                # convert do_not_call field to BIT type in SQL
-                if column == DO_NOT_CALL:
-                    insert_string += "1" if str(value) == "TRUE" else "0"
-                # add value to insert statement
-                elif not (column == PHONE_NUMBER and str(value)[0] == '-'):
-                    insert_string += "\'" + str(value) + "\'"
-                # add 'N/A' if phone number is invalid (a negative number)
-                else:
-                    insert_string += NA_STR_QUOTES
-            # insert the value as "null" if field is missing.
-            # insert value as N/A if the field is missing and the column is "name"
-            else:
-                insert_string += "null" if column != NAME else NA_STR_QUOTES
-
-            # add comma after each field in the VALUES(...) portion except after the last field
-            if column_index < len(columns) - 1:
-                insert_string += ","
-                
-        insert_string += ")"
-
-        # execute the insert statement
-        cursor.execute(insert_string)
-        
+    if delta:
+        return load_summary(removed, added, key_columns)
+    return full_load_summary(rows_inserted)
+
+'''
+Combine the load summaries of the source tables into the set of the contact keys of the contacts touched by the loads,
+or None if any of the tables was fully reloaded (every contact may have changed). source_contacts limits the
+resolution to the golden records of these contacts (see resolution_scope in clustering.py), and an empty set lets
+combine_exact_contacts skip its write
+'''
+def affected_contact_keys(*load_summaries):
+    keys = set()
+    for summary in load_summaries:
+        if summary is None or summary["affected_contact_keys"] is None:
+            return None
+        keys |= summary["affected_contact_keys"]
+    return keys
+
+'''
+Check if a table (check_query = backend.check_table_query) or a view (check_query = backend.check_view_query) exists
+'''
+def relation_exists(conn, check_query, name):
+    cursor = conn.cursor()
+    cursor.execute(check_query + "\'" + name + "\'")
+    return bool(cursor.fetchall())
+
+'''
+Drop the table or view with the given name if there is one
+'''
+def drop_relation(conn, name):
+    cursor = conn.cursor()
+    if relation_exists(conn, backend.check_table_query, name):
+        cursor.execute("DROP TABLE " + name)
+    if relation_exists(conn, backend.check_view_query, name):
+        cursor.execute("DROP VIEW " + name)
+    conn.commit()
+
+'''
+Return the column names of a table
+'''
+def table_columns(conn, table_name):
+    cursor = conn.cursor()
+    cursor.execute(table_columns_query % table_name)
+    columns = [description[0] for description in cursor.description]
+    cursor.fetchall()
+    return columns
+
+'''
+Return the number of rows of a table or view
+'''
+def count_rows(conn, name):
+    cursor = conn.cursor()
+    cursor.execute(count_rows_query % name)
+    return cursor.fetchall()[0][0]
+
+'''
+Create the stage view_name of the pipeline from its CREATE VIEW query.
+
+By default the stage is a view. If materialize is set, the stage is instead persisted into a real table with
+that name: the query is created as the view <view_name>_query, its rows are copied into the table, the join keys
+of the table (STAGE_INDEX_COLUMNS) are indexed and the table statistics are collected. Reading the stage,
+or a later stage built on it, then doesn't evaluate the whole chain of views again
+'''
+def execute_sql_query(conn, view_name, view_query, materialize = MATERIALIZE_STAGES):
+    cursor = conn.cursor()
+
+    # the stage may be a view or a table from a previous run
+    drop_relation(conn, view_name)
+
+    if not materialize:
+        cursor.execute(view_query)
         conn.commit()
+        return
 
-def execute_sql_query(view_name, view_query):
-    cursor.execute("DROP VIEW IF EXISTS " + view_name)
+    query_view_name = view_name + MATERIALIZED_QUERY_SUFFIX
+    drop_relation(conn, query_view_name)
+
+    cursor.execute(view_query.replace("CREATE VIEW " + view_name, "CREATE VIEW " + query_view_name, 1))
+    cursor.execute(backend.create_table_as_query % (view_name, query_view_name))
+
+    columns = table_columns(conn, view_name)
+    for column in STAGE_INDEX_COLUMNS:
+        if column in columns:
+            cursor.execute(create_stage_index_query % (view_name, column, view_name, column))
+
+    cursor.execute(backend.update_statistics_query % view_name)
 
-    conn.commit()	
-    
-    cursor.execute(view_query)
-    
     conn.commit()
 
 '''
-Create asset that get observed every 45 seconds and triggers the next asset
-if the crm__contacts.csv file was updated during that duration of time
+Return the shard resolved by the asset being run in the partitioned mode, or None if the pipeline is not partitioned
 '''
-@observable_source_asset(auto_observe_interval_minutes=0.75, description="auto trigger for crm load")
-def check_crm_update():
-    return DataVersion(str(os.path.getmtime("crm__contacts.csv")))    
+def current_shard(context):
+    return int(context.partition_key) if context.has_partition_key else None
 
 '''
-Create asset that get observed every 45 seconds and triggers the next asset
-if the acme__contacts.csv file was updated during that duration of time
+Return the name of a relation of the resolution stages for a shard (the name itself if shard is None),
+e.g. total_combined_p3 for shard 3
 '''
-@observable_source_asset(auto_observe_interval_minutes=0.75, description="auto trigger for acme load")
-def check_acme_update():
-    return DataVersion(str(os.path.getmtime("acme__contacts.csv")))
+def shard_relation(name, shard):
+    return name if shard is None else name + SHARD_SUFFIX + str(shard)
 
 '''
-Create asset that get observed every 45 seconds and triggers the next asset
-if the rapid_data__contacts.csv file was updated during that duration of time
+Return the key columns of the relation with the given alias in the select list of a stage view, each followed by a
+comma, e.g. "t.name_key, t.phone_key, " (nothing if there are no key columns)
 '''
-@observable_source_asset(auto_observe_interval_minutes=0.75, description="auto trigger for rapid data load")
-def check_rapid_data_update():
-    return DataVersion(str(os.path.getmtime("rapid_data__contacts.csv")))    
+def key_select(alias, key_columns):
+    return "".join(alias + "." + column + ", " for column in key_columns)
 
 '''
-Read data from the crm__contacts csv file and convert into and return the equivalent dataframe with all
-fields as strings. If auto materialize is on and crm__contacts was updated, this will automatically trigger as well
-as all subsequent assets in the pipeline
+Read a source CSV file with the column types of its schema. If a chunk size is set in config.py, the file
+is not read here: the returned CsvChunks streams it in chunks to the database loader (see load_table_in_db)
 '''
-@asset(auto_materialize_policy=wait_for_updated, deps=[check_crm_update],description="Load csv into CRM DataFrame")
-def crm_dataframe_from_csv() -> pds.DataFrame:
-    data = pds.read_csv('crm__contacts.csv', dtype=str)
-    return data
+def read_source_csv(path, schema):
+    if CSV_CHUNK_SIZE:
+        return CsvChunks(path, schema, CSV_CHUNK_SIZE, CSV_ENGINE)
+    return read_csv_with_schema(path, schema, engine=CSV_ENGINE)
 
 '''
-Read data from the acme__contacts csv file and convert into and return the equivalent dataframe with all
-fields as strings. If auto materialize is on and crm__contacts was updated, this will automatically trigger as well
-as all subsequent assets in the pipeline
+Return the data version of a source CSV file: the hash of its content (see watcher.py), so that touching the file
+or rewriting it with the same content does not trigger the next asset
 '''
-@asset(auto_materialize_policy=wait_for_updated, deps=[check_acme_update], description="Load csv into Acme DataFrame")
-def acme_dataframe_from_csv() -> pds.DataFrame:
-    data = pds.read_csv('acme__contacts.csv', dtype=str)
-    return data
+def source_file_version(path):
+    return DataVersion(watcher.source_version(path, SOURCE_VERSION_CACHE))
 
 '''
-Read data from the rapid_data__contacts csv file and convert into and return the equivalent dataframe with all
-fields as strings. If auto materialize is on and crm__contacts was updated, this will automatically trigger as well
-as all subsequent assets in the pipeline
+Assets generated for each source of the registry (see source_assets)
 '''
-@asset(auto_materialize_policy=wait_for_updated, deps=[check_rapid_data_update], description="Load csv into RapidData DataFrame")
-def rapid_data_dataframe_from_csv() -> pds.DataFrame:
-    data = pds.read_csv('rapid_data__contacts.csv', dtype=str)
-    return data
+SourceAssets = collections.namedtuple("SourceAssets", ["observe", "read", "load", "dedupe"])
+
+'''
+Resolve the duplicates within the table of a source into its contacts relation, with the one-scan window ranking of
+its dedupe view (see create_dedupe_view in query.py), and attach the number of rows before and after the duplicates
+are merged, and of duplicates removed, to the materialization
+'''
+def deduplicate_source(conn, source):
+    execute_sql_query(conn, source.contacts_relation, source.dedupe_view)
+
+    source_rows = count_rows(conn, source.table_name)
+    remaining_rows = count_rows(conn, source.contacts_relation)
+    add_asset_metadata({"rows_in": MetadataValue.int(source_rows),
+                        "rows_out": MetadataValue.int(remaining_rows),
+                        "row_ratio": MetadataValue.float(remaining_rows / source_rows if source_rows else 1.0),
+                        "duplicates_removed": MetadataValue.int(source_rows - remaining_rows)})
 
 '''
-Load the dataframe returned by the crm_dataframe_from_csv asset into the crm_contacts table in SQL Server
+Generate the assets of a source declared in sources.py:
+1) check_<name>_update: observable source asset whose data version is the content hash of the CSV file of the source,
+   and triggers the next asset when it changes. It is observed by source_files_sensor as soon as the file changed
+2) <name>_dataframe_from_csv: read the CSV file and return the equivalent dataframe with the column types of its
+   schema (or the CsvChunks reading it in chunks, see read_source_csv). If auto materialize is on and the file was
+   updated, this will automatically trigger as well as all subsequent assets in the pipeline
+3) load_<name>_into_db: load the dataframe returned by the asset above into the table of the source (see
+   load_table_in_db), created from the schema of the source if it does not exist
+4) resolve_<name>_duplicates, for a source with dedupe keys: resolve the duplicates of the table of the source
+   with its dedupe view (see deduplicate_source) and pass the load summary of the table on to the next asset
 '''
-@asset(auto_materialize_policy=wait_for_updated, description="Load CRM Contacts DataFrame Into Database")
-def load_crm_into_db(crm_dataframe_from_csv):
-    # call the common load_table_in_db function with crm variable parameters
-    load_table_in_db(crm_dataframe_from_csv, create_crm, crm_insert, 'crm_contacts')  
+def source_assets(source):
+    @observable_source_asset(name="check_%s_update" % source.name, description="auto trigger for %s load" % source.label)
+    def check_update():
+        return source_file_version(source.path)
+
+    @asset(name=source.name + "_dataframe_from_csv", auto_materialize_policy=wait_for_updated, deps=[check_update],
+           description="Load csv into %s DataFrame" % source.label)
+    @asset_metrics
+    def dataframe_from_csv():
+        return read_source_csv(source.path, source.schema)
+
+    @asset(name="load_%s_into_db" % source.name, auto_materialize_policy=wait_for_updated,
+           ins={"dataframe": AssetIn(source.name + "_dataframe_from_csv")},
+           description="Load %s Contacts DataFrame Into Database" % source.label)
+    @asset_metrics
+    def load_into_db(dataframe, database: DatabaseResource):
+        return database.run(load_table_in_db, dataframe, source.create_table, source.insert_prefix, source.table_name, source.key_columns)
+
+    if not source.dedupe_keys:
+        return SourceAssets(check_update, dataframe_from_csv, load_into_db, None)
+
+    @asset(name="resolve_%s_duplicates" % source.name, auto_materialize_policy=wait_for_updated,
+           ins={"load_summary": AssetIn("load_%s_into_db" % source.name)},
+           description="Resolve Duplicates for %s" % source.label)
+    @asset_metrics
+    def resolve_duplicates(load_summary, database: DatabaseResource):
+        database.run(deduplicate_source, source)
+        return load_summary
+
+    return SourceAssets(check_update, dataframe_from_csv, load_into_db, resolve_duplicates)
 
 '''
-Load the dataframe returned by the crm_dataframe_from_csv asset into the acme_contacts table in SQL Server
+Assets of each source of the registry, by source name
 '''
-@asset(auto_materialize_policy=wait_for_updated, description="Load Acme Contacts DataFrame Into Database")
-def load_acme_into_db(acme_dataframe_from_csv):
-    # call the common load_table_in_db function with acme variable parameters
-    load_table_in_db(acme_dataframe_from_csv, create_acme, acme_insert, 'acme_contacts')
+SOURCE_ASSETS = {source.name: source_assets(source) for source in SOURCES}
 
 '''
-Load the dataframe returned by the rapid_data_dataframe_from_csv asset into the rapid_data_contacts table in SQL Server
+Asset whose materialization makes the contacts relation of each source ready: its dedupe asset, or else its load
 '''
-@asset(auto_materialize_policy=wait_for_updated, description="Load RapidData Contacts DataFrame Into Database")
-def load_rapid_data_into_db(rapid_data_dataframe_from_csv):
-    # call the common load_table_in_db function with rapid_data variable parameters
-    load_table_in_db(rapid_data_dataframe_from_csv, create_rapid_data, rapid_data_insert, 'rapid_data_contacts')
+SOURCE_CONTACTS_ASSETS = {name: assets.dedupe or assets.load for name, assets in SOURCE_ASSETS.items()}
 
 '''
-Resolve duplicates in the rapid_data_contacts SQL table using the create_reduced_rapid_data_view query from query.py
+Observable source asset of each source CSV file
 '''
-@asset(auto_materialize_policy=wait_for_updated, description="Resolve Duplicates for RapidData")
-def resolve_rapid_data_duplicates(load_rapid_data_into_db):
-    execute_sql_query("rd_duplicates_removed", create_reduced_rapid_data_view)
+SOURCE_FILE_ASSETS = {source.path: SOURCE_ASSETS[source.name].observe for source in SOURCES}
 
 '''
-Join the 3 tables (rd_duplicates_removed, crm_contacts and acme_contacts joining exact duplicates for common
-column names and filling in non-common column names based on values from the other two tables.
-Find the greatest updated_at value for the common records and least created_at value to preserve as much
-date data as possible, since the result will contain fields in columns that have different dates
+Watcher of the source CSV files, started in the process evaluating source_files_sensor on its first tick
 '''
-@asset(auto_materialize_policy=wait_for_updated, deps=[load_crm_into_db, load_acme_into_db, resolve_rapid_data_duplicates], description="Create View for merged contacts")
-def combine_exact_contacts():
-    #start_time = time.time()
-    # Join the rd_duplicates_removed table with the crm_contacts table
-    execute_sql_query("rdc_combined", create_rapid_data_crm_combined_view)
-    # Join the combined table above with the acme_contacts table
-    execute_sql_query("total_combined_dates", create_total_combined_view_dates)
-    # Create a table with the merged dates from the last table without the ip_address column
-    execute_sql_query("total_combined", create_total_combined_view)
-    #sql_time = (time.time() - start_time)
-    #print("seconds %s" % sql_time)
+source_watcher = watcher.SourceWatcher(SOURCE_FILE_ASSETS.keys())
+
+'''
+Replace the table_name table with the golden records of the golden_records table (only those of the given shard in
+the partitioned mode): the columns of TOTAL_COMBINED_SCHEMA followed by the canonical keys of the post merge. The rows are
+copied by the database in a single transaction, and the join keys of the table (STAGE_INDEX_COLUMNS) are indexed for
+the post merge views
+'''
+def write_combined_contacts(conn, golden_records, table_name, shard = None):
+    # the relation may be a view of the combined contacts from an earlier version of the pipeline
+    drop_relation(conn, table_name)
+
+    golden = "(SELECT " + ", ".join(list(TOTAL_COMBINED_SCHEMA) + COMBINED_EXTRA_COLUMNS) + " FROM " + golden_records
+    if shard is not None:
+        golden += " WHERE %s = %d" % (sharding.SHARD, shard)
+    golden += ") AS g"
+
+    cursor = conn.cursor()
+    cursor.execute(backend.begin_transaction)
+    try:
+        cursor.execute(backend.create_table_as_query % (table_name, golden))
+        for column in STAGE_INDEX_COLUMNS:
+            if column in TOTAL_COMBINED_SCHEMA:
+                cursor.execute(create_stage_index_query % (table_name, column, table_name, column))
+        cursor.execute(backend.commit_transaction)
+    except Exception:
+        cursor.execute(backend.rollback_transaction)
+        raise
+
+    cursor.execute(backend.update_statistics_query % table_name)
+    conn.commit()
 
 '''
-Pull the combined data table from the database and read it into a dataframe
+Copy the golden records of the contacts of all the sources (see golden_records) into the total_combined table read by
+the post merge stages. The golden records replace the chain of FULL OUTER JOIN views (rdc_combined, then
+total_combined_dates) that used to join the sources two at a time: each field takes the first known value in the
+source order of the views, created_at is the least and updated_at the greatest date of the matched contacts.
+
+load_summaries holds the load summary passed on by the asset making the contacts of each source ready (see
+SOURCE_CONTACTS_ASSETS), by asset name. Returns the contact keys of the contacts affected by the loads (None after
+a full reload of any table), reported in the metadata of the run. Only the golden records of these contacts were
+resolved again (see source_contacts), but every golden record is copied, the post merge stages are not incremental.
+Only if a delta load found no change in any table, the table is left as it is
+
+In the partitioned mode, each partition copies the golden records of its shard (see sharding.py) into its own table,
+suffixed with its shard (e.g. total_combined_p3)
 '''
-@asset(auto_materialize_policy=wait_for_updated, deps=[combine_exact_contacts], description="extract DB contents into DataFrame Format")
-def query_db_into_dataframe() -> pds.DataFrame:   
-    get_all_query = "SELECT * FROM total_combined ORDER BY name"
-    data = pds.read_sql(get_all_query, conn)
-    rearranged_data = data.iloc[:,range(0,15)] 
-    return rearranged_data
+@asset(auto_materialize_policy=wait_for_updated, partitions_def=shard_partitions,
+       ins={"golden_records": AssetIn(),
+            **{contacts_asset.key.path[-1]: AssetIn(contacts_asset.key) for contacts_asset in SOURCE_CONTACTS_ASSETS.values()}},
+       description="Store golden records as merged contacts")
+@asset_metrics
+def combine_exact_contacts(context, golden_records, database: DatabaseResource, **load_summaries):
+    affected_keys = affected_contact_keys(*load_summaries.values())
+    if affected_keys is not None and not affected_keys:
+        return affected_keys
+    shard = current_shard(context)
+    database.run(write_combined_contacts, golden_records, shard_relation("total_combined", shard), shard)
+    return affected_keys
+
+'''
+Pull the combined data table from the database and read it into a dataframe with the column types
+of TOTAL_COMBINED_SCHEMA in schema.py (only the contacts of its shard in the partitioned mode).
+If the post merge stages run in the database, nothing is read and the name of the relation is returned instead
+'''
+@asset(auto_materialize_policy=wait_for_updated, partitions_def=shard_partitions, deps=[combine_exact_contacts], description="extract DB contents into DataFrame Format")
+@asset_metrics
+def query_db_into_dataframe(context, database: DatabaseResource):
+    total_combined = shard_relation("total_combined", current_shard(context))
+    if POST_MERGE_IN_DATABASE:
+        # the next stages run in the database, on the relation itself
+        return total_combined
+    get_all_query = "SELECT * FROM " + total_combined + " ORDER BY name"
+    data = database.run(read_query, get_all_query)
+    rearranged_data = data[list(TOTAL_COMBINED_SCHEMA) + COMBINED_EXTRA_COLUMNS]
+    # convert the values returned by the database engine to the column types of the combined contacts
+    return apply_schema(rearranged_data, TOTAL_COMBINED_SCHEMA)
+
+'''
+Default value filled in for the null fields of each column by clean_data, matching the expected data type
+for that column. Columns that are not listed are string (or categorical) columns and get NA_STR ("N/A"),
+except for the date columns which are left empty
+'''
+CLEAN_DATA_DEFAULTS = {
+    # company_employees and company_revenue get a default integer
+    COMPANY_EMPLOYEES: -1,
+    COMPANY_REVENUE: -1,
+    # do_not_call gets a default boolean
+    DO_NOT_CALL: False,
+    # intent_signals gets a default empty JSON array
+    INTENT_SIGNALS: "\"[]\"",
+}
 
 '''
 Convert null values (interpreted as None or "nan" from the dataframe into
 a default value that matches the expected data type for that column
+(see CLEAN_DATA_DEFAULTS). Each column is filled in a single vectorized operation.
+The canonical key columns are left as they are, a missing key being an unknown value.
+Returns a new DataFrame, data is left as it is
 '''
-@asset(auto_materialize_policy=wait_for_updated, description="fill in null values with appropriate type")
-def clean_data(query_db_into_dataframe) -> pds.DataFrame:
-    data = query_db_into_dataframe
+def fill_clean_defaults(data):
+    data = data.copy()
 
     # for each column...
     for column in data.columns:
-        num_values = len(data[column])
-        # for each value in that column
-        for index in range(0,num_values):
-            value = data[column][index]
-            if value == None or str(value) == NAN_STR:
-                # convert company_employees and company_revenue to a default integer type if "nan"
-                if column == COMPANY_EMPLOYEES or column == COMPANY_REVENUE:
-                    value = -1
-                # convert do_not_call to a default boolean if None
-                elif column == DO_NOT_CALL:
-                    value = "FALSE"
-                # convert intent_signals to a default empty JSON array
-                elif column == INTENT_SIGNALS:
-                    value = "\"[]\""
-                # otherwise for strings, fill in "N/A"
-                else:
-                    value = NA_STR
-                data[column][index] = value
+        values = data[column]
+        # a date column and a canonical key have no default value
+        if pds.api.types.is_datetime64_any_dtype(values) or column in canonical.CANONICAL_KEY_COLUMNS:
+            continue
+        # find the null values (None, NaN or the "nan" string) of that column
+        missing = values.isna()
+        if values.dtype == object:
+            missing |= values.eq(NAN_STR)
+        if not missing.any():
+            continue
+        # fill them with the default value for that column
+        default = CLEAN_DATA_DEFAULTS.get(column, NA_STR)
+        if isinstance(values.dtype, pds.CategoricalDtype) and default not in values.cat.categories:
+            values = values.cat.add_categories([default])
+        data[column] = values.mask(missing, default)
 
     return data
 
+'''
+Fill in the null values of the combined contacts with the defaults of their columns (see fill_clean_defaults).
+If the post merge stages run in the database, the values are filled in by the clean view instead
+(create_clean_view in query.py) and the name of the view is returned
+'''
+@asset(auto_materialize_policy=wait_for_updated, partitions_def=shard_partitions, description="fill in null values with appropriate type")
+@asset_metrics
+def clean_data(context, query_db_into_dataframe, database: DatabaseResource):
+    if isinstance(query_db_into_dataframe, str):
+        view_name = shard_relation(CLEAN_RELATION, current_shard(context))
+        # persisted into a table, since the extrapolated view reads it twice (for the company combinations and
+        # for the records) and would otherwise evaluate the clean view twice
+        database.run(execute_sql_query, view_name, create_clean_view.format(
+            view_name = view_name, total_combined = query_db_into_dataframe, false = backend.false_literal,
+            keys = key_select("t", COMBINED_EXTRA_COLUMNS)),
+            materialize = True)
+        return view_name
+
+    return fill_clean_defaults(query_db_into_dataframe)
+
+'''
+Choose, for each company name, the combination of the enrichment columns (ENRICHMENT_COLUMNS, the country,
+company_revenue, company_employees and company_industry of Acme) to extrapolate from the records of that company
+that have all of them. The rule is one of:
+1) "first": the combination of the first such record (the original behavior)
+2) "latest": the combination of the such record with the most recent updated_at value
+3) "most_frequent": the combination found in the most such records
+Ties are broken in favor of the record seen first. Returns a DataFrame of ENRICHMENT_COLUMNS indexed by company name
+'''
+def company_attributes(data, rule = EXTRAPOLATION_RULE):
+    # keep only the records that have all the enrichment values (a value is missing if clean_data filled in its default)
+    complete = pds.Series(True, index=data.index)
+    for column in ENRICHMENT_COLUMNS:
+        complete &= data[column] != CLEAN_DATA_DEFAULTS.get(column, NA_STR)
+    candidates = data.loc[complete, [COMPANY_NAME, UPDATED_AT] + ENRICHMENT_COLUMNS]
+
+    if rule == "first":
+        chosen = candidates
+    elif rule == "latest":
+        # a stable sort keeps the records with the same updated_at in the order they were seen
+        chosen = candidates.sort_values(UPDATED_AT, ascending=False, kind="stable")
+    elif rule == "most_frequent":
+        # count each combination per company, in the order the combinations were first seen
+        counts = candidates.groupby([COMPANY_NAME] + ENRICHMENT_COLUMNS, sort=False, observed=True).size().reset_index(name="count")
+        chosen = counts.sort_values("count", ascending=False, kind="stable")
+    else:
+        raise ValueError("Unknown extrapolation rule: " + str(rule))
+
+    # keep the first combination of each company in the chosen order
+    return chosen.drop_duplicates(COMPANY_NAME, keep="first").set_index(COMPANY_NAME)[ENRICHMENT_COLUMNS]
+
+'''
+Order of the complete records of a company for the "first" and "latest" extrapolation rules run in the database,
+the same order as company_attributes (a missing updated_at is sorted last like in pandas)
+'''
+EXTRAPOLATION_ORDERS = {
+    "first": "seen",
+    "latest": "CASE WHEN updated_at IS NULL THEN 1 ELSE 0 END, updated_at DESC, seen",
+}
+
+'''
+Return the query choosing the combination of each company of the clean relation with the rule, like company_attributes
+'''
+def company_attributes_sql(clean, rule = EXTRAPOLATION_RULE):
+    if rule == "most_frequent":
+        return company_attributes_most_frequent_query.format(clean = clean)
+    if rule not in EXTRAPOLATION_ORDERS:
+        raise ValueError("Unknown extrapolation rule: " + str(rule))
+    return company_attributes_query.format(clean = clean, order = EXTRAPOLATION_ORDERS[rule])
+
+'''
+Read the entries of the company dimension with the column types of its schema (empty before the first update)
+'''
+def read_company_dimension(conn):
+    if not relation_exists(conn, backend.check_table_query, companies.COMPANY_DIMENSION):
+        return apply_schema(pds.DataFrame(columns=list(COMPANY_DIMENSION_SCHEMA)), COMPANY_DIMENSION_SCHEMA)
+    return apply_schema(read_query(conn, company_dimension_select), COMPANY_DIMENSION_SCHEMA)
+
+'''
+Merge the records of the enrichment sources that are not in the company dimension yet into it (see companies.py),
+and write back only the entries that changed (updating the entries already stored and inserting the new ones), in a
+single transaction with the fingerprints of the merged records.
+The dimension and the table of the merged fingerprints are created on the first update.
+Returns the number of new records merged and of entries written
+'''
+def update_company_dimension(conn, sources = ENRICHMENT_SOURCES, batch_size = LOAD_BATCH_SIZE):
+    cursor = conn.cursor()
+    if not relation_exists(conn, backend.check_table_query, companies.COMPANY_DIMENSION):
+        cursor.execute(backend.ddl(companies.create_dimension_query(COMPANY_DIMENSION_SCHEMA)))
+        cursor.execute(create_company_dimension_index_query)
+        # the records merged into a previous dimension are merged again into the new one
+        cursor.execute("DROP TABLE IF EXISTS company_dimension_rows")
+        cursor.execute(backend.ddl(create_company_dimension_rows))
+        cursor.execute(create_company_dimension_rows_index_query)
+        conn.commit()
+
+    stored = read_company_dimension(conn).set_index(companies.KEY_COLUMNS)
+    existing_keys = set(stored.index)
+    changed_keys = set()
+    new_records = 0
+    for source in sources:
+        columns = [COMPANY_NAME, COMPANY_DOMAIN, UPDATED_AT] + source.enrichment_columns
+        records = read_query(conn, company_dimension_new_rows_query.format(
+            columns = ", ".join(columns), table = source.table_name, source = source.name))
+        new_records += len(records)
+        if len(records) == 0:
+            continue
+        updates = companies.latest_attributes(apply_schema(records, source.schema), source.name, source.enrichment_columns)
+        entries = companies.merge_attributes(stored, updates, COMPANY_DIMENSION_SCHEMA, source.enrichment_columns)
+        entries = entries.set_index(companies.KEY_COLUMNS)
+        # the next source is merged into the entries updated by this one
+        stored = pds.concat([stored[~stored.index.isin(entries.index)], entries])
+        changed_keys.update(entries.index)
+
+    entries = stored.loc[sorted(changed_keys)].reset_index() if changed_keys else stored.iloc[0:0].reset_index()
+    prepared = prepare_for_insert(entries).drop(columns=[ROW_FINGERPRINT])
+    is_update = entries.set_index(companies.KEY_COLUMNS).index.isin(list(existing_keys))
+    # the values of an update are followed by its key, for the WHERE clause
+    value_columns = [column for column in prepared.columns if column not in companies.KEY_COLUMNS]
+    update_string = company_dimension_update.format(assignments = ", ".join(column + " = ?" for column in value_columns))
+
+    cursor.execute(backend.begin_transaction)
+    try:
+        insert_in_batches(cursor, update_string, rows_for_insert(prepared.loc[is_update, value_columns + companies.KEY_COLUMNS]),
+                          batch_size)
+        insert_in_batches(cursor, parameterized_insert(company_dimension_insert, len(prepared.columns)),
+                          rows_for_insert(prepared[~is_update]), batch_size)
+        # the records of the tables are now all merged
+        for source in sources:
+            cursor.execute(company_dimension_rows_delete % source.name)
+            cursor.execute(company_dimension_rows_insert % (source.name, source.table_name))
+        cursor.execute(backend.commit_transaction)
+    except Exception:
+        cursor.execute(backend.rollback_transaction)
+        raise
+    conn.commit()
+
+    return {"records": new_records, "entries": len(entries)}
+
+'''
+Update the company dimension with the records of the enrichment sources loaded since its last update (see
+update_company_dimension). The dimension is kept across runs, so a company left out of a later Acme file keeps the
+values learned from the earlier files. The number of new records merged and of entries written is attached to the
+materialization
+'''
+@asset(auto_materialize_policy=wait_for_updated, deps=[SOURCE_ASSETS[source.name].load for source in ENRICHMENT_SOURCES],
+       description="Update the company dimension")
+@asset_metrics
+def company_dimension(database: DatabaseResource):
+    summary = database.run(update_company_dimension)
+    add_asset_metadata({"rows_in": MetadataValue.int(summary["records"]),
+                        "rows_out": MetadataValue.int(summary["entries"])})
+
+'''
+Fill in the company columns of the records of data from the company dimension (see companies.CompanyLookup): one
+lookup of the company domain, then of the company name, per record. The values the dimension does not know are
+left as they are
+'''
+def enrich_from_dimension(data, dimension):
+    lookup = companies.CompanyLookup(dimension)
+    located = lookup.locate(data)
+    for column in ENRICHMENT_COLUMNS:
+        values, found = lookup.values(located, column)
+        enriched = pds.Series(values, index=data.index).where(found, data[column].astype(object))
+        data[column] = apply_schema(enriched.to_frame(column), {column: TOTAL_COMBINED_SCHEMA[column]})[column]
+    return data
+
 '''
 Fill in missing country, company_employees, company_revenue, and company_industry fields based on other records corresponding
 to the same company that have those values specific to those columns specified
 1) Name: “Full Name”, Company Name: “SemiConductors Inc.”Country: “USA”, Company Employees: 1000, Company Revenue: 1000000, Company Industry “Semi Conductors”
 2) Name: “Full Name 2”, Company Name: “SemiConductors Inc.”, Country: “N/A”, Company Employees: -1, Company Revenue: -1, Company Industry: “N/A”
 We can fill in Country, Company Employees, Company Revenue and Company Industry for the second record since we can infer them from the first record that has the same company name
+The combination of each company is found in one grouped pass (see company_attributes) and broadcast back to
+all the records of that company.
+With use_company_dimension set, the values are taken from the company dimension instead (see enrich_from_dimension).
+If the post merge stages run in the database, the combinations are chosen and joined back by the extrapolated view
+instead (see company_attributes_sql, or the company dimension) and the name of the view is returned
 '''
-@asset(auto_materialize_policy=wait_for_updated, description="Extrapolate for Acme only columns")
-def extrapolate_data(clean_data) -> pds.DataFrame:
-    data = clean_data
-
-    # get list of all company values from the "company_name" column
-    company_names_list = data[COMPANY_NAME]
-
-    # create a set that eliminates duplicate values
-    company_names_set = set(company_names_list)
-
-    # create a dictionary with a key having the company name, and a set containing the records with that company name
-    company_dictionary = {}
-
-    # initialize all key value pairs of the dictionary to an empty list
-    for element in company_names_set:
-        company_dictionary[element] = []        
-
-    # for each company name in the company name list...
-    for i in range(0, len(company_names_list)):
-        # get the country, company_revenue, company_employees, and company_industry values for that company
-        country = data[COUNTRY][i]
-        company_revenue = data[COMPANY_REVENUE][i]
-        company_employees = data[COMPANY_EMPLOYEES][i]
-        company_industry =  data[COMPANY_INDUSTRY][i]
-        # add this combination as a value in the list corresponding to the company name key
-        company_dictionary[company_names_list[i]].append([country, company_revenue, company_employees, company_industry])
-
-    # leave out all companies in the list that have null values
-    for element in company_names_set:
-        dict_element = company_dictionary[element]
-        company_dictionary[element] = [value for value in dict_element if value[0] != NA_STR and value[1] != -1 and value[2] != -1 and value[3] != NA_STR]
-
-    # for each non-null value in the company lists for each company name,
-    # choose the remaining combination, which is supposed to have the values we want to put
-    # in the empty fields (extrapolate the data)
-    for i in range(0, len(company_names_list)):
-        company_name = company_names_list[i]
-        if len(company_dictionary[company_name]) > 0:
-            for c in range(0, len(ACME_COLUMNS)):
-               data[ACME_COLUMNS[c]][i] = company_dictionary[company_name][0][c]
-               
+@asset(auto_materialize_policy=wait_for_updated, partitions_def=shard_partitions, deps=[company_dimension] if USE_COMPANY_DIMENSION else [],
+       description="Extrapolate for Acme only columns")
+@asset_metrics
+def extrapolate_data(context, clean_data, database: DatabaseResource):
+    if isinstance(clean_data, str):
+        view_name = shard_relation(EXTRAPOLATED_RELATION, current_shard(context))
+        if USE_COMPANY_DIMENSION:
+            view_query = create_dimension_extrapolated_view.format(view_name = view_name, clean = clean_data,
+                                                                   keys = key_select("c", COMBINED_EXTRA_COLUMNS))
+        else:
+            view_query = create_extrapolated_view.format(
+                view_name = view_name, clean = clean_data, attributes = company_attributes_sql(clean_data),
+                keys = key_select("c", COMBINED_EXTRA_COLUMNS))
+        database.run(execute_sql_query, view_name, view_query)
+        return view_name
+
+    data = clean_data.copy()
+
+    if USE_COMPANY_DIMENSION:
+        return enrich_from_dimension(data, database.run(read_company_dimension))
+
+    attributes = company_attributes(data)
+
+    # position of the company of each record in attributes (-1 if the company has no combination to extrapolate),
+    # so the company names are only looked up once for all four columns
+    positions = attributes.index.get_indexer(data[COMPANY_NAME])
+    has_attributes = positions >= 0
+
+    # set the values of the combination chosen for the company of each record, keeping the column types
+    for column in ENRICHMENT_COLUMNS:
+        chosen = pds.Series(attributes[column].array.take(positions, allow_fill=True), index=data.index)
+        data[column] = chosen.where(has_attributes, data[column])
+
     return data
 
+'''
+Merge the records of data that have the same values for the key columns into one record per key (the records
+missing a key value are merged with each other, like the records with the same unknown value),
+in the order each key first appears in data. The merged record takes all its values from the latest record
+(greatest updated_at, the last one seen if several records share it), except for created_at which is the
+smallest created_at of the records. For instance, with the key columns (name, phone_number):
+
+{name: "name1", phone_number: "555", title: "IC", updated_at: "2023-12-21", created_at: "2023-12-20"}
+{name: "name1", phone_number: "555", title: "CTO", updated_at: "2023-12-31", created_at: "2023-12-30"}
+
+are merged into:
+
+{name: "name1", phone_number: "555", title: "CTO", updated_at: "2023-12-31", created_at: "2023-12-20"}
+
+The merged record of a key takes the smallest cluster of its records too, if data has a cluster column (see
+COMBINED_EXTRA_COLUMNS), so that it keeps its identity whichever of its records is the latest.
+
+Only a few integer arrays are built next to data: one group number per record, the position of the
+latest record of each group and the smallest created_at (and cluster) of each group
+'''
+def merge_duplicate_contacts(data, key_columns):
+    # number the groups in the order their key first appears
+    group_ids = data.groupby(key_columns, sort=False, dropna=False).ngroup().to_numpy()
+
+    # order the records by group, then by updated_at (a stable sort keeps the order the records
+    # were seen in for the same updated_at), and take the last record of each group
+    ordering = pds.DataFrame({"group": group_ids, UPDATED_AT: data[UPDATED_AT].to_numpy()})
+    ordering = ordering.sort_values(["group", UPDATED_AT], kind="stable")
+    latest_positions = ordering.drop_duplicates("group", keep="last").index.to_numpy()
+
+    # smallest created_at of each group, indexed by group number
+    min_created = data[CREATED_AT].groupby(group_ids).min()
+
+    merged = data.iloc[latest_positions].reset_index(drop=True)
+    merged[CREATED_AT] = min_created.to_numpy()
+    if clustering.CLUSTER in data.columns:
+        merged[clustering.CLUSTER] = data[clustering.CLUSTER].groupby(group_ids).min().to_numpy()
+
+    return merged
+
 '''
 Try to merge rows that have common name and phone number (might decrease data quality if two different
-individuals (contacts) have the same name and phone number)
-'''
-@asset(auto_materialize_policy=wait_for_updated, description="Combine based on phone numbers")
-def combine_post_merge(extrapolate_data) -> pds.DataFrame:
-    data = extrapolate_data
-
-    # get final list of records
-    final_data_list = []
-
-    # key is tuple of name and phone number
-    # values are entire records for that combination
-    phone_number_dictionary = {}
-
-    # result that contains one record for that that
-    # key pair above in the last statement
-    phone_number_final_values_dictionary = {}
-
-    # for each row in the dataframe
-    for index in data.index:
-        key = (data[NAME][index], data[PHONE_NUMBER][index])
-        # append record to list for the tuple key
-        if key in phone_number_dictionary.keys():
-            phone_number_dictionary[key].append(data.iloc[index])
-        # create list with only the record
-        else:
-            phone_number_dictionary[key] = [data.iloc[index]]
-
-    # for each key in the dictionary filled above
-    for key in phone_number_dictionary.keys():
-        # result dictionary after merge
-        phone_number_final_values_dictionary[key] = {}
-        # get value for key in phone_number_dictionary
-        value = phone_number_dictionary[key]
-        # get the max updated_at date for the records for that tuple key value pair
-        max_udate = max_udate_in_row(value)
-        # get the min created_at date for the records for that tuple key value pair
-        min_cdate = min_cdate_in_row(value)
-        # for each record for that tuple key
-        for item in value:
-            # find record with latest latest date
-            if to_date_time(item[UPDATED_AT]) == max_udate:
-               # set the field to the latest record's row value
-               for column in data.columns:
-                   # for each non date value...
-                   if column is not UPDATED_AT and column is not CREATED_AT:
-                       phone_number_final_values_dictionary[key][column] = item[column]
-                   # and for the maximum updated_at value
-                   elif column == UPDATED_AT:
-                       phone_number_final_values_dictionary[key][UPDATED_AT] = max_udate
-                   # and for the minimum created_at value
-                   elif column == CREATED_AT:
-                       phone_number_final_values_dictionary[key][CREATED_AT] = min_cdate
-
-    # build list for final combination of records
-    for key in phone_number_final_values_dictionary:
-        final_data_list.append(phone_number_final_values_dictionary[key])
-
-    # return DataFrame of that list
-    return pds.DataFrame(final_data_list)
-
-'''
-Add the unique contacts_id column to the final dataframe, and store the end result in a csv file.
+individuals (contacts) have the same name and phone number). The columns used as the merge key are set in config.py,
+and compared through their canonical keys (see POST_MERGE_KEYS), so that a phone number written "(521)338-6604" in one
+source and "+1-521-338-6604" in another still merges.
+If the post merge stages run in the database, the records are merged by the post merge view (create_post_merge_view
+in query.py) and the name of the view is returned
+'''
+@asset(auto_materialize_policy=wait_for_updated, partitions_def=shard_partitions, description="Combine based on phone numbers")
+@asset_metrics
+def combine_post_merge(context, extrapolate_data, database: DatabaseResource):
+    if isinstance(extrapolate_data, str):
+        view_name = shard_relation(MERGED_RELATION, current_shard(context))
+        database.run(execute_sql_query, view_name, create_post_merge_view.format(
+            view_name = view_name, extrapolated = extrapolate_data, key_columns = ", ".join(POST_MERGE_KEYS)))
+        return view_name
+    return merge_duplicate_contacts(extrapolate_data, POST_MERGE_KEYS)
+
+'''
+Assemble the contacts of the shards resolved by the partitions of combine_post_merge (a dict of DataFrames, one per
+shard) into one DataFrame, in name order like the contacts resolved without partitions
+'''
+def assemble_shards(shard_contacts):
+    contacts = pds.concat([shard_contacts[shard] for shard in sorted(shard_contacts, key=int)], ignore_index=True)
+    return contacts.sort_values(NAME, kind="stable").reset_index(drop=True)
+
+'''
+Return the rows of a query as DataFrames of fetch_size rows with the column types of schema, fetched one at a time
+through a cursor of the connection. A query without any row returns one empty DataFrame
+'''
+def fetch_query_chunks(conn, query, schema, fetch_size = DATABASE_FETCH_SIZE):
+    cursor = conn.cursor()
+    cursor.execute(query)
+    columns = [description[0] for description in cursor.description]
+
+    first_chunk = True
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows and not first_chunk:
+            return
+        yield apply_schema(pds.DataFrame.from_records(rows, columns=columns), schema)
+        first_chunk = False
+        if not rows:
+            return
+
+'''
+Read the identity map of the output persisted by the previous run (empty before the first run)
+'''
+def read_identity_map(conn):
+    if not relation_exists(conn, backend.check_table_query, "contact_ids"):
+        return pds.DataFrame({output.IDENTITY_KEY: [], output.CONTACT_ID: [], output.ROW_HASH: [], output.ACTIVE: []})
+    return read_query(conn, contact_ids_select)
+
+'''
+Replace the persisted identity map of the output with the identity map of this run, in a single transaction
+'''
+def write_identity_map(conn, identity_map, batch_size = LOAD_BATCH_SIZE):
+    cursor = conn.cursor()
+    if not relation_exists(conn, backend.check_table_query, "contact_ids"):
+        cursor.execute(backend.ddl(create_contact_ids))
+        conn.commit()
+
+    # plain Python values, which every database driver can bind
+    rows = list(zip(identity_map[output.IDENTITY_KEY].tolist(), identity_map[output.CONTACT_ID].tolist(),
+                    identity_map[output.ROW_HASH].tolist(), identity_map[output.ACTIVE].tolist()))
+
+    cursor.execute(backend.begin_transaction)
+    try:
+        cursor.execute("DELETE FROM contact_ids")
+        insert_in_batches(cursor, contact_ids_insert, rows, batch_size)
+        cursor.execute(backend.commit_transaction)
+    except Exception:
+        cursor.execute(backend.rollback_transaction)
+        raise
+    conn.commit()
+
+'''
+Write the output files of the merged contacts (a DataFrame, or the query streaming them from the post merge views)
+with their stable contact_id in place of their cluster (see output.py), then persist the identity map for the next run. The files are
+only rewritten from scratch, so the whole write can be retried on a fresh connection. Returns the output summary
+of write_contacts
+'''
+def write_output(conn, contacts):
+    identities = output.ContactIdentities(read_identity_map(conn), clustering.CLUSTER)
+    chunks = fetch_query_chunks(conn, contacts, TOTAL_COMBINED_SCHEMA) if isinstance(contacts, str) else [contacts]
+    summary, identity_map = output.write_contacts(chunks, identities, OUTPUT_SNAPSHOT_PATH, OUTPUT_CHANGESET_PATH,
+                                                  OUTPUT_FORMAT, OUTPUT_COMPRESSION)
+    write_identity_map(conn, identity_map)
+    return summary
+
+'''
+Return the query streaming the merged contacts of the post merge views (one view, or a dict of views by shard)
+in name order: the order in which query_db_into_dataframe reads the contacts (see the seen column of the views)
+for one view, and by name across the shards like assemble_shards
+'''
+def merged_contacts_sql(merged_views):
+    if isinstance(merged_views, str):
+        return merged_contacts_query.format(relations = "SELECT * FROM " + merged_views, order = "seen")
+    relations = " UNION ALL ".join("SELECT * FROM " + merged_views[shard] for shard in sorted(merged_views, key=int))
+    return merged_contacts_query.format(relations = relations, order = "name, seen")
+
+'''
+Add the contact_id column to the final dataframe, and store the end result in the snapshot file
+(current_state_final.csv by default), with the changeset of the run next to it (see output.py). The contact_id
+of a contact stays the same across runs, so that the downstream systems can apply the changeset instead of
+reloading the whole snapshot.
+In the partitioned mode, the shards are assembled first, so contact_id is unique over all the shards.
+If the post merge stages ran in the database, the merged contacts are streamed from the post merge view
+(or views, one per shard) into the files instead (see fetch_query_chunks)
 '''
 @asset(auto_materialize_policy=wait_for_updated, description="Store data into CSV file")
-def create_csv(combine_post_merge):
-    combine_post_merge.insert(loc=0, column=CONTACT_ID, value=list(range(0,len(combine_post_merge))))
-    combine_post_merge.to_csv('current_state_final.csv', index=False)
\ No newline at end of file
+@asset_metrics
+def create_csv(combine_post_merge, database: DatabaseResource):
+    if isinstance(combine_post_merge, str) or (isinstance(combine_post_merge, dict) and
+                                               all(isinstance(view, str) for view in combine_post_merge.values())):
+        contacts = merged_contacts_sql(combine_post_merge)
+    elif isinstance(combine_post_merge, dict):
+        contacts = assemble_shards(combine_post_merge)[list(TOTAL_COMBINED_SCHEMA) + [clustering.CLUSTER]]
+    else:
+        # the canonical keys of the post merge are not part of the output, the cluster identifies each contact
+        contacts = combine_post_merge[list(TOTAL_COMBINED_SCHEMA) + [clustering.CLUSTER]]
+    summary = database.run(write_output, contacts)
+    add_asset_metadata({"rows_out": MetadataValue.int(summary["contacts"]),
+                        "changes": MetadataValue.json({change: summary[change] for change in
+                                                       [output.INSERTED, output.UPDATED, output.RETIRED]})})
+
+'''
+Read the contacts of a source table (or view), their canonical keys and contact key (see canonical.py) into a
+DataFrame with the column types of its schema and a source column holding the name of the source, in the order of
+their contact keys
+'''
+def read_source_contacts(conn, table_name, schema, source):
+    columns = list(schema) + canonical.CANONICAL_KEY_COLUMNS + [canonical.CONTACT_KEY]
+    data = read_query(conn, "SELECT " + ", ".join(columns) + " FROM " + table_name + " ORDER BY " + canonical.CONTACT_KEY)
+    data = apply_schema(data, schema)
+    data.insert(loc=0, column=SOURCE, value=source)
+    return data
+
+'''
+Columns of the source_contacts table gathering the contacts of all the sources in the database: the record id and the
+source of each contact, the columns of the combined contacts (null for the columns its source doesn't have), then its
+canonical keys and contact key
+'''
+SOURCE_CONTACTS_SCHEMA = {blocking.RECORD: INTEGER, SOURCE: STRING, **TOTAL_COMBINED_SCHEMA}
+
+'''
+Replace the source_contacts table with the contacts of all the sources (only the contacts of the resolved_contacts
+table if resolved_only is set, see resolve_scope), numbered from 0 in source order then contact key order like the
+rows of the DataFrame returned by source_contacts, and index its record ids and the canonical keys the contacts are
+matched on. The contacts are copied by the database, none is read
+'''
+def write_source_contacts(conn, resolved_only = False, sources = SOURCES):
+    drop_relation(conn, SOURCE_CONTACTS_RELATION)
+
+    cursor = conn.cursor()
+    cursor.execute(backend.ddl(create_table_query(SOURCE_CONTACTS_RELATION, SOURCE_CONTACTS_SCHEMA,
+                                                  extra_columns = {**{column: canonical.KEY_SQL_TYPE for column in canonical.CANONICAL_KEY_COLUMNS},
+                                                                   canonical.CONTACT_KEY: canonical.CONTACT_KEY_SQL_TYPE})))
+    conn.commit()
+
+    # the record ids of each source start after the contacts of the sources before it
+    where = resolved_contacts_filter if resolved_only else ""
+    first_records = [0]
+    for source in sources:
+        first_records.append(first_records[-1] + (read_query(conn, resolved_contacts_count_query % source.contacts_relation).iloc[0, 0]
+                                                  if resolved_only else count_rows(conn, source.contacts_relation)))
+
+    cursor.execute(backend.begin_transaction)
+    try:
+        for source, first_record in zip(sources, first_records):
+            columns = [column if column in source.schema else "NULL" for column in TOTAL_COMBINED_SCHEMA] + \
+                      canonical.CANONICAL_KEY_COLUMNS + [canonical.CONTACT_KEY]
+            cursor.execute(source_contacts_insert_query.format(first_record = first_record, source = source.name,
+                                                               columns = ", ".join(columns), relation = source.contacts_relation,
+                                                               where = where))
+        for column in [blocking.RECORD] + canonical.INDEXED_KEY_COLUMNS:
+            cursor.execute(create_stage_index_query % (SOURCE_CONTACTS_RELATION, column, SOURCE_CONTACTS_RELATION, column))
+        cursor.execute(backend.commit_transaction)
+    except Exception:
+        cursor.execute(backend.rollback_transaction)
+        raise
+
+    cursor.execute(backend.update_statistics_query % SOURCE_CONTACTS_RELATION)
+    conn.commit()
+
+'''
+Read the given columns of the contacts of the source_contacts table into a DataFrame indexed by record id, fetched
+database_fetch_size rows at a time. If record_filter is set, only the records of each chunk it selects are kept
+'''
+def read_match_records(conn, columns, record_filter = None):
+    query = "SELECT " + ", ".join([blocking.RECORD] + columns) + " FROM " + SOURCE_CONTACTS_RELATION + " ORDER BY " + blocking.RECORD
+    schema = {column: TOTAL_COMBINED_SCHEMA[column] for column in columns if column in TOTAL_COMBINED_SCHEMA}
+    chunks = []
+    for chunk in fetch_query_chunks(conn, query, schema):
+        chunk = chunk.set_index(blocking.RECORD)
+        chunks.append(chunk if record_filter is None else chunk[record_filter(chunk)])
+    return pds.concat(chunks)
+
+'''
+Return the records a matching asset works on: source_contacts itself (the DataFrame of the contacts of all the
+sources, with the columns of the input of the asset), or if it is the name of the source_contacts table (see
+golden_records_in_database in config.py), the given columns of the table. record_filter, if set, returns whether the
+asset needs each record of a DataFrame of records, e.g. only the records of the blocks of its shard
+'''
+def match_records(source_contacts, columns, database, record_filter = None):
+    if isinstance(source_contacts, str):
+        return database.run(read_match_records, columns, record_filter)
+    if record_filter is None:
+        return source_contacts
+    return source_contacts[record_filter(source_contacts)]
+
+'''
+Return the filter of match_records keeping the records with a block of the shard of the partition being run, for
+the inverted indexes of key_names (see records_in_shard in blocking.py), or None outside of the partitioned mode
+'''
+def shard_record_filter(shard, key_names):
+    if shard is None:
+        return None
+    return lambda records: blocking.records_in_shard(records, key_names, shard, PARTITION_COUNT)
+
+'''
+Concatenate the pairs of the partitions of a matching asset read by an unpartitioned asset (a dict of DataFrames by
+partition), without the pairs found in more than one shard. An unpartitioned output is returned as it is
+'''
+def combine_pair_partitions(pairs):
+    if isinstance(pairs, pds.DataFrame):
+        return pairs
+    return pds.concat([pairs[shard] for shard in sorted(pairs, key=int)], ignore_index=True) \
+              .drop_duplicates(subset=MATCH_EDGE_COLUMNS).reset_index(drop=True)
+
+'''
+Return the candidate pairs that satisfy the exact match predicate the sources were joined on by the combined views,
+on the canonical keys of the fields (see canonical.py): same name key (or one of the names is unknown), same email
+key, and same company name or company domain key
+'''
+def exact_match_pairs(records, pairs):
+    left = records.loc[pairs[LEFT]].reset_index(drop=True).astype(object)
+    right = records.loc[pairs[RIGHT]].reset_index(drop=True).astype(object)
+
+    same_name = (left[canonical.NAME_KEY] == right[canonical.NAME_KEY]) | left[canonical.NAME_KEY].isna() | right[canonical.NAME_KEY].isna()
+    same_email = left[canonical.EMAIL_KEY] == right[canonical.EMAIL_KEY]
+    same_company = (left[COMPANY_NAME] == right[COMPANY_NAME]) | \
+                   (left[canonical.COMPANY_DOMAIN_KEY] == right[canonical.COMPANY_DOMAIN_KEY])
+
+    return pairs[(same_name & same_email & same_company).to_numpy()].reset_index(drop=True)
+
+'''
+Columns of the contacts of the sources read to find the scope of the resolution of a delta load: the contact key and
+the canonical keys of the blocking keys (see resolution_scope in clustering.py)
+'''
+SCOPE_COLUMNS = [canonical.CONTACT_KEY, canonical.EMAIL_KEY, canonical.PHONE_KEY, canonical.COMPANY_DOMAIN_KEY]
+
+'''
+Write the scope of the resolution of a delta load that touched the contacts of affected_keys (see
+affected_contact_keys): the contacts to resolve again (resolved_contacts table), the clusters of the previous golden
+records they replace (resolved_clusters table, see resolution_scope in clustering.py) and the blocks of the
+candidate pairs oversized among all the contacts (oversized_blocks table), which candidate_pairs skips since it only
+sees the resolved contacts. Only the contact key and the canonical keys of the blocking keys of the contacts and the
+clusters of the previous golden records are read, database_fetch_size rows at a time.
+
+Every contact is resolved after a full reload (affected_keys is None) or before the first golden records: then the
+tables are dropped, and None is returned. Otherwise the set of the contact keys of the contacts to resolve again
+is returned
+'''
+def resolve_scope(conn, affected_keys, sources = SOURCES, batch_size = LOAD_BATCH_SIZE):
+    for name in [RESOLVED_CONTACTS_RELATION, RESOLVED_CLUSTERS_RELATION, OVERSIZED_BLOCKS_RELATION]:
+        drop_relation(conn, name)
+    if affected_keys is None or not relation_exists(conn, backend.check_table_query, GOLDEN_MEMBERS_RELATION):
+        return None
+
+    schema = {column: STRING for column in SCOPE_COLUMNS}
+    records = pds.concat([chunk for source in sources
+                          for chunk in fetch_query_chunks(conn, "SELECT " + ", ".join(SCOPE_COLUMNS) + " FROM " + source.contacts_relation, schema)],
+                         ignore_index=True)
+    members = pds.concat(list(fetch_query_chunks(conn, golden_record_members_select, {})), ignore_index=True)
+
+    key_names = list(dict.fromkeys(EXACT_MATCH_BLOCKING_KEYS + (BLOCKING_KEYS if CLUSTER_FUZZY_MATCHES else [])))
+    resolved, clusters = clustering.resolution_scope(records, members, affected_keys, key_names)
+    resolved_keys = set(records[canonical.CONTACT_KEY][resolved])
+    oversized = [(key_name, block_key) for key_name in (BLOCKING_KEYS if CLUSTER_FUZZY_MATCHES and MAX_BLOCK_SIZE is not None else [])
+                 for block_key in blocking.oversized_blocks(records, key_name, MAX_BLOCK_SIZE)]
+
+    cursor = conn.cursor()
+    for create_string in [create_resolved_contacts, create_resolved_clusters, create_oversized_blocks]:
+        cursor.execute(backend.ddl(create_string))
+    conn.commit()
+
+    cursor.execute(backend.begin_transaction)
+    try:
+        insert_in_batches(cursor, resolved_contacts_insert, [(key,) for key in sorted(resolved_keys)], batch_size)
+        insert_in_batches(cursor, resolved_clusters_insert, [(cluster,) for cluster in sorted(clusters)], batch_size)
+        insert_in_batches(cursor, oversized_blocks_insert, oversized, batch_size)
+        cursor.execute(create_resolved_contacts_index_query)
+        cursor.execute(create_resolved_clusters_index_query)
+        cursor.execute(backend.commit_transaction)
+    except Exception:
+        cursor.execute(backend.rollback_transaction)
+        raise
+    conn.commit()
+
+    get_dagster_logger().info("delta load: %d affected contacts, %d of %d contacts and %d golden records resolved again" %
+                              (len(affected_keys), len(resolved_keys), len(records), len(clusters)))
+    return resolved_keys
+
+'''
+Return the blocks skipped by candidate_pairs (see oversized_blocks in blocking.py) after a delta load, by index name,
+or None if every contact is resolved (see resolve_scope)
+'''
+def read_oversized_blocks(conn):
+    if not relation_exists(conn, backend.check_table_query, OVERSIZED_BLOCKS_RELATION):
+        return None
+    blocks = read_query(conn, oversized_blocks_select)
+    return {key_name: block_keys.tolist() for key_name, block_keys in blocks.groupby("block_index")["block_key"]}
+
+'''
+Gather the contacts of all the sources of the registry (after their duplicates are resolved) into one DataFrame,
+one row per contact with its canonical keys and contact key, for candidate generation. The index label of a contact
+is its record id. If the golden records are resolved in the database (see golden_records_in_database in config.py),
+the contacts are gathered into the source_contacts table instead (see write_source_contacts) and the name of the
+table is returned.
+
+load_summaries holds the load summary passed on by the asset making the contacts of each source ready (see
+SOURCE_CONTACTS_ASSETS), by asset name. After a delta load, only the contacts of the golden records the load touched
+are gathered (see resolve_scope), and golden_records replaces the golden records of these contacts only
+'''
+@asset(auto_materialize_policy=wait_for_updated,
+       ins={contacts_asset.key.path[-1]: AssetIn(contacts_asset.key) for contacts_asset in SOURCE_CONTACTS_ASSETS.values()},
+       description="Gather contacts of all sources")
+@asset_metrics
+def source_contacts(database: DatabaseResource, **load_summaries):
+    resolved_keys = database.run(resolve_scope, affected_contact_keys(*load_summaries.values()))
+    if GOLDEN_RECORDS_IN_DATABASE:
+        database.run(write_source_contacts, resolved_keys is not None)
+        add_asset_metadata({"rows_out": MetadataValue.int(database.run(count_rows, SOURCE_CONTACTS_RELATION))})
+        return SOURCE_CONTACTS_RELATION
+    contacts = pds.concat([database.run(read_source_contacts, source.contacts_relation, source.schema, source.name)
+                           for source in SOURCES], ignore_index=True)
+    if resolved_keys is not None:
+        contacts = contacts[contacts[canonical.CONTACT_KEY].isin(resolved_keys)].reset_index(drop=True)
+    return contacts
+
+'''
+Build the inverted indexes of the blocking keys set in config.py over the contacts of all sources and
+return the pairs of contacts from different sources that share at least one block (see blocking.py), scored by
+fuzzy_matches.
+Blocks larger than the maximum block size set in config.py are skipped. The block statistics of each index
+are logged. If cluster_fuzzy_matches is not set in config.py, nothing would use the pairs, so none is generated.
+In the partitioned mode, each partition only reads the records of the blocks of its shard and pairs these blocks
+(the blocks are sharded by the hash of their block key, see blocking.py). After a delta load, the blocks oversized
+among all the contacts are skipped too (see resolve_scope)
+'''
+@asset(auto_materialize_policy=wait_for_updated, partitions_def=shard_partitions,
+       ins={"source_contacts": AssetIn(metadata={"columns": CANDIDATE_PAIR_COLUMNS})},
+       description="Generate candidate pairs with blocking")
+@asset_metrics
+def candidate_pairs(context, source_contacts, database: DatabaseResource) -> pds.DataFrame:
+    if not CLUSTER_FUZZY_MATCHES:
+        get_dagster_logger().info("cluster_fuzzy_matches is not set, no candidate pair generated")
+        return blocking.empty_pairs()
+    shard = current_shard(context)
+    records = match_records(source_contacts, CANDIDATE_PAIR_COLUMNS, database, shard_record_filter(shard, BLOCKING_KEYS))
+    pairs, statistics = blocking.candidate_pairs(records, BLOCKING_KEYS, MAX_BLOCK_SIZE, shard = shard, shard_count = PARTITION_COUNT,
+                                                 skipped_blocks = database.run(read_oversized_blocks))
+    for key_name, key_statistics in statistics.items():
+        get_dagster_logger().info("blocking key %s: %s" % (key_name, key_statistics))
+    return pairs
+
+'''
+Blocking key of the exact matches: two contacts that match exactly have the same email key, so they share a block
+of the email index, which is built on the email keys (see normalized_email in blocking.py)
+'''
+EXACT_MATCH_BLOCKING_KEYS = ["email"]
+
+'''
+Match the contacts of all sources with the exact match predicate (see exact_match_pairs). The predicate only runs
+over the pairs of contacts from different sources that share an email block instead of over every pair of contacts.
+Unlike candidate_pairs, no email block is skipped for its size, so every exact match is found whatever
+max_block_size is set to in config.py. In the partitioned mode, each partition matches the email blocks of its shard
+'''
+@asset(auto_materialize_policy=wait_for_updated, partitions_def=shard_partitions,
+       ins={"source_contacts": AssetIn(metadata={"columns": EXACT_MATCH_COLUMNS})},
+       description="Match contacts exactly")
+@asset_metrics
+def exact_matches(context, source_contacts, database: DatabaseResource) -> pds.DataFrame:
+    shard = current_shard(context)
+    records = match_records(source_contacts, EXACT_MATCH_COLUMNS, database, shard_record_filter(shard, EXACT_MATCH_BLOCKING_KEYS))
+    pairs, _ = blocking.candidate_pairs(records, EXACT_MATCH_BLOCKING_KEYS, max_block_size = None, shard = shard, shard_count = PARTITION_COUNT)
+    return exact_match_pairs(records, pairs)
+
+'''
+Score the candidate pairs with the fuzzy similarity of their name, phone number and email domain (see scoring.py),
+so that near-duplicates such as "Jon"/"John" or differently formatted phone numbers can be merged.
+The thresholds of each field are set in config.py. Returns every scored pair with its match decision,
+and logs the number of pairs scored per second. If cluster_fuzzy_matches is not set in config.py, the golden records
+don't use the fuzzy matches, so no pair is scored. Only the records of the candidate pairs are read, so in the
+partitioned mode each partition scores the candidate pairs of its shard with the records of its blocks only
+'''
+@asset(auto_materialize_policy=wait_for_updated, partitions_def=shard_partitions,
+       ins={"source_contacts": AssetIn(metadata={"columns": FUZZY_MATCH_COLUMNS}),
+            "candidate_pairs": AssetIn()},
+       description="Score candidate pairs with fuzzy similarity")
+@asset_metrics
+def fuzzy_matches(source_contacts, candidate_pairs, database: DatabaseResource) -> pds.DataFrame:
+    if not CLUSTER_FUZZY_MATCHES:
+        return scoring.empty_scores()
+    paired = pds.unique(pds.concat([candidate_pairs[LEFT], candidate_pairs[RIGHT]]))
+    records = match_records(source_contacts, FUZZY_MATCH_COLUMNS, database, lambda records: records.index.isin(paired))
+    scored, pairs_per_second = scoring.score_pairs(records, candidate_pairs, FUZZY_THRESHOLDS, batch_size = SCORING_BATCH_SIZE)
+    get_dagster_logger().info("scored %d candidate pairs (%.0f pairs/sec), %d matches" %
+                              (len(scored), pairs_per_second, scored[scoring.MATCH].sum()))
+    return scored
+
+'''
+Columns of the golden_records table: the fields of each golden record, the number of contacts it resolves, its shard
+in the partitioned mode (see assign_golden_shards), its cluster (the smallest contact key of its contacts, which
+stays the same across loads as long as its contacts do), then the canonical keys of the post merge
+'''
+GOLDEN_RECORD_SCHEMA = {**TOTAL_COMBINED_SCHEMA, clustering.RECORD_COUNT: INTEGER, sharding.SHARD: INTEGER}
+GOLDEN_RECORD_EXTRA_COLUMNS = {clustering.CLUSTER: canonical.CONTACT_KEY_SQL_TYPE, **{column: canonical.KEY_SQL_TYPE for column in COMBINED_KEY_COLUMNS}}
+GOLDEN_RECORD_COLUMNS = list(GOLDEN_RECORD_SCHEMA) + list(GOLDEN_RECORD_EXTRA_COLUMNS)
+
+'''
+Replace the golden_records and golden_record_members tables with empty ones
+'''
+def create_golden_records_tables(conn):
+    drop_relation(conn, GOLDEN_RECORDS_RELATION)
+    drop_relation(conn, GOLDEN_MEMBERS_RELATION)
+    cursor = conn.cursor()
+    cursor.execute(backend.ddl(create_table_query(GOLDEN_RECORDS_RELATION, GOLDEN_RECORD_SCHEMA, extra_columns = GOLDEN_RECORD_EXTRA_COLUMNS)))
+    cursor.execute(backend.ddl(create_golden_record_members))
+    conn.commit()
+
+'''
+Prepare the golden_records and golden_record_members tables for the golden records of a resolution, in its
+transaction: after a delta load (incremental is set), the golden records of the clusters resolved again (see
+resolve_scope) are deleted, otherwise the tables are replaced with empty ones beforehand (see
+create_golden_records_tables) and nothing is done
+'''
+def delete_resolved_clusters(cursor, incremental):
+    if incremental:
+        cursor.execute(delete_resolved_clusters_query % GOLDEN_RECORDS_RELATION)
+        cursor.execute(delete_resolved_clusters_query % GOLDEN_MEMBERS_RELATION)
+
+'''
+Index the clusters of the golden_records and golden_record_members tables filled by a full resolution (the indexes
+of an incremental resolution are already there)
+'''
+def create_golden_records_indexes(cursor, incremental):
+    if not incremental:
+        cursor.execute(create_stage_index_query % (GOLDEN_RECORDS_RELATION, clustering.CLUSTER, GOLDEN_RECORDS_RELATION, clustering.CLUSTER))
+        cursor.execute(create_golden_record_members_index_query)
+
+'''
+Store the golden records resolved in pandas (see golden_records in clustering.py), converted like the rows of the
+source tables (see prepare_for_insert), and the cluster of each contact (members: contact key and cluster) in a single
+transaction: they replace the golden_records and golden_record_members tables, or only the golden records of the
+clusters resolved again after a delta load if incremental is set
+'''
+def write_golden_records(conn, golden, members, incremental = False, batch_size = LOAD_BATCH_SIZE):
+    if not incremental:
+        create_golden_records_tables(conn)
+    # the shard is set afterwards in the partitioned mode
+    prepared = prepare_for_insert(golden.reindex(columns=GOLDEN_RECORD_COLUMNS)).drop(columns=[ROW_FINGERPRINT])
+
+    cursor = conn.cursor()
+    cursor.execute(backend.begin_transaction)
+    try:
+        delete_resolved_clusters(cursor, incremental)
+        insert_in_batches(cursor, parameterized_insert("INSERT INTO " + GOLDEN_RECORDS_RELATION + " VALUES(", len(prepared.columns)),
+                          rows_for_insert(prepared), batch_size)
+        insert_in_batches(cursor, golden_record_members_insert, rows_for_insert(members), batch_size)
+        create_golden_records_indexes(cursor, incremental)
+        cursor.execute(backend.commit_transaction)
+    except Exception:
+        cursor.execute(backend.rollback_transaction)
+        raise
+    conn.commit()
+
+'''
+Return the select list of golden_records_insert_query computing each column of a golden record over the records of its
+cluster, with the survivorship rules of clustering.py: each field (and each canonical key, with the field it is
+computed from) takes its value in the first record of the cluster with a known value, by source priority then record
+id. A field only known as 'N/A' or 'nan' takes that value, created_at is the smallest and updated_at the greatest date
+of the cluster, and the cluster is labelled with the smallest contact key of the cluster
+'''
+def golden_record_values(source_priority):
+    priority = "CASE s.%s %s ELSE %d END" % (SOURCE, " ".join("WHEN '%s' THEN %d" % (source, rank) for rank, source in enumerate(source_priority)),
+                                            len(source_priority))
+    unknown_values = ", ".join("'%s'" % value for value in clustering.UNKNOWN_VALUES)
+
+    def first_value(column, field):
+        if TOTAL_COMBINED_SCHEMA[field] in [STRING, CATEGORY]:
+            unknown = "CASE WHEN s.%s IS NULL THEN 2 WHEN s.%s IN (%s) THEN 1 ELSE 0 END" % (field, field, unknown_values)
+        else:
+            unknown = "CASE WHEN s.%s IS NULL THEN 1 ELSE 0 END" % field
+        return "FIRST_VALUE(s.%s) OVER (PARTITION BY c.cluster ORDER BY %s, %s, s.%s) AS %s" % (column, unknown, priority, blocking.RECORD, column)
+
+    values = []
+    for column in GOLDEN_RECORD_COLUMNS:
+        if column == CREATED_AT:
+            values.append("MIN(s.%s) OVER (PARTITION BY c.cluster) AS %s" % (column, column))
+        elif column == UPDATED_AT:
+            values.append("MAX(s.%s) OVER (PARTITION BY c.cluster) AS %s" % (column, column))
+        elif column == clustering.CLUSTER:
+            values.append("MIN(s.%s) OVER (PARTITION BY c.cluster) AS %s" % (canonical.CONTACT_KEY, column))
+        elif column == clustering.RECORD_COUNT:
+            values.append("COUNT(*) OVER (PARTITION BY c.cluster) AS %s" % column)
+        elif column in TOTAL_COMBINED_SCHEMA:
+            values.append(first_value(column, column))
+        elif column in COMBINED_KEY_COLUMNS:
+            values.append(first_value(column, canonical.KEY_SOURCE_COLUMNS[column]))
+    return values
+
+'''
+Store the golden records of the contacts of the source_contacts table clustered by the match edges, built by the
+database (see golden_records_insert_query), and the cluster of each contact, like write_golden_records. Only the
+cluster of each contact, from the union-find of clustering.py, is sent to the database (into the contact_clusters
+table): no contact is read
+'''
+def resolve_golden_records(conn, left, right, incremental = False, source_priority = SOURCE_PRIORITY, batch_size = LOAD_BATCH_SIZE):
+    num_records = count_rows(conn, SOURCE_CONTACTS_RELATION)
+    clusters = clustering.connected_components(num_records, left, right)
+
+    if not incremental:
+        create_golden_records_tables(conn)
+    drop_relation(conn, CONTACT_CLUSTERS_RELATION)
+    cursor = conn.cursor()
+    cursor.execute(backend.ddl(create_contact_clusters))
+    conn.commit()
+
+    values = golden_record_values(source_priority)
+    columns = [column for column in GOLDEN_RECORD_COLUMNS if column != sharding.SHARD]
+    cursor.execute(backend.begin_transaction)
+    try:
+        for start in range(0, num_records, batch_size):
+            cluster_batch = clusters[start:start + batch_size].tolist()
+            cursor.executemany(contact_clusters_insert, list(zip(range(start, start + len(cluster_batch)), cluster_batch)))
+        cursor.execute(create_contact_clusters_index_query)
+        delete_resolved_clusters(cursor, incremental)
+        cursor.execute(golden_records_insert_query.format(columns = ", ".join(columns), values = ",\n                 ".join(values)))
+        cursor.execute(golden_record_members_insert_query)
+        create_golden_records_indexes(cursor, incremental)
+        cursor.execute(backend.commit_transaction)
+    except Exception:
+        cursor.execute(backend.rollback_transaction)
+        raise
+
+    cursor.execute(backend.update_statistics_query % GOLDEN_RECORDS_RELATION)
+    conn.commit()
+
+'''
+Set the shard of each golden record of the golden_records table (see assign_shards in sharding.py), from its cluster,
+company and post merge key columns only
+'''
+def assign_golden_shards(conn, partition_count = PARTITION_COUNT, batch_size = LOAD_BATCH_SIZE):
+    columns = list(dict.fromkeys([clustering.CLUSTER, COMPANY_NAME, COMPANY_DOMAIN] + POST_MERGE_KEYS))
+    golden = read_query(conn, "SELECT " + ", ".join(columns) + " FROM " + GOLDEN_RECORDS_RELATION + " ORDER BY " + clustering.CLUSTER)
+    shards = sharding.assign_shards(golden, partition_count, POST_MERGE_KEYS, clustering.CLUSTER)
+
+    drop_relation(conn, GOLDEN_SHARDS_RELATION)
+    cursor = conn.cursor()
+    cursor.execute(backend.ddl(create_golden_record_shards))
+    conn.commit()
+
+    cursor.execute(backend.begin_transaction)
+    try:
+        insert_in_batches(cursor, golden_record_shards_insert, list(zip(golden[clustering.CLUSTER].tolist(), shards.tolist())), batch_size)
+        cursor.execute(create_golden_record_shards_index_query)
+        cursor.execute(golden_record_shards_update)
+        cursor.execute(backend.commit_transaction)
+    except Exception:
+        cursor.execute(backend.rollback_transaction)
+        raise
+    conn.commit()
+
+'''
+Cluster the contacts of all sources linked by the exact matches (and the fuzzy matches if cluster_fuzzy_matches is
+set in config.py) with a union-find, and resolve each cluster into one golden record with the survivorship rules
+of clustering.py. Unlike the chain of joins of the former combined views, the clusters don't depend on the order of
+the sources, and contacts matched only through other contacts are merged too. In the partitioned mode, the matches
+of all the shards of the matching assets are combined first (see combine_pair_partitions). The golden records, with the canonical
+keys the post merge compares (see POST_MERGE_KEYS), are stored in the golden_records table, whose name is returned,
+and copied into the combined contacts of the pipeline by combine_exact_contacts.
+
+The golden records are resolved in pandas from the DataFrame of source_contacts, or if golden_records_in_database is
+set in config.py, by the database from the source_contacts table (see resolve_golden_records). After a delta load,
+source_contacts only holds the contacts of the golden records the load touched (see resolve_scope), whose golden
+records replace the previous ones of their clusters, the others are left as they are.
+In the partitioned mode, the shard of each golden record is set in its shard column (see assign_golden_shards)
+'''
+@asset(auto_materialize_policy=wait_for_updated, ins={"source_contacts": AssetIn(),
+                                                     "exact_matches": AssetIn(metadata={"columns": MATCH_EDGE_COLUMNS}),
+                                                     "fuzzy_matches": AssetIn(metadata={"columns": MATCH_EDGE_COLUMNS + [scoring.MATCH]})},
+       description="Cluster matched contacts into golden records")
+@asset_metrics
+def golden_records(source_contacts, exact_matches, fuzzy_matches, database: DatabaseResource):
+    edges = [combine_pair_partitions(exact_matches)]
+    if CLUSTER_FUZZY_MATCHES:
+        fuzzy_matches = combine_pair_partitions(fuzzy_matches)
+        edges.append(fuzzy_matches[fuzzy_matches[scoring.MATCH]])
+    left, right = clustering.match_edges(*edges)
+    incremental = database.run(relation_exists, backend.check_table_query, RESOLVED_CLUSTERS_RELATION)
+    if isinstance(source_contacts, str):
+        database.run(resolve_golden_records, left, right, incremental)
+    else:
+        clusters = clustering.connected_components(len(source_contacts), left, right)
+        golden = clustering.golden_records(source_contacts.drop(columns=canonical.CANONICAL_KEY_COLUMNS + [canonical.CONTACT_KEY]),
+                                           clusters, SOURCE_PRIORITY)
+        # each cluster is labelled with the smallest contact key of its contacts
+        cluster_keys = source_contacts[canonical.CONTACT_KEY].groupby(clusters).min()
+        golden[clustering.CLUSTER] = golden[clustering.CLUSTER].map(cluster_keys)
+        members = pds.DataFrame({canonical.CONTACT_KEY: source_contacts[canonical.CONTACT_KEY].to_numpy(),
+                                 clustering.CLUSTER: cluster_keys.reindex(clusters).to_numpy()})
+        # the canonical keys compared by the post merge, computed from the values that survived in each golden record
+        golden = golden.join(CANONICAL_KEYS.compute(golden)[COMBINED_KEY_COLUMNS])
+        database.run(write_golden_records, golden, members, incremental)
+    if PARTITION_COUNT:
+        database.run(assign_golden_shards)
+
+    golden_count, contact_count, largest = database.run(read_query, golden_records_statistics_query).iloc[0].tolist()
+    get_dagster_logger().info("%d contacts clustered into %d golden records (largest cluster: %d contacts)" %
+                              (contact_count or 0, golden_count, largest or 0))
+    add_asset_metadata({"rows_out": MetadataValue.int(int(golden_count))})
+    return GOLDEN_RECORDS_RELATION
+
+'''
+Assets run when a source CSV file changed: the assets downstream of its observable source asset
+'''
+source_downstream = AssetSelection.keys(*[source_asset.key for source_asset in SOURCE_FILE_ASSETS.values()]).downstream(include_self=False)
+if shard_partitions is not None:
+    # a run can not mix partitioned and unpartitioned assets, the partitions are left to the auto materialize policies
+    source_downstream = source_downstream - AssetSelection.assets(candidate_pairs, exact_matches).downstream()
+
+'''
+Sensor reacting to the changes of the source CSV files within seconds instead of polling their modification time.
+On each tick, the files changed since the previous tick (see SourceWatcher in watcher.py) that are no longer being
+written to are hashed, and the files whose content hash differs from the version last reported (kept in the cursor
+of the sensor) are recorded as a new data version of their observable source asset, and a run of the assets
+downstream of them is requested. A file touched or rewritten with the same content does not start anything
+'''
+@sensor(minimum_interval_seconds=SOURCE_WATCH_INTERVAL_SECONDS, default_status=DefaultSensorStatus.RUNNING,
+        asset_selection=source_downstream, description="start the pipeline when a source csv file changed")
+def source_files_sensor(context):
+    versions = json.loads(context.cursor) if context.cursor else {}
+    observations = []
+    changed_assets = []
+    for path in source_watcher.changed_paths():
+        if not watcher.is_settled(path, SOURCE_DEBOUNCE_SECONDS):
+            # still being written, look at it again on the next tick
+            source_watcher.mark_changed(path)
+            continue
+        version = watcher.source_version(path, SOURCE_VERSION_CACHE)
+        if version is None or versions.get(path) == version:
+            continue
+        versions[path] = version
+        source_asset = SOURCE_FILE_ASSETS[path]
+        observations.append(AssetObservation(source_asset.key, tags={DATA_VERSION_TAG: version}))
+        changed_assets.append(source_asset.key)
+
+    run_requests = []
+    if changed_assets:
+        selection = AssetSelection.keys(*changed_assets).downstream(include_self=False) & source_downstream
+        asset_keys = sorted(selection.resolve(context.repository_def.asset_graph))
+        run_requests.append(RunRequest(asset_selection=asset_keys))
+    return SensorResult(run_requests=run_requests, asset_events=observations, cursor=json.dumps(versions))
+
+'''
+Executor of the assets: each asset runs in its own process (multiprocess executor) with its own database connection,
+so the assets that don't depend on each other, such as the three source loads, run concurrently on SQL Server and
+SQLite. A DuckDB database file can only be opened by one process at a time (see max_processes in backend.py), so
+with the duckdb backend the assets run one process at a time
+'''
+asset_executor = (multiprocess_executor.configured({"max_concurrent": backend.max_processes}) if backend.max_processes
+                  else multiprocess_executor)
+
+'''
+Definitions loaded by Dagster: every asset of this module with the database resource, the columnar IO manager and
+the executor above
+'''
+defs = Definitions(
+    # the assets generated for the sources are not module attributes (a source without dedupe keys has no dedupe asset)
+    assets=list(load_assets_from_current_module()) + [asset for assets in SOURCE_ASSETS.values() for asset in assets if asset is not None],
+    sensors=[source_files_sensor],
+    resources={"database": database, "io_manager": io_manager},
+    executor=asset_executor,
+)
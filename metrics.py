@@ -0,0 +1,133 @@
+import functools
+import resource
+import time
+
+import pandas as pds
+from dagster import MetadataValue, OpExecutionContext
+
+from backend import statement_statistics
+
+'''
+Runtime metrics of the assets, attached as metadata to each materialization so that they show up as time series
+in the Dagster UI (see asset_metrics). Every asset reports:
+1) wall_time_seconds: wall time of the asset function
+2) rows_in, rows_out and row_ratio (rows out per row in, e.g. the share of contacts left after a merge or dedupe)
+3) peak_memory_delta_mb: how much the asset raised the peak resident memory of the process
+4) sql_statements and db_seconds: number of statements run and time spent waiting for the database
+5) preview: the first rows of the output
+'''
+
+PREVIEW_ROWS = 5
+
+MEGABYTE = 1024 * 1024
+
+'''
+Peak resident memory of the process in megabytes (ru_maxrss is in kilobytes on Linux)
+'''
+def peak_memory_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 / MEGABYTE
+
+'''
+Number of rows of an asset input or output: the length of a DataFrame, the total length of the DataFrames of
+the partitions of an upstream asset, or the rows inserted by a load (see load_summary in entityresolution.py).
+None for any other value
+'''
+def row_count(value):
+    if isinstance(value, pds.DataFrame):
+        return len(value)
+    if isinstance(value, dict) and "inserted" in value:
+        return value["inserted"]
+    if isinstance(value, dict) and value and all(isinstance(partition, pds.DataFrame) for partition in value.values()):
+        return sum(len(partition) for partition in value.values())
+    return None
+
+'''
+Markdown table of the first rows of a DataFrame
+'''
+def markdown_preview(data, num_rows = PREVIEW_ROWS):
+    rows = data.head(num_rows).astype(str)
+    lines = ["| " + " | ".join(str(column) for column in rows.columns) + " |",
+             "|" + "---|" * len(rows.columns)]
+    for row in rows.itertuples(index=False, name=None):
+        lines.append("| " + " | ".join(value.replace("|", "\\|") for value in row) + " |")
+    return "\n".join(lines)
+
+'''
+Preview of an asset output: the first rows of a DataFrame, or the value itself for a load summary
+(with the set of affected contact keys replaced by its size)
+'''
+def output_preview(output):
+    if isinstance(output, pds.DataFrame):
+        return MetadataValue.md(markdown_preview(output))
+    if isinstance(output, dict):
+        return MetadataValue.json({key: len(value) if isinstance(value, set) else value for key, value in output.items()})
+    if isinstance(output, set):
+        return MetadataValue.int(len(output))
+    return None
+
+'''
+Return the execution context of the asset being run, or None outside of a Dagster run
+'''
+def current_context():
+    try:
+        return OpExecutionContext.get()
+    except Exception:
+        return None
+
+'''
+Attach metrics specific to an asset (e.g. the rows of the views it creates) to its materialization,
+if it runs in Dagster. They replace the standard metrics of the same name computed by asset_metrics
+'''
+def add_asset_metadata(metadata):
+    context = current_context()
+    if context is not None:
+        context.add_output_metadata(metadata)
+
+'''
+Decorator of an asset function (placed under @asset) that measures each call and attaches the metrics described
+at the top of this module to the materialization. Outside of a Dagster run (e.g. in the benchmarks), the function
+is only called
+'''
+def asset_metrics(function):
+    @functools.wraps(function)
+    def measured_function(*args, **kwargs):
+        statistics = statement_statistics()
+        statements_before, db_seconds_before = statistics.statements, statistics.seconds
+        memory_before = peak_memory_mb()
+        start_time = time.perf_counter()
+
+        output = function(*args, **kwargs)
+
+        wall_time = time.perf_counter() - start_time
+
+        context = current_context()
+        if context is None:
+            return output
+
+        input_rows = [row_count(value) for value in list(args) + list(kwargs.values())]
+        input_rows = [rows for rows in input_rows if rows is not None]
+        rows_in = sum(input_rows) if input_rows else None
+        rows_out = row_count(output)
+
+        metadata = {
+            "wall_time_seconds": MetadataValue.float(wall_time),
+            "peak_memory_delta_mb": MetadataValue.float(peak_memory_mb() - memory_before),
+            "sql_statements": MetadataValue.int(statistics.statements - statements_before),
+            "db_seconds": MetadataValue.float(statistics.seconds - db_seconds_before),
+        }
+        if rows_in is not None:
+            metadata["rows_in"] = MetadataValue.int(rows_in)
+        if rows_out is not None:
+            metadata["rows_out"] = MetadataValue.int(rows_out)
+        if rows_in and rows_out is not None:
+            metadata["row_ratio"] = MetadataValue.float(rows_out / rows_in)
+        preview = output_preview(output)
+        if preview is not None:
+            metadata["preview"] = preview
+
+        # the metrics already attached by the asset itself (see add_asset_metadata) take precedence
+        reported = context.get_output_metadata("result") or {}
+        context.add_output_metadata({key: value for key, value in metadata.items() if key not in reported})
+        return output
+
+    return measured_function
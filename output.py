@@ -0,0 +1,218 @@
+import bz2
+import gzip
+import lzma
+
+import numpy as np
+import pandas as pds
+
+'''
+Output of the pipeline: the snapshot of the resolved contacts with a contact_id that stays the same across runs,
+and the changeset of the run listing the contacts inserted, updated and retired since the previous run, so that
+the downstream systems can apply the changes instead of reloading the whole snapshot.
+
+A resolved contact is identified by the cluster of its golden records (the smallest contact key of their contacts,
+see golden_records in entityresolution.py), carried through the post merge in the cluster column of the contacts, so
+its contact_id does not change when the values of its fields (its name or phone number included) do. The identity map
+(identity key, contact_id, hash of the last output row, active) is kept in the database between runs (see
+ContactIdentities). The snapshot and the changeset are written by a TableWriter, as csv (optionally compressed)
+or Parquet files
+'''
+
+CSV = "csv"
+PARQUET = "parquet"
+
+'''
+Columns of the identity map and of the changeset
+'''
+IDENTITY_KEY = "identity_key"
+CONTACT_ID = "contact_id"
+ROW_HASH = "row_hash"
+ACTIVE = "active"
+CHANGE = "change"
+
+INSERTED = "inserted"
+UPDATED = "updated"
+RETIRED = "retired"
+
+'''
+Functions opening a compressed csv file, by compression name, and the extension of the file
+'''
+CSV_COMPRESSIONS = {
+    "gzip": (gzip.open, ".gz"),
+    "bz2": (bz2.open, ".bz2"),
+    "xz": (lzma.open, ".xz"),
+}
+
+'''
+Return the hash of the values of each row of data, as 16 hex digits (like the row fingerprints of the source tables)
+'''
+def row_hashes(data):
+    hashes = pds.util.hash_pandas_object(data.astype(str), index=False)
+    return np.array([format(value, "016x") for value in hashes], dtype=object)
+
+'''
+Stable contact ids of the resolved contacts. Built from the identity map of the previous run, it gives each
+contact of the output, chunk by chunk (see assign), identified by its value of identity_column, which is unique in
+the output and is not part of the output row, the contact_id its identity key had in the previous runs, or
+the next unused contact_id for a new identity key, so the ids are never reused. Once every chunk is assigned,
+finish returns the contacts retired by the run (active in the previous run and no longer in the output) and the
+identity map to persist for the next run
+'''
+class ContactIdentities:
+    def __init__(self, identity_map, identity_column):
+        self.identity_map = identity_map.set_index(IDENTITY_KEY)
+        self.identity_column = identity_column
+        self.next_id = int(identity_map[CONTACT_ID].max()) + 1 if len(identity_map) > 0 else 0
+        self.assigned = []
+
+    '''
+    Return the contact_id of each contact of a chunk of the output, and its change since the previous run:
+    "inserted" (new or returning contact), "updated" (the values of the row, without the identity column, changed)
+    or None (unchanged)
+    '''
+    def assign(self, contacts):
+        keys = contacts[self.identity_column].astype(str).to_numpy(dtype=object)
+        hashes = row_hashes(contacts.drop(columns=[self.identity_column]))
+
+        positions = self.identity_map.index.get_indexer(keys)
+        known = positions >= 0
+
+        contact_ids = np.empty(len(contacts), dtype=np.int64)
+        contact_ids[known] = self.identity_map[CONTACT_ID].to_numpy()[positions[known]]
+        # the new identity keys get the next unused ids, in the order of the output
+        new_count = int((~known).sum())
+        contact_ids[~known] = np.arange(self.next_id, self.next_id + new_count)
+        self.next_id += new_count
+
+        was_active = np.zeros(len(contacts), dtype=bool)
+        was_active[known] = self.identity_map[ACTIVE].to_numpy(dtype=bool)[positions[known]]
+        previous_hashes = np.full(len(contacts), None, dtype=object)
+        previous_hashes[known] = self.identity_map[ROW_HASH].to_numpy(dtype=object)[positions[known]]
+
+        changes = np.full(len(contacts), None, dtype=object)
+        changes[~was_active] = INSERTED
+        changes[was_active & (previous_hashes != hashes)] = UPDATED
+
+        self.assigned.append(pds.DataFrame({IDENTITY_KEY: keys, CONTACT_ID: contact_ids, ROW_HASH: hashes}))
+        return contact_ids, changes
+
+    '''
+    Return the contact_ids retired by the run and the identity map of the run: the assigned contacts as active,
+    and the identity keys of the previous runs that are not in the output as inactive
+    '''
+    def finish(self):
+        assigned = pds.concat(self.assigned, ignore_index=True) if self.assigned else \
+            pds.DataFrame({IDENTITY_KEY: [], CONTACT_ID: [], ROW_HASH: []})
+        assigned[ACTIVE] = True
+
+        missing = self.identity_map[~self.identity_map.index.isin(assigned[IDENTITY_KEY])].reset_index()
+        retired_ids = missing.loc[missing[ACTIVE].astype(bool), CONTACT_ID].to_numpy(dtype=np.int64)
+        missing[ACTIVE] = False
+
+        identity_map = pds.concat([assigned, missing[[IDENTITY_KEY, CONTACT_ID, ROW_HASH, ACTIVE]]], ignore_index=True)
+        identity_map[CONTACT_ID] = identity_map[CONTACT_ID].astype(np.int64)
+        return retired_ids, identity_map
+
+'''
+Writer of a table into a csv file (compressed with one of CSV_COMPRESSIONS if compression is set) or a Parquet
+file (compressed with any Parquet codec), one chunk of rows at a time, so that a table streamed from the database
+is never whole in memory. The path is given without extension, the extension of the format is added (e.g.
+current_state_final.csv.gz). Categorical columns are written as strings, since their categories differ between chunks
+pyarrow is an optional dependency, only imported when a Parquet file is written
+'''
+class TableWriter:
+    def __init__(self, path, file_format = CSV, compression = None):
+        if file_format == CSV:
+            if compression is not None and compression not in CSV_COMPRESSIONS:
+                raise ValueError("Unknown csv compression: " + str(compression))
+            opener, extension = CSV_COMPRESSIONS[compression] if compression else (open, "")
+            self.path = path + ".csv" + extension
+            self.file = opener(self.path, "wt", newline="")
+        elif file_format == PARQUET:
+            self.path = path + ".parquet"
+            self.file = None
+        else:
+            raise ValueError("Unknown output format: " + str(file_format))
+        self.file_format = file_format
+        self.compression = compression
+        self.template = None
+        self.parquet_writer = None
+        self.rows_written = 0
+
+    '''
+    Append the rows of a DataFrame (every chunk has the columns of the first one). At least one chunk, possibly
+    empty, must be written for the file to hold the header or schema of the table
+    '''
+    def write(self, data):
+        data = data.astype({column: "string" for column in data.columns
+                            if isinstance(data[column].dtype, pds.CategoricalDtype)})
+        first_chunk = self.template is None
+        if first_chunk:
+            # an empty frame with the columns and types of the table (see empty_rows)
+            self.template = data.iloc[0:0]
+
+        if self.file_format == CSV:
+            # the header is written with the first chunk
+            data.to_csv(self.file, index=False, header=first_chunk)
+        else:
+            import pyarrow
+            import pyarrow.parquet
+
+            table = pyarrow.Table.from_pandas(data, preserve_index=False)
+            if self.parquet_writer is None:
+                self.parquet_writer = pyarrow.parquet.ParquetWriter(self.path, table.schema,
+                                                                    compression=self.compression or "none")
+            elif table.schema != self.parquet_writer.schema:
+                table = table.cast(self.parquet_writer.schema)
+            self.parquet_writer.write_table(table)
+        self.rows_written += len(data)
+
+    '''
+    Return count rows of the columns and types of the table written so far, with missing values
+    '''
+    def empty_rows(self, count):
+        return self.template.reindex(range(count))
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+
+'''
+Write the contacts of the output (chunks of the merged contacts, in output order) into the snapshot file at
+snapshot_path and the changes since the previous run into the changeset file at changeset_path, with the stable
+contact_id given by identities (a ContactIdentities) in place of the identity column of the chunks. The changeset has the change column ("inserted", "updated"
+or "retired") before the columns of the snapshot, which are empty for a retired contact. Returns the number of
+contacts written and of each kind of change, and the identity map to persist for the next run
+'''
+def write_contacts(chunks, identities, snapshot_path, changeset_path, file_format = CSV, compression = None):
+    snapshot = TableWriter(snapshot_path, file_format, compression)
+    changeset = TableWriter(changeset_path, file_format, compression)
+    summary = {"contacts": 0, INSERTED: 0, UPDATED: 0, RETIRED: 0}
+    try:
+        for contacts in chunks:
+            contact_ids, changes = identities.assign(contacts)
+            contacts = contacts.drop(columns=[identities.identity_column]).reset_index(drop=True)
+            contacts.insert(loc=0, column=CONTACT_ID, value=contact_ids)
+            snapshot.write(contacts)
+            summary["contacts"] += len(contacts)
+
+            changed = pds.notna(changes)
+            changed_contacts = contacts[changed].copy()
+            changed_contacts.insert(loc=0, column=CHANGE, value=changes[changed])
+            changeset.write(changed_contacts)
+            summary[INSERTED] += int((changes == INSERTED).sum())
+            summary[UPDATED] += int((changes == UPDATED).sum())
+
+        retired_ids, identity_map = identities.finish()
+        retired = changeset.empty_rows(len(retired_ids))
+        retired[CHANGE] = RETIRED
+        retired[CONTACT_ID] = retired_ids
+        changeset.write(retired)
+        summary[RETIRED] = len(retired_ids)
+    finally:
+        snapshot.close()
+        changeset.close()
+
+    return summary, identity_map
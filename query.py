@@ -1,209 +1,451 @@
+from schema import *
 
-'''"
-Create table in SQL corresponding to RapidData contacts
-'''
-create_rapid_data = """
-                       CREATE TABLE rapid_data_contacts(
-                       name VARCHAR(255),
-                       email_address VARCHAR(255),
-                       phone_number VARCHAR(255),
-                       title VARCHAR(255),
-                       company_name VARCHAR(255),
-                       company_domain VARCHAR(255),
-                       created_at DATE,
-                       updated_at DATE,
-                       ip_address VARCHAR(255),
-                       intent_signals VARCHAR(255),
-                       do_not_call BIT
-                       ); 
-                    """
-
-'''
-Create table in SQL corresponding to Acme contacts
-'''
-create_acme = """
-                 CREATE TABLE acme_contacts (
-                 name VARCHAR(255),
-                 email_address VARCHAR(255),
-                 phone_number VARCHAR(255),
-                 title VARCHAR(255),
-                 company_name VARCHAR(255),
-                 company_domain VARCHAR(255),
-                 created_at DATE,
-                 updated_at DATE,
-                 country VARCHAR(255),
-                 company_industry VARCHAR(255),
-                 company_employees INTEGER,
-                 company_revenue INTEGER); 
-              """
-
-'''
-Create table in SQL corresponding to CRM contacts
-'''
-create_crm = """
-                CREATE TABLE crm_contacts (
-                name VARCHAR(255),
-                email_address VARCHAR(255),
-                phone_number VARCHAR(255),
-                title VARCHAR(255),
-                company_name VARCHAR(255),
-                company_domain VARCHAR(255),
-                created_at DATE,
-                updated_at DATE,
-                favorite_color VARCHAR(255)); 
-             """
-
-'''
-Merge determined RapidData duplicates taking the the greatest of the updated_at values and 
-least of created_at values for those records. I did this based on ip_address and name, which
-might have downsides as discussed in the readme and powerpoint
-Create a sub query that takes common name and ip_addresses and inner join the rapid_data_contacts
-table with it
-'''
-create_reduced_rapid_data_view = """
-    CREATE VIEW rd_duplicates_removed
-    AS SELECT rdc.name,
-              rdc.email_address,
-              rdc.phone_number,
-              rdc.title,
-              rdc.company_name,
-              rdc.company_domain,
-              rdc.ip_address,
-              rdc.intent_signals,
-              rdc.do_not_call,
-              subset.created_at,
-              subset.updated_at
-       FROM rapid_data_contacts as rdc
-       INNER JOIN
-       (
-           SELECT name,
-                  ip_address,
-                  MIN(created_at) as created_at,
-                  MAX(updated_at) as updated_at
-           FROM rapid_data_contacts
-           GROUP BY name,
-                    ip_address
-                  
-       ) AS subset
-       ON subset.name = rdc.name AND
-          subset.ip_address = rdc.ip_address AND
-          subset.updated_at = rdc.updated_at
-"""
-
-'''
-Merge the view created above with the crm_contacts table
-Take non-null values from full join with COALESCE and attempt
-to extrapolate empty names. Take the exactly equivalent records
-based on the six common columns and merge together ip_address,
-intent_signals, do_not_call, and favorite color into one record
-Leave both date values for both (or 3 or more) records.
-'''
-create_rapid_data_crm_combined_view = """
-    CREATE VIEW rdc_combined 
-    AS SELECT COALESCE(r.name, c.name) as name, 
-              COALESCE(r.email_address, c.email_address) as email_address, 
-              COALESCE(r.phone_number, c.phone_number) as phone_number, 
-              COALESCE(r.title, c.title) as title,
-              COALESCE(r.company_name, c.company_name) as company_name,
-              COALESCE(r.company_domain, c.company_domain) as company_domain,
-              r.ip_address,
-              r.intent_signals,
-              r.do_not_call,
+'''
+Resolve the duplicates within one source table in a single scan: the records with the same dedupe keys are
+ranked by a window over the keys, and only the latest record of each key is kept (greatest updated_at, a missing
+updated_at counting as the oldest, then the smallest row fingerprint so that ties are broken the same way on
+every run), with the least created_at and greatest updated_at of its duplicates. A record missing one of its
+keys is only a duplicate of the records identical to it (its row fingerprint joins the partition).
+Parameters: view name, columns of the source except the dates and its canonical keys (comma separated), source
+table, partition of the duplicates (see Source.dedupe_view in sources.py)
+'''
+create_dedupe_view = """
+    CREATE VIEW {view_name}
+    AS SELECT {columns},
+              created_at,
+              updated_at
+       FROM (SELECT {columns},
+                    MIN(created_at) OVER (PARTITION BY {partition}) as created_at,
+                    MAX(updated_at) OVER (PARTITION BY {partition}) as updated_at,
+                    ROW_NUMBER() OVER (PARTITION BY {partition}
+                                       ORDER BY CASE WHEN updated_at IS NULL THEN 1 ELSE 0 END, updated_at DESC,
+                                                row_fingerprint) as duplicate_rank
+             FROM {table}) AS d
+       WHERE duplicate_rank = 1
+"""
+
+'''
+Views of the post merge stages run in the database (see post_merge_in_database in config.py).
+
+The clean view fills in the null values of total_combined with the defaults of clean_data, and numbers the records
+in the order query_db_into_dataframe reads them (by name, the other columns breaking the ties) in the seen column,
+so that the "first record" of the later stages is the same record as in pandas. The canonical keys compared by the
+post merge and the cluster of the golden record of each record are passed on as they are.
+Parameters: view name, total_combined relation, false literal of the backend, select list of the key columns
+'''
+create_clean_view = """
+    CREATE VIEW {view_name}
+    AS SELECT COALESCE(NULLIF(t.name, 'nan'), 'N/A') as name,
+              COALESCE(NULLIF(t.email_address, 'nan'), 'N/A') as email_address,
+              COALESCE(NULLIF(t.phone_number, 'nan'), 'N/A') as phone_number,
+              COALESCE(NULLIF(t.country, 'nan'), 'N/A') as country,
+              COALESCE(NULLIF(t.favorite_color, 'nan'), 'N/A') as favorite_color,
+              COALESCE(NULLIF(t.title, 'nan'), 'N/A') as title,
+              COALESCE(NULLIF(t.company_name, 'nan'), 'N/A') as company_name,
+              COALESCE(NULLIF(t.company_domain, 'nan'), 'N/A') as company_domain,
+              COALESCE(t.company_revenue, -1) as company_revenue,
+              COALESCE(t.company_employees, -1) as company_employees,
+              COALESCE(NULLIF(t.company_industry, 'nan'), 'N/A') as company_industry,
+              COALESCE(NULLIF(t.intent_signals, 'nan'), '"[]"') as intent_signals,
+              COALESCE(t.do_not_call, {false}) as do_not_call,
+              t.created_at,
+              t.updated_at,
+              {keys}ROW_NUMBER() OVER (ORDER BY t.name, t.email_address, t.phone_number, t.company_name,
+                                          t.created_at, t.updated_at) as seen
+       FROM {total_combined} AS t
+"""
+
+'''
+Combination of (country, company_revenue, company_employees, company_industry) chosen for each company name by the
+"first" and "latest" extrapolation rules: the complete record ranked first in the order of the rule.
+Parameters: clean relation, order of the records of a company
+'''
+company_attributes_query = """
+    SELECT company_name, country, company_revenue, company_employees, company_industry
+    FROM (SELECT company_name, country, company_revenue, company_employees, company_industry,
+                 ROW_NUMBER() OVER (PARTITION BY company_name ORDER BY {order}) as attribute_rank
+          FROM {clean}
+          WHERE country <> 'N/A' AND company_revenue <> -1 AND company_employees <> -1 AND company_industry <> 'N/A') AS c
+    WHERE attribute_rank = 1
+"""
+
+'''
+Combination chosen for each company name by the "most_frequent" extrapolation rule: the combination of the most
+complete records, the one seen first on a tie. Parameters: clean relation
+'''
+company_attributes_most_frequent_query = """
+    SELECT company_name, country, company_revenue, company_employees, company_industry
+    FROM (SELECT company_name, country, company_revenue, company_employees, company_industry,
+                 ROW_NUMBER() OVER (PARTITION BY company_name ORDER BY COUNT(*) DESC, MIN(seen)) as attribute_rank
+          FROM {clean}
+          WHERE country <> 'N/A' AND company_revenue <> -1 AND company_employees <> -1 AND company_industry <> 'N/A'
+          GROUP BY company_name, country, company_revenue, company_employees, company_industry) AS c
+    WHERE attribute_rank = 1
+"""
+
+'''
+View filling in the company columns of each record from the combination chosen for its company name.
+Parameters: view name, clean relation, company attributes query, select list of the key columns
+'''
+create_extrapolated_view = """
+    CREATE VIEW {view_name}
+    AS SELECT c.name,
+              c.email_address,
+              c.phone_number,
+              COALESCE(a.country, c.country) as country,
+              c.favorite_color,
+              c.title,
+              c.company_name,
+              c.company_domain,
+              COALESCE(a.company_revenue, c.company_revenue) as company_revenue,
+              COALESCE(a.company_employees, c.company_employees) as company_employees,
+              COALESCE(a.company_industry, c.company_industry) as company_industry,
+              c.intent_signals,
+              c.do_not_call,
+              c.created_at,
+              c.updated_at,
+              {keys}c.seen
+       FROM {clean} AS c
+       LEFT JOIN ({attributes}) AS a
+       ON a.company_name = c.company_name
+"""
+
+'''
+View filling in the company columns of each record from the company dimension (see companies.py): the value of the
+entry of its company domain, or else of the entry of its company name, when the dimension knows it. The entries are
+looked up by the lower-cased, trimmed domain and name, the keys of company_keys in companies.py (which also collapses
+the runs of whitespace of a name).
+Parameters: view name, clean relation, select list of the key columns
+'''
+create_dimension_extrapolated_view = """
+    CREATE VIEW {view_name}
+    AS SELECT c.name,
+              c.email_address,
+              c.phone_number,
+              COALESCE(d.country, n.country, c.country) as country,
               c.favorite_color,
-              r.updated_at AS ru, 
-              r.created_at AS rc,
-              c.updated_at AS cu, 
-              c.created_at AS cc 
-       FROM rd_duplicates_removed AS r 
-       FULL OUTER JOIN crm_contacts AS c 
-       ON (c.name = r.name OR c.name = \'N/A\' OR r.name = \'N/A\') AND
-           c.email_address = r.email_address AND 
-          (c.company_name = r.company_name OR
-           c.company_domain = r.company_domain);
-"""
-
-'''
-Merge the view created above with the acme_contacts table
-Take non-null values from full join with COALESCE and attempt
-to extrapolate empty names. Take the exactly equivalent records
-based on the six common columns and merge together ip_address,
-intent_signals, do_not_call, favorite color, country, company_name,
-company_employees, company_revenue, and company_industry into one record
-Leave all date values for both (or 3 or more) records.
-'''
-create_total_combined_view_dates = """
-    CREATE VIEW total_combined_dates
-    AS SELECT COALESCE(a.name, rdc.name) as name, 
-              COALESCE(a.email_address, rdc.email_address) as email_address, 
-              COALESCE(a.phone_number, rdc.phone_number) as phone_number, 
-              COALESCE(a.title, rdc.title) as title,
-              COALESCE(a.company_name, rdc.company_name) as company_name,
-              COALESCE(a.company_domain, rdc.company_domain) as company_domain,
-              a.company_industry,
-              a.company_employees,
-              a.company_revenue,
-              a.country,
-              rdc.ip_address,
-              rdc.intent_signals,
-              rdc.do_not_call,
-              rdc.favorite_color,
-              a.updated_at as au, 
-              a.created_at as ac, 
-              rdc.ru as ru, 
-              rdc.rc as rc, 
-              rdc.cu as cu, 
-              rdc.cc as cc
-       FROM acme_contacts AS a 
-       FULL OUTER JOIN rdc_combined AS rdc 
-       ON (a.name = rdc.name OR a.name = \'N/A\' OR rdc.name = \'N/A\') AND
-           a.email_address = rdc.email_address AND 
-          (a.company_name = rdc.company_name OR
-           a.company_domain = rdc.company_domain);
-"""
-
-'''
-Query all the columns from the total_combined table combining the 
-updated_at and created_at columns for each contact source into the largest
-updated_at value for that record for updated_at, and smallest created_at value
-for that record. This was done to preserve as much information as possible going from
-six values to just 2
-'''
-create_total_combined_view = """
-    CREATE VIEW total_combined 
-    AS SELECT name, 
-              email_address, 
-              phone_number, 
+              c.title,
+              c.company_name,
+              c.company_domain,
+              COALESCE(d.company_revenue, n.company_revenue, c.company_revenue) as company_revenue,
+              COALESCE(d.company_employees, n.company_employees, c.company_employees) as company_employees,
+              COALESCE(d.company_industry, n.company_industry, c.company_industry) as company_industry,
+              c.intent_signals,
+              c.do_not_call,
+              c.created_at,
+              c.updated_at,
+              {keys}c.seen
+       FROM {clean} AS c
+       LEFT JOIN company_dimension AS d
+       ON d.key_kind = 'domain' AND d.company_key = LOWER(TRIM(c.company_domain))
+       LEFT JOIN company_dimension AS n
+       ON n.key_kind = 'name' AND n.company_key = LOWER(TRIM(c.company_name))
+"""
+
+'''
+View merging the records with the same post merge key into the latest record (greatest updated_at, a missing
+updated_at counting as the latest like in pandas, then the last one seen) with the smallest created_at.
+The seen column of a merged record is the position of the first record of its key, and its cluster is the smallest
+cluster of the records of its key, which identifies it in the output (see output.py). The records missing a key
+(NULL) are in the same partition, like in pandas.
+Parameters: view name, extrapolated relation, canonical keys of the post merge (comma separated)
+'''
+create_post_merge_view = """
+    CREATE VIEW {view_name}
+    AS SELECT name,
+              email_address,
+              phone_number,
               country,
-              favorite_color,              
-              title, 
-              company_name, 
-              company_domain, 
+              favorite_color,
+              title,
+              company_name,
+              company_domain,
               company_revenue,
-              company_employees,              
+              company_employees,
               company_industry,
-              intent_signals, 
-              do_not_call, 
-              LEAST(rc, ac, cc) as created_at,
-              GREATEST(ru, au, cu) as updated_at
-    FROM total_combined_dates
+              intent_signals,
+              do_not_call,
+              first_created_at as created_at,
+              updated_at,
+              first_cluster as cluster,
+              first_seen as seen
+       FROM (SELECT e.*,
+                    ROW_NUMBER() OVER (PARTITION BY {key_columns}
+                                       ORDER BY CASE WHEN updated_at IS NULL THEN 0 ELSE 1 END,
+                                                updated_at DESC, seen DESC) as merge_rank,
+                    MIN(created_at) OVER (PARTITION BY {key_columns}) as first_created_at,
+                    MIN(cluster) OVER (PARTITION BY {key_columns}) as first_cluster,
+                    MIN(seen) OVER (PARTITION BY {key_columns}) as first_seen
+             FROM {extrapolated} AS e) AS m
+       WHERE merge_rank = 1
 """
 
 '''
-rapid_data_contacts insert query prefix for adding values of dataframe into an SQL row
+Query streaming the merged contacts of one or more relations (joined by UNION ALL) in name order, with the cluster
+identifying each of them (see output.py).
+Parameters: relations query
 '''
-rapid_data_insert = "INSERT INTO rapid_data_contacts VALUES("
+merged_contacts_query = """
+    SELECT name, email_address, phone_number, country, favorite_color, title, company_name, company_domain,
+           company_revenue, company_employees, company_industry, intent_signals, do_not_call, created_at, updated_at,
+           cluster
+    FROM ({relations}) AS m
+    ORDER BY {order}
+"""
 
 '''
-acme_contacts insert query prefix for adding values of dataframe into an SQL row
+Create table in SQL holding the identity map of the output (see output.py): the stable contact_id of each
+identity key, the hash of its last output row and whether it is in the last output
 '''
-acme_insert = "INSERT INTO acme_contacts VALUES("
+create_contact_ids = """
+    CREATE TABLE contact_ids (
+    identity_key VARCHAR(1024),
+    contact_id BIGINT,
+    row_hash VARCHAR(16),
+    active BIT);
+"""
 
 '''
-crm_contacts insert query prefix for adding values of dataframe into an SQL row
+contact_ids insert and select queries
 '''
-crm_insert = "INSERT INTO crm_contacts VALUES("
+contact_ids_insert = "INSERT INTO contact_ids VALUES(?,?,?,?)"
+contact_ids_select = "SELECT identity_key, contact_id, row_hash, active FROM contact_ids"
+
+'''
+Append the contacts of one source to the source_contacts table, numbered in the order of their contact keys from the
+first record id given. Parameters: first record id, source name, selected columns (NULL for the columns of the combined
+contacts the source doesn't have, then the canonical keys and the contact key), contacts relation of the source,
+filter of the contacts (empty to append them all)
+'''
+source_contacts_insert_query = """
+    INSERT INTO source_contacts
+    SELECT {first_record} + ROW_NUMBER() OVER (ORDER BY contact_key) - 1, '{source}', {columns}
+    FROM {relation}
+    {where}
+"""
+
+'''
+Filter of source_contacts_insert_query and count query of the contacts resolved again after a delta load (see
+resolution_scope in clustering.py), by their contact keys in the resolved_contacts table
+'''
+resolved_contacts_filter = "WHERE contact_key IN (SELECT contact_key FROM resolved_contacts)"
+resolved_contacts_count_query = "SELECT COUNT(*) FROM %s " + resolved_contacts_filter
+
+'''
+Create tables in SQL holding the scope of the resolution of a delta load (see resolution_scope in clustering.py): the
+contact keys of the contacts resolved again, the clusters of the golden records they replace, and the blocks of the
+candidate pairs that are oversized among all the contacts, with their inserts and indexes
+'''
+create_resolved_contacts = """
+    CREATE TABLE resolved_contacts (
+    contact_key VARCHAR(1024));
+"""
+resolved_contacts_insert = "INSERT INTO resolved_contacts VALUES(?)"
+create_resolved_contacts_index_query = "CREATE INDEX ix_resolved_contacts_contact_key ON resolved_contacts (contact_key)"
+create_resolved_clusters = """
+    CREATE TABLE resolved_clusters (
+    cluster VARCHAR(1024));
+"""
+resolved_clusters_insert = "INSERT INTO resolved_clusters VALUES(?)"
+create_resolved_clusters_index_query = "CREATE INDEX ix_resolved_clusters_cluster ON resolved_clusters (cluster)"
+create_oversized_blocks = """
+    CREATE TABLE oversized_blocks (
+    block_index VARCHAR(255),
+    block_key VARCHAR(255));
+"""
+oversized_blocks_insert = "INSERT INTO oversized_blocks VALUES(?,?)"
+oversized_blocks_select = "SELECT block_index, block_key FROM oversized_blocks"
+
+'''
+Create table in SQL holding the cluster of each record of the source_contacts table (see golden_records in
+entityresolution.py), its insert and the index on its records
+'''
+create_contact_clusters = """
+    CREATE TABLE contact_clusters (
+    record INTEGER,
+    cluster INTEGER);
+"""
+contact_clusters_insert = "INSERT INTO contact_clusters VALUES(?,?)"
+create_contact_clusters_index_query = "CREATE INDEX ix_contact_clusters_record ON contact_clusters (record)"
+
+'''
+Insert one golden record per cluster of the contact_clusters table into the golden_records table, resolved from the
+contacts of the source_contacts table with the survivorship rules of clustering.py: each field takes its value in the
+first record of the cluster in the order of the field (known values first, then by source priority and record id).
+The golden record of a cluster is labelled with the smallest contact key of its contacts.
+Parameters: columns of the golden records, select list computing each column over the records of the cluster
+'''
+golden_records_insert_query = """
+    INSERT INTO golden_records ({columns})
+    SELECT {columns}
+    FROM (SELECT {values},
+                 ROW_NUMBER() OVER (PARTITION BY c.cluster ORDER BY s.record) AS member_rank
+          FROM source_contacts AS s
+          JOIN contact_clusters AS c ON c.record = s.record) AS g
+    WHERE member_rank = 1
+"""
+
+'''
+Create table in SQL holding the cluster of the golden record of each contact, by contact key, read by the resolution of
+the next delta load (see resolution_scope in clustering.py), its insert, the insert of the clusters of the
+contact_clusters table and the index on its clusters
+'''
+create_golden_record_members = """
+    CREATE TABLE golden_record_members (
+    contact_key VARCHAR(1024),
+    cluster VARCHAR(1024));
+"""
+golden_record_members_insert = "INSERT INTO golden_record_members VALUES(?,?)"
+golden_record_members_insert_query = """
+    INSERT INTO golden_record_members
+    SELECT s.contact_key, MIN(s.contact_key) OVER (PARTITION BY c.cluster)
+    FROM source_contacts AS s
+    JOIN contact_clusters AS c ON c.record = s.record
+"""
+golden_record_members_select = "SELECT contact_key, cluster FROM golden_record_members"
+create_golden_record_members_index_query = "CREATE INDEX ix_golden_record_members_cluster ON golden_record_members (cluster)"
+
+'''
+Delete the golden records (parameter: golden_records or golden_record_members) of the clusters resolved again after
+a delta load, replaced by the golden records of the resolved contacts
+'''
+delete_resolved_clusters_query = "DELETE FROM %s WHERE cluster IN (SELECT cluster FROM resolved_clusters)"
+
+'''
+Number of golden records, of contacts they resolve and of contacts of the largest one
+'''
+golden_records_statistics_query = "SELECT COUNT(*), SUM(record_count), MAX(record_count) FROM golden_records"
+
+'''
+Create table in SQL holding the shard of each golden record in the partitioned mode, its insert, and the update setting
+the shard column of the golden records from it
+'''
+create_golden_record_shards = """
+    CREATE TABLE golden_record_shards (
+    cluster VARCHAR(1024),
+    shard INTEGER);
+"""
+golden_record_shards_insert = "INSERT INTO golden_record_shards VALUES(?,?)"
+create_golden_record_shards_index_query = "CREATE INDEX ix_golden_record_shards_cluster ON golden_record_shards (cluster)"
+golden_record_shards_update = """
+    UPDATE golden_records
+    SET shard = (SELECT s.shard FROM golden_record_shards AS s WHERE s.cluster = golden_records.cluster)
+"""
+
+'''
+Unique index on the key of the company dimension (see companies.py), used by the lookups and updates of its entries
+'''
+create_company_dimension_index_query = "CREATE UNIQUE INDEX ix_company_dimension_key ON company_dimension (key_kind, company_key)"
+
+'''
+company_dimension insert prefix, update (parameters: assignments of the columns) and select queries. An entry
+already in the dimension is updated in place rather than deleted and inserted again, which the unique index of
+DuckDB does not allow in one transaction
+'''
+company_dimension_insert = "INSERT INTO company_dimension VALUES("
+company_dimension_update = "UPDATE company_dimension SET {assignments} WHERE key_kind = ? AND company_key = ?"
+company_dimension_select = "SELECT * FROM company_dimension"
+
+'''
+Create table in SQL holding the row fingerprints of the records of each enrichment source already merged into the
+company dimension, so that each load only merges its new records
+'''
+create_company_dimension_rows = """
+    CREATE TABLE company_dimension_rows (
+    source VARCHAR(255),
+    row_fingerprint VARCHAR(32));
+"""
+
+create_company_dimension_rows_index_query = "CREATE INDEX ix_company_dimension_rows ON company_dimension_rows (source, row_fingerprint)"
+
+'''
+Query returning the records of a source table that are not merged into the company dimension yet.
+Parameters: selected columns, source table, source name
+'''
+company_dimension_new_rows_query = """
+    SELECT {columns}
+    FROM {table} AS t
+    WHERE NOT EXISTS (SELECT 1 FROM company_dimension_rows AS r
+                      WHERE r.source = '{source}' AND r.row_fingerprint = t.row_fingerprint)
+"""
+
+'''
+Queries replacing the merged records of a source with the records of its table, with the parameters
+(source name) and (source name, source table)
+'''
+company_dimension_rows_delete = "DELETE FROM company_dimension_rows WHERE source = '%s'"
+company_dimension_rows_insert = "INSERT INTO company_dimension_rows SELECT DISTINCT '%s', row_fingerprint FROM %s"
+
+'''
+Index on the row fingerprints of a source table, used to find the rows to delete in a delta load
+'''
+create_fingerprint_index_query = "CREATE INDEX ix_%s_row_fingerprint ON %s (row_fingerprint)"
+
+'''
+Delete the rows of a source table with the given row fingerprint
+'''
+delete_by_fingerprint_query = "DELETE FROM %s WHERE row_fingerprint = ?"
+
+'''
+Insert query prefix of a source table (see Source.insert_prefix in sources.py) for adding values of dataframe into an SQL row.
+The create table statements of the source tables are generated from their schema in schema.py (see create_table_query)
+'''
+source_insert_query = "INSERT INTO %s VALUES("
 
 '''
 Query to check if table exists so that it can be created if it doesn't
 '''
-check_table_query = "SELECT * FROM sys.tables WHERE name = "
\ No newline at end of file
+check_table_query = "SELECT * FROM sys.tables WHERE name = "
+
+'''
+Queries to check if a table exists in the embedded SQLite and DuckDB databases
+'''
+sqlite_check_table_query = "SELECT * FROM sqlite_master WHERE type = 'table' AND name = "
+duckdb_check_table_query = "SELECT * FROM information_schema.tables WHERE table_type = 'BASE TABLE' AND table_name = "
+
+'''
+Queries to check if a view exists in SQL Server and in the embedded SQLite and DuckDB databases
+'''
+check_view_query = "SELECT * FROM sys.views WHERE name = "
+sqlite_check_view_query = "SELECT * FROM sqlite_master WHERE type = 'view' AND name = "
+duckdb_check_view_query = "SELECT * FROM information_schema.tables WHERE table_type = 'VIEW' AND table_name = "
+
+'''
+Queries to create a table (first parameter) filled with all the rows of a view (second parameter),
+in SQL Server and in the embedded SQLite and DuckDB databases
+'''
+select_into_query = "SELECT * INTO %s FROM %s"
+create_table_as_query = "CREATE TABLE %s AS SELECT * FROM %s"
+
+'''
+Queries to collect the statistics the query optimizer uses on a table, in SQL Server and in the embedded
+SQLite and DuckDB databases
+'''
+update_statistics_query = "UPDATE STATISTICS %s"
+analyze_query = "ANALYZE %s"
+
+'''
+Index on one column of a table (a materialized stage table, or a canonical key column of a source table), with the
+parameters (table, column, table, column)
+'''
+create_stage_index_query = "CREATE INDEX ix_%s_%s ON %s (%s)"
+
+'''
+Query returning the number of rows of a table or view
+'''
+count_rows_query = "SELECT COUNT(*) FROM %s"
+
+'''
+Query returning no rows, used to read the column names of a table
+'''
+table_columns_query = "SELECT * FROM %s WHERE 1 = 0"
+
+'''
+Query to rename a table (used to swap a fully loaded staging table in place of the original table)
+'''
+rename_table_query = "EXEC sp_rename '%s', '%s'"
+
+'''
+Query to rename a table in the embedded SQLite and DuckDB databases
+'''
+alter_rename_table_query = "ALTER TABLE %s RENAME TO %s"
@@ -0,0 +1,167 @@
+import os
+import pickle
+from typing import Optional
+
+import pandas as pds
+from dagster import ConfigurableIOManager, ConfigurableResource, InitResourceContext, InputContext, OutputContext
+from pydantic import PrivateAttr
+
+from backend import ConnectionPool, get_backend
+
+'''
+Dagster resources of the pipeline. The assets get their database connections from the DatabaseResource
+instead of sharing one module-global connection, so that assets running at the same time (such as the three
+source loads) each work on their own connection, and a dead connection is replaced instead of requiring
+a restart of the code location. The outputs of the assets are stored between stages by the ColumnarIOManager
+'''
+
+PARQUET = "parquet"
+ARROW = "arrow"
+PICKLE = "pickle"
+
+'''
+Database of the pipeline, reached through a pool of connections (see ConnectionPool in backend.py).
+The pool is created when a run starts executing in a process, and the connections are only opened
+when an asset first needs one, so defining the resource never connects to the database
+'''
+class DatabaseResource(ConfigurableResource):
+    backend_name: str
+    server_name: Optional[str] = None
+    database_name: Optional[str] = None
+    database_path: Optional[str] = None
+    max_connections: int = 4
+    max_retries: int = 3
+    retry_delay: float = 1.0
+
+    _pool = PrivateAttr(default=None)
+
+    '''
+    Storage backend of the database (see backend.py), holding the statements of its SQL dialect
+    '''
+    @property
+    def backend(self):
+        return get_backend(self.backend_name, server_name = self.server_name, database_name = self.database_name,
+                           database_path = self.database_path)
+
+    def setup_for_execution(self, context: InitResourceContext) -> None:
+        self._pool = ConnectionPool(self.backend, max_connections = self.max_connections,
+                                    max_retries = self.max_retries, retry_delay = self.retry_delay)
+
+    def teardown_after_execution(self, context: InitResourceContext) -> None:
+        if self._pool is not None:
+            self._pool.close()
+
+    '''
+    Call function(connection, *args, **kwargs) with a connection of the pool, retrying transient errors
+    (see ConnectionPool.run)
+    '''
+    def run(self, function, *args, **kwargs):
+        return self._pool.run(function, *args, **kwargs)
+
+'''
+IO manager storing the DataFrame outputs of the assets in a columnar file under base_dir, one file per asset:
+compressed Parquet (file_format "parquet") or Arrow IPC (file_format "arrow"). The file is read back memory-mapped,
+and the pandas types (categorical, nullable integer and boolean, datetime) are restored from the file.
+
+An asset can load only the columns it uses from an upstream DataFrame by listing them in the metadata of its input:
+ins={"source_contacts": AssetIn(metadata={"columns": [...]})}
+
+Outputs that are not DataFrames (load summaries, sets of contact keys, CSV chunk readers) are pickled.
+The output of each partition of a partitioned asset is stored in its own file, named after the partition key
+in the directory of the asset. An unpartitioned asset reading a partitioned one gets a dict of the outputs of
+its partitions, by partition key
+pyarrow is an optional dependency, only imported when a DataFrame is stored or loaded
+'''
+class ColumnarIOManager(ConfigurableIOManager):
+    base_dir: str = "storage"
+    file_format: str = PARQUET
+    compression: Optional[str] = "zstd"
+
+    '''
+    Path of the file of an asset (or of one partition of the asset) for the given format (the extension is the format name)
+    '''
+    def path(self, asset_key, file_format, partition_key = None):
+        path = os.path.join(self.base_dir, *asset_key.path)
+        if partition_key is not None:
+            path = os.path.join(path, partition_key)
+        return path + "." + file_format
+
+    def handle_output(self, context: OutputContext, obj) -> None:
+        partition_key = context.partition_key if context.has_partition_key else None
+        file_format = self.file_format if isinstance(obj, pds.DataFrame) else PICKLE
+        path = self.path(context.asset_key, file_format, partition_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # a previous output of the asset may have been stored in another format
+        for other_format in [PARQUET, ARROW, PICKLE]:
+            if other_format != file_format and os.path.exists(self.path(context.asset_key, other_format, partition_key)):
+                os.remove(self.path(context.asset_key, other_format, partition_key))
+
+        if file_format == PICKLE:
+            with open(path, "wb") as file:
+                pickle.dump(obj, file)
+            return
+
+        import pyarrow
+
+        table = pyarrow.Table.from_pandas(obj)
+        if file_format == PARQUET:
+            import pyarrow.parquet
+
+            pyarrow.parquet.write_table(table, path, compression=self.compression or "none")
+        elif file_format == ARROW:
+            import pyarrow.ipc
+
+            options = pyarrow.ipc.IpcWriteOptions(compression=self.compression)
+            with pyarrow.OSFile(path, "wb") as sink:
+                with pyarrow.ipc.new_file(sink, table.schema, options=options) as writer:
+                    writer.write_table(table)
+        else:
+            raise ValueError("Unknown columnar file format: " + str(file_format))
+
+        context.add_output_metadata({"path": path, "rows": len(obj), "columns": len(obj.columns)})
+
+    def load_input(self, context: InputContext):
+        columns = (context.definition_metadata or {}).get("columns")
+
+        if not context.has_asset_partitions:
+            return self.load_file(context.asset_key, columns)
+        # a partition reads the same partition of the upstream asset, an unpartitioned asset reads all of them
+        if context.has_partition_key:
+            return self.load_file(context.asset_key, columns, context.asset_partition_key)
+        return {partition_key: self.load_file(context.asset_key, columns, partition_key)
+                for partition_key in context.asset_partition_keys}
+
+    '''
+    Load the stored output of an asset (or of one partition of the asset), with only the given columns of a DataFrame
+    '''
+    def load_file(self, asset_key, columns, partition_key = None):
+        for file_format in [PARQUET, ARROW]:
+            path = self.path(asset_key, file_format, partition_key)
+            if os.path.exists(path):
+                return self.read_table(path, file_format, columns).to_pandas()
+
+        with open(self.path(asset_key, PICKLE, partition_key), "rb") as file:
+            return pickle.load(file)
+
+    '''
+    Read the columns (all of them if columns is None) of a Parquet or Arrow IPC file, memory-mapped
+    '''
+    def read_table(self, path, file_format, columns):
+        import pyarrow
+
+        if file_format == PARQUET:
+            import pyarrow.parquet
+
+            # the pandas metadata keeps the index of the DataFrame, which is also read back with a projection
+            return pyarrow.parquet.read_table(path, columns=columns, memory_map=True, use_pandas_metadata=True)
+
+        import pyarrow.ipc
+
+        table = pyarrow.ipc.open_file(pyarrow.memory_map(path, "r")).read_all()
+        if columns is None:
+            return table
+        # keep the columns holding the index of the DataFrame (a RangeIndex is only stored in the pandas metadata)
+        index_columns = [column for column in (table.schema.pandas_metadata or {}).get("index_columns", [])
+                         if isinstance(column, str)]
+        return table.select(list(columns) + index_columns)
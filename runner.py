@@ -0,0 +1,302 @@
+'''
+Headless runner of the pipeline: runs the assets in-process, in dependency order, from the source CSV files to
+current_state_final.csv, without the Dagster daemon, UI or run storage. The asset functions are called directly
+with the database resource of the pipeline (like in the benchmarks), and each output is stored by the IO manager
+of the pipeline, so that a later run of a subset of the stages reads the outputs of the stages it does not run.
+
+Each stage can be profiled:
+1) --profile cprofile: deterministic profile of every function call, written as <stage>.prof (for pstats or
+   snakeviz) and <stage>.txt (the functions with the highest cumulative time)
+2) --profile sample: statistical profile sampling the stack of the stage every --sample-interval seconds, with a low
+   overhead on the Python-heavy stages, written as <stage>.folded (collapsed stacks, for flamegraph.pl or speedscope)
+   and <stage>.txt (the functions found most often on the stack)
+3) --memory: peak memory allocated by the stage, traced with tracemalloc, and the lines that allocated the most
+   (<stage>.memory.txt)
+The profiles are written to --profile-dir, with summary.csv holding the time, memory and rows of each stage, which
+is also printed as a table at the end of the run.
+
+The stages are the assets of the pipeline module, in a topological order of its asset graph (see pipeline), so a
+stage added to the pipeline is run without any change here. The command line is parsed before the pipeline module
+(and with it Dagster) is imported, so --help returns at once.
+
+Usage: python runner.py
+       python runner.py --from clean_data --to create_csv --profile cprofile --memory
+       python runner.py --stages source_contacts,candidate_pairs --profile sample
+       python runner.py --list
+'''
+import argparse
+import cProfile
+import collections
+import csv
+import inspect
+import io
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+'''
+Return the stages of the pipeline module er in the order they are run: the assets of er.defs in a topological order
+of its asset graph (the observable source assets of the CSV files are not run), each with the stages whose outputs
+it takes as inputs, by input name (the name of the parameter of the asset function, or of the keyword parameter
+collected by a function such as combine_exact_contacts). The assets it only depends on (deps) are run before it but
+pass nothing
+'''
+def pipeline(er):
+    asset_graph = er.defs.resolve_asset_graph()
+    stages = []
+    for asset_key in asset_graph.toposorted_asset_keys:
+        if not asset_graph.get(asset_key).is_materializable:
+            continue
+        assets_def = er.defs.get_assets_def(asset_key)
+        inputs = {input_name: input_key.to_user_string() for input_name, input_key in assets_def.keys_by_input_name.items()
+                  if not assets_def.op.ins[input_name].dagster_type.is_nothing}
+        stages.append((asset_key.to_user_string(), inputs))
+    return stages
+
+CPROFILE = "cprofile"
+SAMPLE = "sample"
+
+MEGABYTE = 1024 * 1024
+
+'''
+Number of functions listed in the text report of a profile
+'''
+REPORT_FUNCTIONS = 40
+
+'''
+Return the stages of the pipeline (see pipeline) to run: the listed stages, or the stages from first_stage to
+last_stage (both included, the whole pipeline by default). Raises ValueError for an unknown stage
+'''
+def select_stages(all_stages, stages = None, first_stage = None, last_stage = None):
+    stage_names = [stage for stage, _ in all_stages]
+    for stage in (stages or []) + [first_stage, last_stage]:
+        if stage is not None and stage not in stage_names:
+            raise ValueError("Unknown stage: %s (see --list)" % stage)
+    if stages:
+        return [(stage, inputs) for stage, inputs in all_stages if stage in stages]
+    start = stage_names.index(first_stage) if first_stage else 0
+    end = stage_names.index(last_stage) + 1 if last_stage else len(all_stages)
+    return all_stages[start:end]
+
+'''
+Number of rows of a stage output, or None if it is not a table
+'''
+def output_rows(output):
+    return len(output) if hasattr(output, "__len__") and hasattr(output, "columns") else None
+
+'''
+Statistical profiler sampling the stack of one thread every interval seconds from a background thread. The
+samples are counted by stack, from the outermost to the innermost function
+'''
+class StackSampler:
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        target = threading.get_ident()
+        self.stopped.clear()
+
+        def sample():
+            while not self.stopped.wait(self.interval):
+                frame = sys._current_frames().get(target)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                    frame = frame.f_back
+                self.stacks[tuple(reversed(stack))] += 1
+
+        self.thread = threading.Thread(target=sample, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    '''
+    Write the samples as collapsed stacks (one "outer;...;inner count" line per stack) into folded_path, and the
+    functions found on the most samples (anywhere on the stack, and as the innermost function) into report_path
+    '''
+    def write(self, folded_path, report_path):
+        with open(folded_path, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(";".join(stack) + " %d\n" % count)
+
+        total = sum(self.stacks.values())
+        on_stack = collections.Counter()
+        innermost = collections.Counter()
+        for stack, count in self.stacks.items():
+            for function in set(stack):
+                on_stack[function] += count
+            innermost[stack[-1]] += count
+        with open(report_path, "w") as file:
+            file.write("%d samples every %.3f s\n" % (total, self.interval))
+            for title, counter in [("\non the stack (cumulative)\n", on_stack), ("\ninnermost (self)\n", innermost)]:
+                file.write(title)
+                for function, count in counter.most_common(REPORT_FUNCTIONS):
+                    file.write("%6.1f%%  %s\n" % (100.0 * count / max(total, 1), function))
+
+'''
+Write the cProfile profile of a stage as <stage>.prof and as a text report of the functions with the highest
+cumulative time
+'''
+def write_cprofile(profiler, profile_dir, stage):
+    profiler.dump_stats(os.path.join(profile_dir, stage + ".prof"))
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(REPORT_FUNCTIONS)
+    with open(os.path.join(profile_dir, stage + ".txt"), "w") as file:
+        file.write(report.getvalue())
+
+'''
+Write the lines of code that allocated the most memory still held at the end of a stage
+'''
+def write_memory_report(snapshot, path):
+    with open(path, "w") as file:
+        for statistic in snapshot.statistics("lineno")[:REPORT_FUNCTIONS]:
+            file.write("%s\n" % statistic)
+
+'''
+Run the stages (see pipeline) in order with the database resource of the pipeline module er and return the measurements of each
+stage (seconds, peak memory traced with tracemalloc if trace_memory is set, rows returned, resident memory of the
+process after the stage). The inputs of a stage come from the stages run before it, or else from the outputs stored
+by a previous run (see ColumnarIOManager in resources.py); with store_outputs set, the output of each stage is stored
+for the next runs. With profiler set to "cprofile" or "sample", each stage is profiled and its profile is written
+to profile_dir (see the top of this module)
+'''
+def run_stages(er, stages, trace_memory = False, profiler = None, profile_dir = None, store_outputs = False,
+               sample_interval = 0.005):
+    from dagster import AssetKey, build_asset_context, build_init_resource_context, build_output_context
+
+    if profile_dir is not None:
+        os.makedirs(profile_dir, exist_ok=True)
+
+    outputs = {}
+    measurements = []
+    with er.database.yield_for_execution(build_init_resource_context()) as database:
+        for stage, inputs in stages:
+            # the function decorated by @asset
+            function = er.defs.get_assets_def(stage).op.compute_fn.decorated_fn
+            for input_stage in inputs.values():
+                if input_stage not in outputs:
+                    outputs[input_stage] = er.io_manager.load_file(AssetKey(input_stage), None)
+            parameters = inspect.signature(function).parameters
+            # the inputs are passed by name
+            arguments = []
+            keyword_arguments = {input_name: outputs[input_stage] for input_name, input_stage in inputs.items()}
+            if "database" in parameters:
+                keyword_arguments["database"] = database
+            if "context" in parameters:
+                # the stages are run unpartitioned
+                arguments.insert(0, build_asset_context())
+
+            stage_profiler = cProfile.Profile() if profiler == CPROFILE else \
+                StackSampler(sample_interval) if profiler == SAMPLE else None
+            if trace_memory:
+                tracemalloc.start()
+            if stage_profiler is not None:
+                (stage_profiler.enable if profiler == CPROFILE else stage_profiler.start)()
+            start_time = time.perf_counter()
+            try:
+                outputs[stage] = function(*arguments, **keyword_arguments)
+            finally:
+                seconds = time.perf_counter() - start_time
+                if stage_profiler is not None:
+                    (stage_profiler.disable if profiler == CPROFILE else stage_profiler.stop)()
+            peak_memory = None
+            if trace_memory:
+                peak_memory = tracemalloc.get_traced_memory()[1] / MEGABYTE
+                if profile_dir is not None:
+                    write_memory_report(tracemalloc.take_snapshot(), os.path.join(profile_dir, stage + ".memory.txt"))
+                tracemalloc.stop()
+
+            if profile_dir is not None and profiler == CPROFILE:
+                write_cprofile(stage_profiler, profile_dir, stage)
+            elif profile_dir is not None and profiler == SAMPLE:
+                stage_profiler.write(os.path.join(profile_dir, stage + ".folded"), os.path.join(profile_dir, stage + ".txt"))
+
+            if store_outputs and outputs[stage] is not None:
+                er.io_manager.handle_output(build_output_context(asset_key=AssetKey(stage)), outputs[stage])
+
+            measurements.append({"asset": stage, "seconds": seconds, "peak_memory_mb": peak_memory,
+                                 "rows": output_rows(outputs[stage]),
+                                 # peak resident memory of the process (kilobytes on Linux)
+                                 "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024})
+            print("%-32s %10.3f s %12s MB %12s rows" % (stage, seconds,
+                                                          "-" if peak_memory is None else "%.1f" % peak_memory,
+                                                          measurements[-1]["rows"]))
+    return measurements
+
+'''
+Print the measurements of the stages as a table, with the share of the total time of each stage
+'''
+def print_summary(measurements):
+    total_seconds = sum(measurement["seconds"] for measurement in measurements)
+    print("\n%-32s %10s %7s %14s %12s %14s" % ("stage", "seconds", "time", "peak traced MB", "rows", "max rss MB"))
+    for measurement in sorted(measurements, key=lambda measurement: -measurement["seconds"]):
+        print("%-32s %10.3f %6.1f%% %14s %12s %14.1f" % (
+            measurement["asset"], measurement["seconds"],
+            100.0 * measurement["seconds"] / total_seconds if total_seconds > 0 else 0.0,
+            "-" if measurement["peak_memory_mb"] is None else "%.1f" % measurement["peak_memory_mb"],
+            "-" if measurement["rows"] is None else measurement["rows"], measurement["max_rss_mb"]))
+    print("%-32s %10.3f" % ("total", total_seconds))
+
+'''
+Write the measurements of the stages as a csv file
+'''
+def write_summary(measurements, path):
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=["asset", "seconds", "peak_memory_mb", "rows", "max_rss_mb"])
+        writer.writeheader()
+        writer.writerows(measurements)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the pipeline in-process, optionally profiling each stage")
+    parser.add_argument("--list", action="store_true", help="list the stages in the order they are run and exit")
+    parser.add_argument("--stages", default=None, help="comma separated stages to run (default: all of them)")
+    parser.add_argument("--from", dest="first_stage", default=None, help="first stage to run")
+    parser.add_argument("--to", dest="last_stage", default=None, help="last stage to run")
+    parser.add_argument("--profile", choices=[CPROFILE, SAMPLE], default=None, help="profiler wrapping each stage")
+    parser.add_argument("--sample-interval", type=float, default=0.005, help="seconds between two samples of --profile sample")
+    parser.add_argument("--memory", action="store_true", help="trace the peak memory allocated by each stage")
+    parser.add_argument("--profile-dir", default="profiles", help="directory of the profiles and of summary.csv")
+    parser.add_argument("--backend", default=None, help="database backend, overriding backend_name in config.py")
+    parser.add_argument("--no-store", action="store_true", help="do not store the output of each stage for later runs")
+    args = parser.parse_args()
+
+    if args.backend is not None:
+        import config
+
+        config.backend_name = args.backend
+
+    # the pipeline module imports Dagster, only once the command line is parsed
+    import entityresolution as er
+
+    all_stages = pipeline(er)
+    if args.list:
+        for stage, inputs in all_stages:
+            print("%-32s %s" % (stage, ", ".join(inputs.values())))
+        return
+
+    try:
+        stages = select_stages(all_stages, args.stages.split(",") if args.stages else None, args.first_stage, args.last_stage)
+    except ValueError as error:
+        parser.error(str(error))
+
+    profiling = args.profile is not None or args.memory
+    measurements = run_stages(er, stages, trace_memory = args.memory, profiler = args.profile,
+                              profile_dir = args.profile_dir if profiling else None,
+                              store_outputs = not args.no_store, sample_interval = args.sample_interval)
+    print_summary(measurements)
+    if profiling:
+        write_summary(measurements, os.path.join(args.profile_dir, "summary.csv"))
+        print("profiles written to " + args.profile_dir)
+
+if __name__ == "__main__":
+    main()
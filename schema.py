@@ -0,0 +1,205 @@
+import pandas as pds
+
+from canonical import CANONICAL_KEY_COLUMNS, CONTACT_KEY, CONTACT_KEY_SQL_TYPE, KEY_SQL_TYPE
+
+'''
+Declared schema of each contact source and of the combined contacts. A schema maps each column name,
+in file order, to one of the logical column types below. The same schema is applied when a CSV file is read,
+when the combined contacts are read back from the database, and to generate the CREATE TABLE statements
+in query.py, so the DataFrame types and the table definitions cannot drift apart
+'''
+
+STRING = "string"
+CATEGORY = "category"
+DATE = "date"
+INTEGER = "integer"
+BOOLEAN = "boolean"
+
+'''
+Column type in SQL for each logical column type
+'''
+SQL_TYPES = {
+    STRING: "VARCHAR(255)",
+    CATEGORY: "VARCHAR(255)",
+    DATE: "DATE",
+    INTEGER: "INTEGER",
+    BOOLEAN: "BIT",
+}
+
+'''
+Column type in pandas for each logical column type: datetime64 for dates, nullable integers and booleans,
+and categorical for the low cardinality columns. Strings stay Python objects
+'''
+PANDAS_TYPES = {
+    STRING: object,
+    CATEGORY: "category",
+    DATE: "datetime64[ns]",
+    INTEGER: "Int64",
+    BOOLEAN: "boolean",
+}
+
+'''
+Columns common to every contact source
+'''
+CONTACT_SCHEMA = {
+    "name": STRING,
+    "email_address": STRING,
+    "phone_number": STRING,
+    "title": CATEGORY,
+    "company_name": STRING,
+    "company_domain": STRING,
+    "created_at": DATE,
+    "updated_at": DATE,
+}
+
+CRM_SCHEMA = {
+    **CONTACT_SCHEMA,
+    "favorite_color": CATEGORY,
+}
+
+ACME_SCHEMA = {
+    **CONTACT_SCHEMA,
+    "country": CATEGORY,
+    "company_industry": CATEGORY,
+    "company_employees": INTEGER,
+    "company_revenue": INTEGER,
+}
+
+RAPID_DATA_SCHEMA = {
+    **CONTACT_SCHEMA,
+    "ip_address": STRING,
+    "intent_signals": STRING,
+    "do_not_call": BOOLEAN,
+}
+
+'''
+Columns of the total_combined view, in the order they are selected
+'''
+TOTAL_COMBINED_SCHEMA = {
+    "name": STRING,
+    "email_address": STRING,
+    "phone_number": STRING,
+    "country": CATEGORY,
+    "favorite_color": CATEGORY,
+    "title": CATEGORY,
+    "company_name": STRING,
+    "company_domain": STRING,
+    "company_revenue": INTEGER,
+    "company_employees": INTEGER,
+    "company_industry": CATEGORY,
+    "intent_signals": STRING,
+    "do_not_call": BOOLEAN,
+    "created_at": DATE,
+    "updated_at": DATE,
+}
+
+'''
+Columns added to every source table after the columns of its schema: the canonical keys and the contact key computed
+at load time (see canonical.py), then the row fingerprint
+'''
+SOURCE_TABLE_EXTRA_COLUMNS = {
+    **{column: KEY_SQL_TYPE for column in CANONICAL_KEY_COLUMNS},
+    CONTACT_KEY: CONTACT_KEY_SQL_TYPE,
+    "row_fingerprint": "VARCHAR(32)",
+}
+
+'''
+Return the columns of the schema that have the given logical type
+'''
+def columns_of_type(schema, column_type):
+    return [column for column, schema_type in schema.items() if schema_type == column_type]
+
+'''
+Generate the CREATE TABLE statement of a source table from its schema, e.g. for the CRM schema:
+
+CREATE TABLE crm_contacts (
+name VARCHAR(255),
+...
+favorite_color VARCHAR(255),
+row_fingerprint VARCHAR(32));
+
+extra_columns are the columns added after the columns of the schema (the row fingerprint of a source table)
+'''
+def create_table_query(table_name, schema, extra_columns = SOURCE_TABLE_EXTRA_COLUMNS):
+    columns = [column + " " + SQL_TYPES[column_type] for column, column_type in schema.items()]
+    columns += [column + " " + sql_type for column, sql_type in extra_columns.items()]
+    return "CREATE TABLE " + table_name + " (\n" + ",\n".join(columns) + ");"
+
+'''
+Read a CSV file into a DataFrame with the column types of the schema
+'''
+def read_csv_with_schema(path, schema, **kwargs):
+    dtypes = {column: PANDAS_TYPES[column_type] for column, column_type in schema.items() if column_type != DATE}
+    return pds.read_csv(path, dtype=dtypes, parse_dates=columns_of_type(schema, DATE), **kwargs)
+
+'''
+Convert a boolean, a 0/1 integer or a "True"/"False" string to a boolean
+'''
+def to_boolean(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1")
+    return bool(value)
+
+'''
+Convert the columns of a DataFrame (for instance read from the database, where the engine decides how
+dates and BIT values are returned) to the column types of the schema. Columns that are not in the schema
+are left as they are
+'''
+def apply_schema(data, schema):
+    data = data.copy()
+    for column, column_type in schema.items():
+        if column not in data.columns:
+            continue
+        if column_type == DATE:
+            data[column] = pds.to_datetime(data[column])
+        elif column_type == INTEGER:
+            data[column] = pds.to_numeric(data[column]).astype(PANDAS_TYPES[INTEGER])
+        elif column_type == BOOLEAN:
+            # engines return BIT values as booleans or as 0/1 integers, and CSV parsers as "True"/"False" strings
+            data[column] = data[column].map(to_boolean, na_action="ignore").astype(PANDAS_TYPES[BOOLEAN])
+        elif column_type == CATEGORY:
+            data[column] = data[column].astype(PANDAS_TYPES[CATEGORY])
+    return data
+
+'''
+Approximate number of bytes per CSV row, used to turn a chunk size in rows into a block size in bytes
+for the pyarrow parser
+'''
+ESTIMATED_ROW_BYTES = 200
+
+'''
+Read a CSV file in chunks of about chunk_size rows, each returned as a DataFrame with the column types
+of the schema. engine is "c" (the pandas parser) or "pyarrow" (the faster multi-threaded pyarrow
+streaming reader, which must be installed separately and reads blocks of about chunk_size rows)
+'''
+def read_csv_chunks(path, schema, chunk_size, engine = "c"):
+    if engine == "pyarrow":
+        # only import pyarrow when it is actually used since it is an optional dependency
+        import pyarrow
+        import pyarrow.csv
+
+        # read every field as a string, the schema types are applied to each chunk
+        read_options = pyarrow.csv.ReadOptions(block_size=chunk_size * ESTIMATED_ROW_BYTES)
+        convert_options = pyarrow.csv.ConvertOptions(column_types={column: pyarrow.string() for column in schema},
+                                                     strings_can_be_null=True)
+        with pyarrow.csv.open_csv(path, read_options=read_options, convert_options=convert_options) as reader:
+            for batch in reader:
+                yield apply_schema(batch.to_pandas(), schema)
+    else:
+        with read_csv_with_schema(path, schema, chunksize=chunk_size) as reader:
+            for chunk in reader:
+                yield chunk.reset_index(drop=True)
+
+'''
+CSV file to be read in chunks (see read_csv_chunks). Each iteration reads the file again from the start,
+so the chunks can be read as many times as needed without holding the whole file in memory
+'''
+class CsvChunks:
+    def __init__(self, path, schema, chunk_size, engine = "c"):
+        self.path = path
+        self.schema = schema
+        self.chunk_size = chunk_size
+        self.engine = engine
+
+    def __iter__(self):
+        return read_csv_chunks(self.path, self.schema, self.chunk_size, self.engine)
@@ -0,0 +1,160 @@
+import time
+
+import numpy as np
+import pandas as pds
+
+from blocking import LEFT, RIGHT, normalized_email, normalized_phone
+
+'''
+Fuzzy scoring of candidate pairs of contacts (see blocking.py). Each pair gets a score per field:
+1) name: Dice similarity of the character bigrams of the two names (1.0 for the same name,
+   e.g. 0.67 for "jon"/"john"), missing if one of the names is unknown
+2) phone: 1.0 if the normalized phone numbers are equal, 0.0 otherwise, missing if one is unknown
+3) email_domain: 1.0 if the email domains are equal, 0.0 otherwise, missing if one is unknown
+
+The normalized forms of each record (bigrams of its name, normalized phone, email domain) are computed
+once per record, and the bigrams once per distinct name, before any pair is scored. The pairs are then
+scored in batches of NumPy array operations
+'''
+
+NAME_SCORE = "name_score"
+PHONE_SCORE = "phone_score"
+EMAIL_DOMAIN_SCORE = "email_domain_score"
+MATCH = "match"
+
+'''
+Field of the thresholds passed to score_pairs -> score column
+'''
+SCORE_COLUMNS = {
+    "name": NAME_SCORE,
+    "phone": PHONE_SCORE,
+    "email_domain": EMAIL_DOMAIN_SCORE,
+}
+
+'''
+Padding of the bigram arrays. Left and right use different values so that padding never matches padding
+'''
+LEFT_PADDING = -1
+RIGHT_PADDING = -2
+
+'''
+Return the lower-cased, trimmed names, with the names unknown to the sources ('N/A') as missing
+'''
+def normalized_name(records):
+    names = records["name"].astype("string").str.strip().str.lower().str.replace(r"\s+", " ", regex=True)
+    return names.where(names.notna() & (names != "") & (names != "n/a"))
+
+'''
+Return the sorted, distinct character bigram codes of a name padded with a space on each side,
+e.g. "jon" -> " j", "jo", "on", "n "
+'''
+def bigram_codes(name):
+    padded = " " + name + " "
+    return sorted(set(ord(padded[i]) * 65536 + ord(padded[i + 1]) for i in range(0, len(padded) - 1)))
+
+'''
+Return, for the names of the records, a (records x width) array of bigram codes padded with LEFT_PADDING and
+the number of bigrams of each name (0 for a missing name). The bigrams of each distinct name are only
+computed once. Names with more than width bigrams keep their first width bigrams
+'''
+def name_bigrams(names, width):
+    codes, distinct_names = pds.factorize(names, use_na_sentinel=True)
+
+    distinct_bigrams = np.full((len(distinct_names) + 1, width), LEFT_PADDING, dtype=np.int64)
+    distinct_counts = np.zeros(len(distinct_names) + 1, dtype=np.int64)
+    for position, name in enumerate(distinct_names):
+        grams = bigram_codes(name)[0:width]
+        distinct_bigrams[position, 0:len(grams)] = grams
+        distinct_counts[position] = len(grams)
+
+    # missing names (code -1) use the last row: no bigrams
+    return distinct_bigrams[codes], distinct_counts[codes]
+
+'''
+Normalized forms of each record used to score pairs, computed once per record
+'''
+def record_features(records, bigram_width):
+    names = normalized_name(records)
+    bigrams, bigram_counts = name_bigrams(names, bigram_width)
+    return {
+        "bigrams": bigrams,
+        "bigram_counts": bigram_counts,
+        # missing values are None, whatever the form of the normalized values (raw fields or canonical keys)
+        "phone": normalized_phone(records).to_numpy(dtype=object, na_value=None),
+        "email_domain": normalized_email(records).str.split("@", n=1).str[1].to_numpy(dtype=object, na_value=None),
+    }
+
+'''
+Dice similarity of the bigram sets of a batch of pairs: 2 * common bigrams / (bigrams of left + bigrams of right),
+NaN if one of the names is missing
+'''
+def dice_similarity(left_bigrams, left_counts, right_bigrams, right_counts):
+    right_bigrams = np.where(right_bigrams == LEFT_PADDING, RIGHT_PADDING, right_bigrams)
+    # the bigrams of a name are distinct, so each common bigram is counted once
+    common = (left_bigrams[:, :, None] == right_bigrams[:, None, :]).any(axis=2).sum(axis=1)
+    total = left_counts + right_counts
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where((left_counts > 0) & (right_counts > 0), 2.0 * common / total, np.nan)
+
+'''
+1.0 where the values are equal, 0.0 where they differ, NaN where one of them is missing
+'''
+def equality_score(left_values, right_values):
+    known = pds.notna(left_values) & pds.notna(right_values)
+    return np.where(known, (left_values == right_values).astype(float), np.nan)
+
+'''
+Return a DataFrame of scored pairs without any pair, with the columns returned by score_pairs
+'''
+def empty_scores():
+    scored = pds.DataFrame({LEFT: pds.Series([], dtype="int64"), RIGHT: pds.Series([], dtype="int64")})
+    for column in SCORE_COLUMNS.values():
+        scored[column] = pds.Series([], dtype="float64")
+    scored[MATCH] = pds.Series([], dtype="bool")
+    return scored
+
+'''
+Score the candidate pairs (a DataFrame of left and right record ids, the index labels of records) and decide which
+are matches.
+A pair is a match when its name score reaches the "name" threshold, every other field known on both sides
+reaches its threshold, and at least one other field is known on both sides.
+Returns the pairs with the score of each field and the match column, and the number of pairs scored per second
+'''
+def score_pairs(records, pairs, thresholds, batch_size = 100000, bigram_width = 32):
+    start_time = time.perf_counter()
+
+    features = record_features(records, bigram_width)
+
+    # positions of the records of the pairs in the features
+    left = records.index.get_indexer(pairs[LEFT])
+    right = records.index.get_indexer(pairs[RIGHT])
+
+    name_scores = np.empty(len(pairs))
+    for start in range(0, len(pairs), batch_size):
+        batch_left = left[start:start + batch_size]
+        batch_right = right[start:start + batch_size]
+        name_scores[start:start + batch_size] = dice_similarity(features["bigrams"][batch_left], features["bigram_counts"][batch_left],
+                                                                features["bigrams"][batch_right], features["bigram_counts"][batch_right])
+
+    scored = pairs[[LEFT, RIGHT]].reset_index(drop=True)
+    scored[NAME_SCORE] = name_scores
+    scored[PHONE_SCORE] = equality_score(features["phone"][left], features["phone"][right])
+    scored[EMAIL_DOMAIN_SCORE] = equality_score(features["email_domain"][left], features["email_domain"][right])
+
+    # the name must agree
+    match = scored[NAME_SCORE].to_numpy() >= thresholds["name"]
+    any_other_known = np.zeros(len(scored), dtype=bool)
+    for field, column in SCORE_COLUMNS.items():
+        if field == "name" or field not in thresholds:
+            continue
+        scores = scored[column].to_numpy()
+        known = ~np.isnan(scores)
+        # a field known on both sides must agree
+        match &= ~known | (scores >= thresholds[field])
+        any_other_known |= known
+    scored[MATCH] = match & any_other_known
+
+    elapsed = time.perf_counter() - start_time
+    pairs_per_second = len(scored) / elapsed if elapsed > 0 else float("inf")
+
+    return scored, pairs_per_second
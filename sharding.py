@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pds
+
+'''
+Assignment of the golden records to the shards of the partitioned mode (see partition_count in config.py).
+
+The contacts of all the sources are matched (in shards of blocks, see blocking.py) and clustered into golden records
+before sharding (see golden_records in entityresolution.py), so the shards only have to keep together the records that
+the post merge stages bring together:
+1) extrapolate_data groups the contacts by company_name
+2) combine_post_merge merges the contacts with the same post merge key (name and phone number by default)
+Two records sharing any of these keys are in the same cluster, and so are the records linked through a chain of
+shared keys (e.g. two contacts of a company sharing a post merge key with a contact of another company). All the
+records of a cluster go to the hash shard of the smallest normalized company_domain of the cluster. A cluster
+without any domain goes to the shard of its smallest company_name, and a record without a domain or company name
+that shares no key with any other record is sharded by its own id, so the records with a missing domain are spread
+over the shards instead of all landing in one
+'''
+
+SHARD = "shard"
+
+'''
+Prefix of each kind of cluster key, so that equal values of different columns are different keys
+'''
+DOMAIN_KEY = "domain:"
+COMPANY_KEY = "company:"
+POST_MERGE_KEY = "post_merge:"
+
+'''
+Values that mean "unknown" in the sources and never link two records of a company
+'''
+UNKNOWN_VALUES = ["", "n/a"]
+
+'''
+Return the lower-cased, trimmed values of a column, with the unknown values (missing, '', 'N/A') as missing
+'''
+def normalized_values(values):
+    normalized = values.astype("string").str.strip().str.lower()
+    return normalized.where(~normalized.isin(UNKNOWN_VALUES))
+
+'''
+Return the values of the key columns of each record joined into one key, with missing values written as 'N/A'
+like clean_data does before the post merge (records with unknown values are merged with each other too)
+'''
+def joined_key(records, key_columns):
+    parts = [records[column].astype("string").fillna("N/A") if column in records.columns
+             else pds.Series("N/A", index=records.index, dtype="string") for column in key_columns]
+    key = parts[0]
+    for part in parts[1:]:
+        key = key + "|" + part
+    return key
+
+'''
+Return the (record, key) edges linking each record to its cluster keys, as arrays of record positions and key codes
+'''
+def cluster_edges(records, post_merge_key_columns):
+    keys = [
+        COMPANY_KEY + normalized_values(records["company_name"]),
+        POST_MERGE_KEY + joined_key(records, post_merge_key_columns),
+    ]
+
+    positions = np.arange(len(records))
+    edge_records = []
+    edge_keys = []
+    for key in keys:
+        known = key.notna().to_numpy()
+        edge_records.append(positions[known])
+        edge_keys.append(key[known].to_numpy(dtype=object))
+
+    key_codes, _ = pds.factorize(np.concatenate(edge_keys))
+    return np.concatenate(edge_records), key_codes
+
+'''
+Return the cluster of each of num_records records linked by the (record, key) edges: the smallest record position
+of its connected component. The labels are propagated from the records to their keys and back in vectorized
+passes, with pointer jumping (label of the label) to shorten the chains, until no label changes
+'''
+def connected_components(num_records, edge_records, edge_keys):
+    labels = np.arange(num_records)
+    num_keys = int(edge_keys.max()) + 1 if len(edge_keys) > 0 else 0
+    while True:
+        key_labels = np.full(num_keys, num_records)
+        np.minimum.at(key_labels, edge_keys, labels[edge_records])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, edge_records, key_labels[edge_keys])
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
+
+'''
+Return the shard (0 to shard_count - 1) of each value, from a stable hash of the value
+'''
+def hash_shards(values, shard_count):
+    hashes = pds.util.hash_array(np.asarray(values, dtype=object))
+    return (hashes % np.uint64(shard_count)).astype(np.int64)
+
+'''
+Assign the records (a DataFrame with the company_name, company_domain and post merge key columns of each record)
+to shard_count shards as described at the top of this module. id_column holds a unique id
+of each record, which shards the records that share no key with any other record. Returns the shard of each record,
+as an array aligned with records
+'''
+def assign_shards(records, shard_count, post_merge_key_columns, id_column):
+    records = records.reset_index(drop=True)
+
+    edge_records, edge_keys = cluster_edges(records, post_merge_key_columns)
+    clusters = connected_components(len(records), edge_records, edge_keys)
+
+    # the value each cluster is sharded by: its smallest domain, else its smallest company name,
+    # else the id of the record the cluster is labelled with
+    domains = normalized_values(records["company_domain"])
+    companies = normalized_values(records["company_name"])
+    shard_values = pds.Series(records[id_column].astype(str), dtype=object)
+    cluster_domains = domains.groupby(clusters).min()
+    cluster_companies = companies.groupby(clusters).min()
+    shard_values = shard_values.groupby(clusters).transform("first").to_numpy(dtype=object)
+    with_company = cluster_companies.reindex(clusters).notna().to_numpy()
+    shard_values[with_company] = COMPANY_KEY + cluster_companies.reindex(clusters)[with_company].to_numpy(dtype=object)
+    with_domain = cluster_domains.reindex(clusters).notna().to_numpy()
+    shard_values[with_domain] = DOMAIN_KEY + cluster_domains.reindex(clusters)[with_domain].to_numpy(dtype=object)
+
+    return hash_shards(shard_values, shard_count)
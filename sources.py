@@ -0,0 +1,101 @@
+from canonical import CANONICAL_KEY_COLUMNS, CONTACT_KEY, canonical_columns
+from schema import ACME_SCHEMA, CRM_SCHEMA, RAPID_DATA_SCHEMA, create_table_query
+from query import create_dedupe_view, source_insert_query
+
+'''
+Registry of the contact sources of the pipeline. Each feed is declared once, with its CSV file, schema, key
+columns and enrichment columns, and the pipeline generates everything else from the declaration (see source_assets
+in entityresolution.py): the observable source asset of the file, the assets reading the file and loading it into
+its own table, the DDL and insert statement of the table, and its place in the source contacts and the company
+extrapolation. Each source is observed, read and loaded by its own assets, independently of the others.
+
+Adding a feed only takes a new Source in SOURCES (and its schema in schema.py). The new source then takes part in
+candidate generation, matching and the golden records stored as the combined contacts (see clustering.py); the load
+summaries taken by combine_exact_contacts and the runner stages are generated from SOURCES too
+'''
+
+'''
+Declaration of a contact source:
+1) name: name of the source, used in the names of its assets (check_<name>_update, <name>_dataframe_from_csv and
+   load_<name>_into_db) and of its table (<name>_contacts)
+2) path: CSV file of the source
+3) schema: column types of the file (see schema.py)
+4) key_columns: columns identifying a contact of the source (see contact_keys in canonical.py), used to count the
+   contacts changed by a delta load and to find the golden records to resolve again
+5) enrichment_columns: company columns only this source provides, filled in for the contacts of the other sources
+   of the same company (see extrapolate_data)
+6) dedupe_keys: columns whose values are the same for the duplicates of a contact within the source, merged by
+   the resolve_<name>_duplicates asset into the latest of them (see dedupe_view). No dedupe if empty
+7) label: name of the source in the descriptions of its assets
+8) contacts_relation: relation holding the resolved contacts of the source: <name>_duplicates_removed if the
+   source has dedupe keys, else its table
+9) priority: rank of the source in the survivorship of the golden records (see clustering.py), the known value of
+   the source with the lowest rank wins. The sources without a priority come after the others, in registry order
+'''
+class Source:
+    def __init__(self, name, path, schema, key_columns, enrichment_columns = (), dedupe_keys = (), label = None,
+                 contacts_relation = None, priority = None):
+        self.name = name
+        self.path = path
+        self.schema = schema
+        self.key_columns = list(key_columns)
+        self.enrichment_columns = list(enrichment_columns)
+        self.dedupe_keys = list(dedupe_keys)
+        self.label = label or name
+        self.table_name = name + "_contacts"
+        self.contacts_relation = contacts_relation or (name + "_duplicates_removed" if self.dedupe_keys else self.table_name)
+        self.priority = priority
+
+    '''
+    Create table statement of the table of the source, generated from its schema
+    '''
+    @property
+    def create_table(self):
+        return create_table_query(self.table_name, self.schema)
+
+    '''
+    Insert query prefix of the table of the source, for adding the values of a DataFrame row into an SQL row
+    '''
+    @property
+    def insert_prefix(self):
+        return source_insert_query % self.table_name
+
+    '''
+    Create view statement of the contacts relation of the source, resolving the duplicates of its table on the
+    dedupe keys in one scan (see create_dedupe_view in query.py). The dedupe keys are compared through their
+    canonical keys (e.g. name_key for name, see canonical_columns), so two records whose names or email addresses
+    only differ in case or spacing are duplicates. A record missing one of the keys (a missing or unknown value)
+    is partitioned by its row fingerprint, so it is never merged with other records. The view keeps the canonical
+    keys and the contact key of the table (see canonical.py)
+    '''
+    @property
+    def dedupe_view(self):
+        columns = [column for column in self.schema if column not in ["created_at", "updated_at"]] + CANONICAL_KEY_COLUMNS + [CONTACT_KEY]
+        dedupe_keys = canonical_columns(self.dedupe_keys)
+        missing_key = " OR ".join(key + " IS NULL" for key in dedupe_keys)
+        partition = ", ".join(dedupe_keys) + ", CASE WHEN " + missing_key + " THEN row_fingerprint END"
+        return create_dedupe_view.format(view_name = self.contacts_relation, columns = ", ".join(columns),
+                                         table = self.table_name, partition = partition)
+
+SOURCES = [
+    Source("crm", "crm__contacts.csv", CRM_SCHEMA, ["name", "email_address"], dedupe_keys = ["name", "email_address"],
+           label = "CRM", priority = 2),
+    Source("acme", "acme__contacts.csv", ACME_SCHEMA, ["name", "email_address"],
+           enrichment_columns = ["country", "company_revenue", "company_employees", "company_industry"],
+           dedupe_keys = ["name", "email_address"], label = "Acme", priority = 0),
+    # the RapidData duplicates are found by name and ip_address, which might have downsides as discussed in the
+    # readme and powerpoint
+    Source("rapid_data", "rapid_data__contacts.csv", RAPID_DATA_SCHEMA, ["name", "ip_address"],
+           dedupe_keys = ["name", "ip_address"], label = "RapidData", contacts_relation = "rd_duplicates_removed",
+           priority = 1),
+]
+
+'''
+Sources of the registry by name
+'''
+SOURCES_BY_NAME = {source.name: source for source in SOURCES}
+
+'''
+Names of the sources in the order in which the known value of a field survives in a golden record (see priority)
+'''
+SOURCE_PRIORITY = [source.name for source in sorted(SOURCES, key=lambda source: (source.priority is None, source.priority or 0))]
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+'''
+Change detection of the source CSV files. The data version of a file is a hash of its content, so a file that is
+touched or rewritten with the same bytes keeps its version and does not trigger a run. Hashing a large file is
+only done when its size or modification time changed: the hashes are cached by (size, mtime) in a JSON file
+shared by the processes observing the files (see source_version).
+
+A SourceWatcher collects the files changed since its last check from filesystem events (with the optional watchdog
+package, polling the size and modification time of the files otherwise), and a file still being written is only
+reported once it has not been modified for a while (see is_settled)
+'''
+
+'''
+Number of bytes of a file read and hashed at a time
+'''
+HASH_BLOCK_SIZE = 1024 * 1024
+
+'''
+Return the hex digest of the content of a file, hashed block by block so that the file is never fully in memory
+'''
+def file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+'''
+Return the (size, modification time in nanoseconds) signature of a file, or None if it does not exist
+'''
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+'''
+Return True if a file has not been modified for debounce_seconds, so that a file that is still being written
+(each write moves its modification time) is not hashed and reported half written
+'''
+def is_settled(path, debounce_seconds):
+    try:
+        return time.time() - os.stat(path).st_mtime >= debounce_seconds
+    except FileNotFoundError:
+        return True
+
+cache_lock = threading.Lock()
+
+'''
+Read the cache of the file hashes: {absolute path: [size, mtime_ns, digest]}
+'''
+def read_version_cache(cache_path):
+    try:
+        with open(cache_path) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+'''
+Write the cache of the file hashes, replacing the previous one at once so that a reader never sees a partial file
+'''
+def write_version_cache(cache_path, cache):
+    temporary_path = "%s.%d.tmp" % (cache_path, os.getpid())
+    with open(temporary_path, "w") as file:
+        json.dump(cache, file)
+    os.replace(temporary_path, cache_path)
+
+'''
+Return the data version of a file: the hash of its content, taken from the cache at cache_path if the size and
+modification time of the file did not change since it was hashed. Returns None if the file does not exist
+'''
+def source_version(path, cache_path):
+    signature = file_signature(path)
+    if signature is None:
+        return None
+    key = os.path.abspath(path)
+    with cache_lock:
+        cache = read_version_cache(cache_path)
+        cached = cache.get(key)
+        if cached is not None and tuple(cached[:2]) == signature:
+            return cached[2]
+
+    digest = file_digest(path)
+    # the file may have changed while it was hashed, the hash is then only cached for the signature it was read at
+    if file_signature(path) == signature:
+        with cache_lock:
+            cache = read_version_cache(cache_path)
+            cache[key] = [signature[0], signature[1], digest]
+            write_version_cache(cache_path, cache)
+    return digest
+
+'''
+Watcher of a set of files, reporting the files that changed since the previous call of changed_paths.
+With watchdog installed, the directories of the files are watched by a background observer started on the first
+call and the files are only looked at after an event. Without watchdog, the size and modification time of every
+file are compared with the previous call (one stat per file, the content is never read here).
+The files are all reported by the first call, so that the caller can compare their versions with its own state
+'''
+class SourceWatcher:
+    def __init__(self, paths):
+        self.paths = {os.path.abspath(path): path for path in paths}
+        self.pending = set(self.paths.values())
+        self.signatures = {}
+        self.observer = None
+        self.lock = threading.Lock()
+
+    '''
+    Start watching the directories of the files with watchdog. Returns False if watchdog is not installed
+    '''
+    def start_observer(self):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return False
+
+        watcher = self
+
+        class SourceEventHandler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                # a file written elsewhere and moved in place is reported at its destination
+                for event_path in [event.src_path, getattr(event, "dest_path", None)]:
+                    if event_path and os.path.abspath(event_path) in watcher.paths:
+                        watcher.mark_changed(watcher.paths[os.path.abspath(event_path)])
+
+        self.observer = Observer()
+        for directory in {os.path.dirname(path) for path in self.paths}:
+            self.observer.schedule(SourceEventHandler(), directory, recursive=False)
+        self.observer.daemon = True
+        self.observer.start()
+        return True
+
+    '''
+    Report a file as changed on the next call of changed_paths (e.g. again after it was found still being written)
+    '''
+    def mark_changed(self, path):
+        with self.lock:
+            self.pending.add(path)
+
+    '''
+    Return the files changed since the previous call
+    '''
+    def changed_paths(self):
+        if self.observer is None and not self.start_observer():
+            for path in self.paths.values():
+                signature = file_signature(path)
+                if self.signatures.get(path) != signature:
+                    self.signatures[path] = signature
+                    self.mark_changed(path)
+        with self.lock:
+            changed, self.pending = self.pending, set()
+        return sorted(changed)
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None